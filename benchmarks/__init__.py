@@ -0,0 +1,5 @@
+"""
+Benchmarks for the analytics pipeline.
+
+Run from the repository root, e.g. `python -m benchmarks.bench_spc_multi`.
+"""
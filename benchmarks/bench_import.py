@@ -0,0 +1,70 @@
+"""
+Benchmark: cold-start cost of the pipeline modules and the CLI.
+
+Each target is timed in a fresh interpreter (median of --repeat runs), and the heavy third-party modules it
+pulls in are listed, so a stray top-level import of matplotlib, pyodbc or requests shows up straight away.
+
+Usage:
+    python -m benchmarks.bench_import --repeat 5
+    python -m benchmarks.bench_import --max-cli-ms 150   # exits 1 if `src.cli --help` is slower than this
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "matplotlib", "pyodbc", "requests", "dotenv", "sqlalchemy")
+
+TARGETS = {
+    "python": "pass",
+    "import src.config": "import src.config",
+    "import src.cli": "import src.cli",
+    "src.cli --help": "import sys, src.cli\nsys.argv = ['src.cli', '--help']\ntry:\n    src.cli.main()\nexcept SystemExit:\n    pass",
+    "import src.run_pipeline": "import src.run_pipeline",
+}
+
+_PROBE = (
+    "import json, sys\n"
+    "{code}\n"
+    "print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)), file=sys.stderr)\n"
+)
+
+
+def _run(code: str) -> tuple[float, list[str]]:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(code=code, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = (time.perf_counter() - t0) * 1000
+    loaded = json.loads(proc.stderr.strip().splitlines()[-1])
+    return elapsed, loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-cli-ms", type=float, default=None, help="fail if `src.cli --help` exceeds this (ms)")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'target':<26}{'median ms':>10}  heavy modules loaded")
+    for name, code in TARGETS.items():
+        runs = [_run(code) for _ in range(args.repeat)]
+        ms = statistics.median(r[0] for r in runs)
+        loaded = runs[-1][1]
+        results[name] = ms
+        print(f"{name:<26}{ms:>10.0f}  {', '.join(loaded) or '-'}")
+
+    if args.max_cli_ms is not None and results["src.cli --help"] > args.max_cli_ms:
+        print(f"src.cli --help took {results['src.cli --help']:.0f} ms (budget {args.max_cli_ms:.0f} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
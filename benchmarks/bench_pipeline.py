@@ -0,0 +1,314 @@
+"""
+Benchmark suite: every pipeline stage, the full pipeline and extraction, on scaled synthetic inputs,
+with JSON results and a regression check against a stored baseline.
+
+Usage:
+    python -m benchmarks.bench_pipeline run --events 10000 1000000 --series 1 100 --out benchmarks/results/current.json
+    python -m benchmarks.bench_pipeline run --events 100000000 --series 10000 --stages standardise_compact validate daily_counts
+    python -m benchmarks.bench_pipeline compare benchmarks/results/baseline.json benchmarks/results/current.json --threshold 0.2
+
+Stage timings are the median of --repeat runs on inputs prepared outside the timed call.
+Extraction is timed against a local SQLite database and a stub paginated HTTP API (no network or SQL Server needed).
+`compare` exits with status 1 when any benchmark is slower than the baseline by more than the threshold.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.analyse import breach_cube, summarise_breaches
+from src.config import Config
+from src.daily_store import DailySeriesStore
+from src.spc import (
+    add_zero_days,
+    daily_counts,
+    flag_breaches_against_limits,
+    spc_limits_from_baseline,
+    spc_limits_from_counts,
+    spc_status_codes,
+    split_baseline_and_current,
+)
+from src.spc_multi import DEFAULT_SERIES_COLS, grouped_spc
+from src.spc_rules import run_rule_hits
+from src.synthetic import SyntheticSpec, synthetic_events
+from src.transform import standardise_infection_events
+from src.validate import validate_infection_events
+
+STAGES = (
+    "standardise",
+    "standardise_compact",
+    "validate",
+    "daily_counts",
+    "add_zero_days",
+    "split_baseline_and_current",
+    "spc_limits_from_baseline",
+    "flag_breaches_against_limits",
+    "summarise_breaches",
+    "breach_cube",
+    "grouped_spc",
+    "spc_status_codes",
+    "run_rule_hits",
+)
+EXTRACTS = ("extract_sqlite", "extract_sqlite_stream", "extract_sqlite_pushdown", "extract_http")
+SPAN = ("2022-04-01", "2024-03-31")  # two financial years, so every case has a baseline FY
+
+
+def _time(func, repeat: int) -> list[float]:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - t0)
+    return runs
+
+
+def _spec(events: int, series: int, seed: int = 0) -> SyntheticSpec:
+    n_days = len(pd.date_range(*SPAN))
+    n_locations = min(series, 100)
+    n_departments = -(-series // n_locations)
+    return SyntheticSpec(
+        start=SPAN[0],
+        end=SPAN[1],
+        n_departments=n_departments,
+        n_locations=n_locations,
+        base_rate=events / (n_departments * n_locations * n_days),
+        spike_prob=0.002,
+        seed=seed,
+    )
+
+
+def bench_stages(events: int, series: int, repeat: int, stages) -> list[dict]:
+    raw = synthetic_events(_spec(events, series))
+    std = standardise_infection_events(raw, compact=True)
+    daily = daily_counts(std)
+    zero_filled = add_zero_days(daily)
+    baseline, current, _ = split_baseline_and_current(zero_filled)
+    limits = spc_limits_from_baseline(baseline)
+    flagged = flag_breaches_against_limits(current, limits)
+    # The series x day matrix for the current FY, to compare run rules with single-point flagging on the same input
+    store = DailySeriesStore.from_events(std, DEFAULT_SERIES_COLS)
+    fy = int(current["FinancialYear"].iloc[0])
+    matrix = store.counts[:, store.fy_window(fy)]
+    matrix_limits = spc_limits_from_counts(store.counts[:, store.fy_window(fy - 1)])
+    multi_flagged = grouped_spc(store)
+
+    cases = {
+        "standardise": lambda: standardise_infection_events(raw),
+        "standardise_compact": lambda: standardise_infection_events(raw, compact=True),
+        "validate": lambda: validate_infection_events(std),
+        "daily_counts": lambda: daily_counts(std),
+        "add_zero_days": lambda: add_zero_days(daily),
+        "split_baseline_and_current": lambda: split_baseline_and_current(zero_filled),
+        "spc_limits_from_baseline": lambda: spc_limits_from_baseline(baseline),
+        "flag_breaches_against_limits": lambda: flag_breaches_against_limits(current, limits),
+        "summarise_breaches": lambda: summarise_breaches(flagged),
+        "breach_cube": lambda: breach_cube(multi_flagged),
+        "grouped_spc": lambda: grouped_spc(std),
+        "spc_status_codes": lambda: spc_status_codes(matrix, matrix_limits),
+        "run_rule_hits": lambda: run_rule_hits(matrix, matrix_limits),
+    }
+    return [_result(name, events, series, _time(cases[name], repeat)) for name in stages if name in cases]
+
+
+def _result(name: str, events: int, series: int, runs: list[float]) -> dict:
+    return {
+        "name": name,
+        "events": events,
+        "series": series,
+        "seconds": statistics.median(runs),
+        "min_seconds": min(runs),
+        "repeat": len(runs),
+    }
+
+
+def _stub_api(pages: list[bytes]) -> ThreadingHTTPServer:
+    # Serves pre-encoded JSON pages at /events?page=N, so the timing is the client side only
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = int(parse_qs(urlparse(self.path).query).get("page", ["1"])[0])
+            body = pages[page - 1] if 1 <= page <= len(pages) else b'{"data": []}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_extract(events: int, repeat: int, workdir: str, names, page_size: int = 10_000) -> list[dict]:
+    from src.extract_api import extract_paginated_api
+    from src.extract_sql import extract_daily_counts_sql, extract_infection_events_sql, iter_infection_events_sql
+
+    raw = synthetic_events(_spec(events, 1))[["EventID", "CollectionDate"]]
+    raw["CollectionDate"] = raw["CollectionDate"].dt.strftime("%Y-%m-%d")
+    results = []
+
+    db = os.path.join(workdir, f"events_{events}.db")
+    with contextlib.closing(sqlite3.connect(db)) as conn:
+        raw.to_sql("InfectionEvents", conn, index=False, if_exists="replace")
+    query = "SELECT EventID, CollectionDate FROM InfectionEvents WHERE CollectionDate IS NOT NULL"
+    cfg = Config()
+
+    if "extract_sqlite" in names:
+        with contextlib.closing(sqlite3.connect(db)) as conn:
+            runs = _time(lambda: extract_infection_events_sql(cfg, query, conn=conn), repeat)
+        results.append(_result("extract_sqlite", events, 1, runs))
+    if "extract_sqlite_stream" in names:
+        with contextlib.closing(sqlite3.connect(db)) as conn:
+            runs = _time(lambda: sum(len(b) for b in iter_infection_events_sql(cfg, query, conn=conn)), repeat)
+        results.append(_result("extract_sqlite_stream", events, 1, runs))
+    if "extract_sqlite_pushdown" in names:
+        with contextlib.closing(sqlite3.connect(db)) as conn:
+            runs = _time(lambda: extract_daily_counts_sql(cfg, query, pushdown=True, day_expr="date({col})", conn=conn), repeat)
+        results.append(_result("extract_sqlite_pushdown", events, 1, runs))
+
+    if "extract_http" in names:
+        records = raw.to_dict("records")
+        n_pages = max(1, -(-len(records) // page_size))
+        pages = [
+            json.dumps({"data": records[i * page_size:(i + 1) * page_size], "total_pages": n_pages}).encode()
+            for i in range(n_pages)
+        ]
+        server = _stub_api(pages)
+        try:
+            api_cfg = Config(api_base_url=f"http://127.0.0.1:{server.server_port}")
+            runs = _time(lambda: extract_paginated_api(api_cfg, "events", max_workers=4), repeat)
+        finally:
+            server.shutdown()
+        results.append(_result("extract_http", events, 1, runs))
+    return results
+
+
+def bench_main(events: int, repeat: int, workdir: str) -> dict:
+    # The full pipeline on synthetic data (SQL is not configured), in a scratch directory, with the stage cache bypassed
+    from src import run_pipeline
+
+    logging.getLogger("pipeline").addHandler(logging.NullHandler())  # keeps get_logger from adding console output
+    original = run_pipeline.SYNTHETIC_SPEC
+    cwd = os.getcwd()
+    run_pipeline.SYNTHETIC_SPEC = _spec(events, 1)
+    os.chdir(workdir)
+    try:
+        runs = _time(lambda: run_pipeline.main(force=True), repeat)
+    finally:
+        os.chdir(cwd)
+        run_pipeline.SYNTHETIC_SPEC = original
+    return _result("run_pipeline.main", events, 1, runs)
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(args) -> int:
+    stages = args.stages or STAGES + EXTRACTS + ("run_pipeline.main",)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for events in args.events:
+            for series in args.series:
+                rows = bench_stages(events, series, args.repeat, stages)
+                results.extend(rows)
+                for r in rows:
+                    print(f"{r['name']:<30}{events:>12,}{series:>8,}{r['seconds']:>12.4f}s")
+            extract_names = [n for n in EXTRACTS if n in stages]
+            if extract_names:
+                for r in bench_extract(events, args.repeat, workdir, extract_names):
+                    results.append(r)
+                    print(f"{r['name']:<30}{events:>12,}{1:>8,}{r['seconds']:>12.4f}s")
+            if "run_pipeline.main" in stages:
+                r = bench_main(events, args.repeat, workdir)
+                results.append(r)
+                print(f"{r['name']:<30}{events:>12,}{1:>8,}{r['seconds']:>12.4f}s")
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": _meta(), "results": results}, f, indent=2)
+        print(f"Results written to {args.out}")
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    def key(r):
+        return r["name"], r["events"], r["series"]
+
+    base = {key(r): r for r in baseline["results"]}
+    regressions = 0
+    print(f"{'benchmark':<30}{'events':>12}{'series':>8}{'baseline':>11}{'current':>11}{'change':>9}")
+    for r in current["results"]:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        change = r["seconds"] / b["seconds"] - 1 if b["seconds"] > 0 else 0.0
+        # Very short timings are mostly noise, so a regression must also exceed an absolute difference
+        slower = change > args.threshold and r["seconds"] - b["seconds"] > args.min_seconds
+        regressions += slower
+        flag = "  REGRESSION" if slower else ("  faster" if change < -args.threshold else "")
+        print(f"{r['name']:<30}{r['events']:>12,}{r['series']:>8,}{b['seconds']:>10.4f}s{r['seconds']:>10.4f}s{change:>+9.0%}{flag}")
+
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}.")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run the benchmarks")
+    p.add_argument("--events", type=int, nargs="+", default=[10_000, 1_000_000])
+    p.add_argument("--series", type=int, nargs="+", default=[1, 100])
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--stages", nargs="+", choices=STAGES + EXTRACTS + ("run_pipeline.main",), default=None,
+                   help="only these benchmarks (default: all)")
+    p.add_argument("--out", default=None, help="write results as JSON")
+
+    c = sub.add_parser("compare", help="compare two result files and flag regressions")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.2, help="relative slowdown that counts as a regression")
+    c.add_argument("--min-seconds", type=float, default=0.005, help="ignore differences smaller than this")
+
+    args = parser.parse_args()
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Benchmark: grouped SPC across many Department x Location series versus looping the single-series functions.
+
+Usage:
+    python -m benchmarks.bench_spc_multi --series 10 100 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.spc import (
+    daily_counts,
+    add_zero_days,
+    split_baseline_and_current,
+    spc_limits_from_baseline,
+    flag_breaches_against_limits,
+)
+from src.spc_multi import grouped_spc
+
+
+def make_events(n_series: int, start="2023-04-01", end="2025-03-31", rate=1.5, seed=0) -> pd.DataFrame:
+    # Poisson daily counts per series, expanded to one row per event
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, end, freq="D").to_numpy()
+    counts = rng.poisson(rate, size=(n_series, len(days)))
+    series = np.repeat(np.arange(n_series), counts.sum(axis=1))
+    day_idx = np.repeat(np.tile(np.arange(len(days)), n_series), counts.ravel())
+    return pd.DataFrame({
+        "EventID": np.arange(len(series)),
+        "CollectionDate": days[day_idx],
+        "Department": pd.Categorical.from_codes(series // 100, [f"D{i}" for i in range(n_series // 100 + 1)]),
+        "Location": pd.Categorical.from_codes(series % 100, [f"L{i}" for i in range(100)]),
+    })
+
+
+def _loop_spc(df: pd.DataFrame) -> int:
+    rows = 0
+    for _, g in df.groupby(["Department", "Location"], observed=True):
+        daily = add_zero_days(daily_counts(g), df["CollectionDate"].min(), df["CollectionDate"].max())
+        baseline, current, _ = split_baseline_and_current(daily)
+        rows += len(flag_breaches_against_limits(current, spc_limits_from_baseline(baseline)))
+    return rows
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--loop-max", type=int, default=100, help="largest series count to also time the per-series loop on")
+    args = parser.parse_args(argv)
+
+    print(f"{'series':>8} {'events':>12} {'grouped_s':>10} {'loop_s':>10}")
+    for n in args.series:
+        df = make_events(n)
+
+        t0 = time.perf_counter()
+        grouped_spc(df)
+        grouped_s = time.perf_counter() - t0
+
+        loop_s = float("nan")
+        if n <= args.loop_max:
+            t0 = time.perf_counter()
+            _loop_spc(df)
+            loop_s = time.perf_counter() - t0
+
+        print(f"{n:>8} {len(df):>12,} {grouped_s:>10.3f} {loop_s:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
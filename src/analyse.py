@@ -1,9 +1,30 @@
 """
 Dr Nneoma O
-Analyse - a simple summary table for reporting
+Analyse - summary tables for reporting
+1. A simple SPCStatus count for one series
+2. A breach cube: days (and cases) by SPCStatus x FY x month x Department x Location, with subtotals
+3. Helpers to load a saved cube once and slice it for dashboards
+The cube is counted from the flagged long-format rows in a single pass over integer category codes; every subtotal is then
+summed from those counted cells, never from the raw rows again.
 """
+import functools
+import itertools
+import os
+
+import numpy as np
 import pandas as pd
 
+from .outputs import read_frame
+
+CUBE_DIMS = ("SPCStatus", "FinancialYear", "Month", "Department", "Location")
+CUBE_MEASURES = ("Days", "Cases")
+ALL = "All"  # label for a dimension that has been totalled over
+MISSING = "Unknown"
+
+# Above this many possible cells I count only the cells that occur (a sort) instead of a dense bincount
+_DENSE_CELL_LIMIT = 20_000_000
+
+
 def summarise_breaches(flagged_df: pd.DataFrame) -> pd.DataFrame:
     """
     Produces a simple summary table for reporting.
@@ -15,3 +36,133 @@ def summarise_breaches(flagged_df: pd.DataFrame) -> pd.DataFrame:
         .reset_index(name="Days")
     )
     return summary
+
+
+def _dim_codes(flagged_df: pd.DataFrame, dim: str) -> tuple[np.ndarray, list[str]]:
+    # Integer codes and string labels for one dimension; missing values get their own label
+    if dim == "Month":
+        if "Month" in flagged_df.columns:
+            values = flagged_df["Month"]
+        else:
+            months = flagged_df["CollectionDate"].to_numpy().astype("datetime64[M]")
+            codes, uniques = pd.factorize(months, sort=True)
+            labels = [str(m) if not np.isnat(m) else MISSING for m in uniques]
+            return codes.astype(np.int64), labels
+    else:
+        values = flagged_df[dim]
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy().astype(np.int64)
+        labels = [str(c) for c in values.cat.categories]
+    else:
+        codes, uniques = pd.factorize(values, sort=True)
+        codes = codes.astype(np.int64)
+        labels = [str(u) for u in uniques]
+    if (codes < 0).any():
+        codes[codes < 0] = len(labels)
+        labels.append(MISSING)
+    return codes, labels
+
+
+def _grouping_sets(dims: tuple[str, ...], grouping: str) -> list[tuple[int, ...]]:
+    if grouping == "rollup":
+        return [tuple(range(k)) for k in range(len(dims), -1, -1)]
+    if grouping == "cube":
+        return [s for k in range(len(dims), -1, -1) for s in itertools.combinations(range(len(dims)), k)]
+    raise ValueError("grouping must be 'rollup' or 'cube'.")
+
+
+def breach_cube(flagged_df: pd.DataFrame, dims=CUBE_DIMS, grouping: str = "rollup") -> pd.DataFrame:
+    """
+    Days and total DailyCases per combination of `dims`, with subtotals labelled "All".
+
+    grouping="rollup" gives the hierarchy in `dims` order (e.g. Location within Department within Month ... and a grand total);
+    grouping="cube" gives every combination of dimensions, so any slice can be read straight off the table.
+    Month ("YYYY-MM") is taken from CollectionDate; dimensions the data does not have (e.g. Department for a single series)
+    are left out. Only combinations that occur are listed. Dimension columns are categorical strings.
+    """
+    dims = tuple(d for d in dims if d in flagged_df.columns or (d == "Month" and "CollectionDate" in flagged_df.columns))
+    if not dims:
+        raise ValueError("None of the cube dimensions are in the flagged data.")
+
+    codes, labels = zip(*(_dim_codes(flagged_df, d) for d in dims))
+    sizes = tuple(len(lab) for lab in labels)
+    cases = flagged_df["DailyCases"].to_numpy(dtype=float) if "DailyCases" in flagged_df.columns else None
+
+    # The single grouped pass: one linear cell index per row, counted with bincount
+    linear = np.ravel_multi_index(codes, sizes)
+    n_cells = int(np.prod(sizes, dtype=np.int64))
+    if n_cells <= _DENSE_CELL_LIMIT:
+        days = np.bincount(linear, minlength=n_cells)
+        cell_cases = np.bincount(linear, weights=cases, minlength=n_cells) if cases is not None else np.zeros(n_cells)
+        cells = np.flatnonzero(days)
+        days, cell_cases = days[cells], cell_cases[cells]
+    else:
+        cells, inverse = np.unique(linear, return_inverse=True)
+        days = np.bincount(inverse)
+        cell_cases = np.bincount(inverse, weights=cases) if cases is not None else np.zeros(len(cells))
+
+    base = pd.DataFrame(dict(zip(dims, np.unravel_index(cells, sizes))))
+    base["Days"] = days.astype(np.int64)
+    base["Cases"] = np.rint(cell_cases).astype(np.int64)
+
+    parts = []
+    for kept in _grouping_sets(dims, grouping):
+        kept_dims = [dims[i] for i in kept]
+        if len(kept) == len(dims):
+            part = base
+        elif kept_dims:
+            part = base.groupby(kept_dims, sort=True)[list(CUBE_MEASURES)].sum().reset_index()
+        else:
+            part = base[list(CUBE_MEASURES)].sum().to_frame().T
+        # Totalled dimensions point at the extra "All" category
+        parts.append(pd.DataFrame({
+            **{d: part[d].to_numpy() if d in kept_dims else np.full(len(part), sizes[i]) for i, d in enumerate(dims)},
+            "Days": part["Days"].to_numpy(),
+            "Cases": part["Cases"].to_numpy(),
+        }))
+
+    out = pd.concat(parts, ignore_index=True)
+    for i, d in enumerate(dims):
+        out[d] = pd.Categorical.from_codes(out[d].to_numpy(), categories=[*labels[i], ALL])
+    return out
+
+
+def slice_cube(cube: pd.DataFrame, by=(), **filters) -> pd.DataFrame:
+    """
+    Rows of a breach cube broken down by the dimensions in `by`, with other dimensions fixed by `filters`
+    (e.g. slice_cube(cube, by=("Department",), SPCStatus="3 SD Breach", FinancialYear=2025)) and the rest totalled.
+    A rollup only holds its hierarchy's slices; build the cube with grouping="cube" to slice it any way.
+    """
+    dims = [c for c in cube.columns if c not in CUBE_MEASURES]
+    unknown = (set(by) | set(filters)) - set(dims)
+    if unknown:
+        raise ValueError(f"Not dimensions of this cube: {sorted(unknown)}. Dimensions: {dims}")
+
+    mask = np.ones(len(cube), dtype=bool)
+    for d in dims:
+        col = cube[d].astype(str) if not isinstance(cube[d].dtype, pd.CategoricalDtype) else cube[d]
+        if d in filters:
+            mask &= (col == str(filters[d])).to_numpy()
+        elif d in by:
+            mask &= (col != ALL).to_numpy()
+        else:
+            mask &= (col == ALL).to_numpy()
+    return cube.loc[mask, [*by, *filters, *CUBE_MEASURES]].reset_index(drop=True)
+
+
+def load_breach_cube(path: str) -> pd.DataFrame:
+    """
+    Reads a saved breach cube, keeping it in memory until the file changes, so repeated dashboard slices don't re-read it.
+    The frame is shared between callers: copy it before modifying it.
+    """
+    return _load_cube(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_cube(path: str, mtime_ns: int) -> pd.DataFrame:
+    cube = read_frame(path)
+    for d in cube.columns:
+        if d not in CUBE_MEASURES:
+            cube[d] = cube[d].astype(str).astype("category")
+    return cube
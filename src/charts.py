@@ -0,0 +1,211 @@
+"""
+Dr Nneoma O
+Charts - SPC chart rendering for one series or thousands.
+1. Uses the headless Agg canvas and the object-oriented Figure API (no pyplot state, nothing left open between charts)
+2. Each worker process keeps one Figure and clears it between charts instead of creating a new one per chart
+3. Many series are rendered in batches across a process pool, so the run scales with the number of cores
+4. Optional small-multiples output: a grid of series per page, in a multi-page PDF
+matplotlib is only imported when a chart is actually drawn.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from .spc import SPC_STATUSES
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+CHART_SIZE = (8, 4.5)  # inches
+CHART_DPI = 150
+CHART_MARGINS = {"left": 0.08, "right": 0.8, "bottom": 0.2, "top": 0.92}  # fixed layout, cheaper than tight_layout per chart
+STATUS_MARKERS = {  # status code -> (colour, label)
+    1: ("tab:orange", SPC_STATUSES[1]),
+    2: ("tab:red", SPC_STATUSES[2]),
+}
+
+_worker_figure = None
+
+
+def _new_figure(figsize) -> "Figure":
+    # A Figure attached to the Agg canvas directly; pyplot (and its GUI backend selection) is never loaded
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+@dataclass
+class ChartSpec:
+    """
+    Everything needed to draw one SPC chart, as plain arrays so it is cheap to send to a worker process.
+    Limits are arrays over the days (they may change between financial years); status holds SPC_STATUSES codes.
+    """
+    title: str
+    path: str
+    dates: np.ndarray
+    cases: np.ndarray
+    mean: np.ndarray
+    uwl: np.ndarray
+    ucl: np.ndarray
+    status: np.ndarray
+
+
+def _status_codes(status: pd.Series) -> np.ndarray:
+    # Statuses arrive as a categorical (spc_multi) or as text (spc.flag_breaches_against_limits)
+    return pd.Categorical(status, categories=SPC_STATUSES).codes.astype(np.int8)
+
+
+def _safe_filename(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text).strip("_") or "series"
+
+
+def chart_specs_from_flagged(
+    flagged: pd.DataFrame,
+    charts_dir: str,
+    series_cols=(),
+    name: str = "daily_cases_spc",
+    title: str = "Daily Cases vs Baseline SPC Limits",
+) -> list[ChartSpec]:
+    """
+    One ChartSpec per series from a flagged long-format frame (CollectionDate, DailyCases, Mean, UWL_2SD, UCL_3SD, SPCStatus),
+    as produced by spc.flag_breaches_against_limits or spc_multi.grouped_spc / backfill_spc.
+    """
+    series_cols = list(series_cols)
+    d = flagged.sort_values(series_cols + ["CollectionDate"], kind="stable")
+    dates = pd.to_datetime(d["CollectionDate"]).to_numpy()
+    columns = {c: d[c].to_numpy(dtype=float) for c in ("DailyCases", "Mean", "UWL_2SD", "UCL_3SD")}
+    status = _status_codes(d["SPCStatus"])
+
+    if series_cols:
+        # Series boundaries from the sorted key columns, so the split is one pass rather than a groupby per series
+        codes = d[series_cols].apply(lambda c: pd.factorize(c)[0]).to_numpy()
+        starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]).any(axis=1)])
+        labels = d[series_cols].iloc[starts].astype(str).agg(" / ".join, axis=1).tolist()
+    else:
+        starts, labels = np.array([0]), [""]
+    bounds = np.r_[starts, len(d)]
+
+    specs = []
+    for i, label in enumerate(labels):
+        s = slice(bounds[i], bounds[i + 1])
+        specs.append(ChartSpec(
+            title=f"{title} - {label}" if label else title,
+            path=os.path.join(charts_dir, f"{name}_{_safe_filename(label)}.png" if label else f"{name}.png"),
+            dates=dates[s],
+            cases=columns["DailyCases"][s],
+            mean=columns["Mean"][s],
+            uwl=columns["UWL_2SD"][s],
+            ucl=columns["UCL_3SD"][s],
+            status=status[s],
+        ))
+    return specs
+
+
+def draw_spc_chart(ax, spec: ChartSpec, legend: bool = True) -> None:
+    """
+    Cases line, mean, UWL and UCL, with markers on warning and breach days.
+    """
+    ax.plot(spec.dates, spec.cases, color="tab:blue", linewidth=1, label="Daily cases")
+    ax.plot(spec.dates, spec.mean, color="grey", linewidth=1, label="Mean")
+    ax.plot(spec.dates, spec.uwl, color="tab:orange", linestyle="--", linewidth=1, label="UWL (2 SD)")
+    ax.plot(spec.dates, spec.ucl, color="tab:red", linestyle="--", linewidth=1, label="UCL (3 SD)")
+    for code, (colour, label) in STATUS_MARKERS.items():
+        hit = spec.status == code
+        if hit.any():
+            ax.scatter(spec.dates[hit], spec.cases[hit], color=colour, s=14, zorder=3, label=label)
+    ax.set_title(spec.title, fontsize=9)
+    if legend:
+        ax.legend(fontsize=7, loc="upper left", bbox_to_anchor=(1.01, 1), borderaxespad=0)
+
+
+def render_chart(spec: ChartSpec, fig: "Figure | None" = None, dpi: int = CHART_DPI) -> str:
+    """
+    Renders one chart to spec.path (PNG). Pass a Figure to reuse it; it is cleared first.
+    """
+    if fig is None:
+        fig = _new_figure(CHART_SIZE)
+    fig.clear()
+    ax = fig.add_subplot()
+    draw_spc_chart(ax, spec)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Daily cases")
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.subplots_adjust(**CHART_MARGINS)
+    fig.savefig(spec.path, dpi=dpi)
+    return spec.path
+
+
+def _render_batch(specs: list[ChartSpec], dpi: int) -> list[str]:
+    # Runs in a worker: one Figure per process, cleared and reused for every chart
+    global _worker_figure
+    if _worker_figure is None:
+        _worker_figure = _new_figure(CHART_SIZE)
+    return [render_chart(spec, _worker_figure, dpi) for spec in specs]
+
+
+def render_charts(
+    specs: list[ChartSpec],
+    max_workers: int | None = None,
+    batch_size: int = 25,
+    dpi: int = CHART_DPI,
+) -> list[str]:
+    """
+    Renders many charts; returns their paths in the order given.
+    Specs are sent to a process pool in batches (fewer round trips); max_workers=1 renders in this process.
+    """
+    if not specs:
+        return []
+    workers = max_workers or os.cpu_count() or 1
+    batches = [specs[i:i + batch_size] for i in range(0, len(specs), batch_size)]
+    if workers == 1 or len(batches) == 1:
+        return [path for batch in batches for path in _render_batch(batch, dpi)]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+        results = pool.map(_render_batch, batches, [dpi] * len(batches))
+        return [path for batch_paths in results for path in batch_paths]
+
+
+def render_small_multiples(
+    specs: list[ChartSpec],
+    path: str,
+    ncols: int = 3,
+    nrows: int = 4,
+    dpi: int = 100,
+) -> str:
+    """
+    Writes a grid of nrows x ncols charts per page to a multi-page PDF (or a single PNG page for a .png path).
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    per_page = ncols * nrows
+    fig = _new_figure((4 * ncols, 2.6 * nrows))
+    pages = [specs[i:i + per_page] for i in range(0, len(specs), per_page)] or [[]]
+
+    def draw_page(page_specs):
+        fig.clear()
+        axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+        for ax, spec in zip(axes, page_specs):
+            draw_spc_chart(ax, spec, legend=False)
+            ax.tick_params(axis="x", labelrotation=45, labelsize=6)
+            ax.tick_params(axis="y", labelsize=6)
+        for ax in axes[len(page_specs):]:
+            ax.set_visible(False)
+        fig.tight_layout()
+
+    if path.lower().endswith(".pdf"):
+        with PdfPages(path) as pdf:
+            for page_specs in pages:
+                draw_page(page_specs)
+                pdf.savefig(fig)
+    else:
+        draw_page(pages[0])
+        fig.savefig(path, dpi=dpi)
+    return path
@@ -0,0 +1,122 @@
+"""
+Dr Nneoma O
+Command line entry point - run the whole pipeline or just part of it.
+
+    python -m src.cli all             # extract -> transform -> validate -> SPC -> report -> chart
+    python -m src.cli extract         # refresh the extract only
+    python -m src.cli spc             # SPC flags (and anything upstream that has changed)
+    python -m src.cli report | chart
+    python -m src.cli all --force     # ignore cached stage outputs
+    python -m src.cli serve           # long-running service with a schedule (see service.py)
+    python -m src.cli query           # HTTP API over the latest SPC results (see query.py)
+    python -m src.cli metrics         # every metric in the registry, in parallel (see multi_metric.py)
+
+This module only imports argparse; pandas, matplotlib, pyodbc and requests are loaded by the stages that use them,
+so `--help` and scheduler health checks start almost instantly.
+"""
+import argparse
+
+# Subcommand -> target stages (None runs every stage)
+COMMANDS = {
+    "extract": ("extract",),
+    "spc": ("spc",),
+    "report": ("report",),
+    "chart": ("chart",),
+    "all": None,
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Infection events SPC pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    helps = {
+        "extract": "extract events (SQL, API, files or synthetic) into the stage cache",
+        "spc": "compute baseline limits and flag the current financial year",
+        "report": "write the breach summary report",
+        "chart": "render the SPC chart",
+        "all": "run every stage",
+    }
+    for name, text in helps.items():
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument("--force", action="store_true", help="re-run stages even if their inputs are unchanged")
+
+    serve = sub.add_parser("serve", help="keep running and refresh on a schedule, with warm SQL/HTTP connections")
+    serve.add_argument("--every", action="append", metavar="JOB=MINUTES[@DIR]",
+                       help="schedule entry, e.g. spc=15 or spc=15@data/processed_spc for its own processed dir "
+                            "(repeatable; default SERVICE_SCHEDULE)")
+    serve.add_argument("--workers", type=int, default=None, help="jobs that may run at once (default SERVICE_MAX_WORKERS)")
+    serve.add_argument("--run-now", action="store_true", help="run every job once at startup")
+    serve.add_argument("--query-port", type=int, default=None, help="also serve the SPC query API on this port")
+
+    query = sub.add_parser("query", help="serve the latest SPC results over HTTP for dashboards")
+    query.add_argument("--host", default="127.0.0.1")
+    query.add_argument("--port", type=int, default=8765)
+    query.add_argument("--watch", type=float, default=10.0, metavar="SECONDS",
+                       help="check for new results this often (0 = only on POST /reload)")
+
+    metrics = sub.add_parser("metrics", help="run many SPC metrics from a registry across a process pool")
+    metrics.add_argument("--registry", default=None, help="metric registry JSON (default METRICS_REGISTRY)")
+    metrics.add_argument("--only", nargs="+", metavar="METRIC", help="run only these metrics")
+    metrics.add_argument("--workers", type=int, default=None, help="worker processes (default METRIC_WORKERS)")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "serve":
+        from .config import Config
+        from .service import PipelineService, parse_schedule
+
+        cfg = Config()
+        jobs = parse_schedule(",".join(args.every) if args.every else cfg.service_schedule, cfg)
+        service = PipelineService(jobs, cfg, max_workers=args.workers)
+        server = None
+        if args.query_port:
+            from .query import SPCQueryService, start_query_server
+
+            queries = SPCQueryService(cfg)
+            queries.reload()
+            service.on_job_finished.append(lambda job, status: queries.reload())
+            server = start_query_server(queries, port=args.query_port)
+        try:
+            service.serve_forever(run_now=args.run_now)
+        finally:
+            if server is not None:
+                server.shutdown()
+        return 0
+
+    if args.command == "query":
+        import threading
+        from .query import SPCQueryService, make_query_server
+
+        queries = SPCQueryService()
+        queries.reload()
+        stop = threading.Event()
+        if args.watch > 0:
+            queries.watch(args.watch, stop)
+        server = make_query_server(queries, args.host, args.port)
+        queries.logger.info(f"SPC query API listening on http://{args.host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+        return 0
+
+    if args.command == "metrics":
+        from .multi_metric import main as run_metrics
+
+        report = run_metrics(registry=args.registry, only=args.only, max_workers=args.workers)
+        return 0 if (report["Status"] == "ok").all() else 1
+
+    from .run_pipeline import main as run_pipeline  # the heavy imports start here
+
+    run_pipeline(targets=COMMANDS[args.command], force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
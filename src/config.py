@@ -6,33 +6,129 @@ This code allows me to manage sensitive credentials and access without hard-codi
 
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cache
 import os
-from dotenv import load_dotenv # I use python-dotenv to load environment variables from a .env file
-load_dotenv()
+
+
+@cache
+def _load_env_file() -> None:
+    # I load the .env file once, the first time a setting is read, rather than as a side effect of importing this module
+    from dotenv import load_dotenv # I use python-dotenv to load environment variables from a .env file
+    load_dotenv()
+
+
+def _env(name: str, default: str) -> str:
+    _load_env_file()
+    return os.getenv(name, default)
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return _env(name, "true" if default else "").lower() in ("1", "true", "yes")
+
 
 # I define a Config class to hold all configuration values for the project (database connections, API credentials, and folder paths).
 @dataclass(frozen=True) # I set frozen=True to make the configuration immutable, so values cannot be changed accidentally once the application is running.
 class Config:
+    # Each setting is read from the environment when a Config is created (default_factory), not when this module is imported
     # I read the SQL Server connection details from environment variables and if a variable is missing, I default to an empty string.
-    sql_server: str = os.getenv("SQL_SERVER", "")
-    sql_database: str = os.getenv("SQL_DATABASE", "")
-    sql_username: str = os.getenv("SQL_USERNAME", "")
-    sql_password: str = os.getenv("SQL_PASSWORD", "")
-    sql_driver: str = os.getenv(
+    sql_server: str = field(default_factory=lambda: _env("SQL_SERVER", ""))
+    sql_database: str = field(default_factory=lambda: _env("SQL_DATABASE", ""))
+    sql_username: str = field(default_factory=lambda: _env("SQL_USERNAME", ""))
+    sql_password: str = field(default_factory=lambda: _env("SQL_PASSWORD", ""))
+    sql_driver: str = field(default_factory=lambda: _env(
         "SQL_DRIVER",
         "ODBC Driver 17 for SQL Server"
-    )
+    ))
+
+    # I control how event data is pulled from SQL Server for the daily SPC counts:
+    # "events" pulls every row into a DataFrame, "stream" reads in fetchmany batches and keeps a running per-day count,
+    # and "pushdown" lets SQL Server do the GROUP BY so only daily aggregates cross the network.
+    sql_daily_mode: str = field(default_factory=lambda: _env("SQL_DAILY_MODE", "events"))
+    sql_batch_size: int = field(default_factory=lambda: int(_env("SQL_BATCH_SIZE", "50000")))
+
+    # I can switch event extraction to incremental mode, which keeps a local Parquet cache and only re-fetches
+    # rows newer than the stored watermark, minus a lookback window for late-arriving or corrected records
+    sql_incremental: bool = field(default_factory=lambda: _env_flag("SQL_INCREMENTAL"))
+    incremental_lookback_days: int = field(default_factory=lambda: int(_env("INCREMENTAL_LOOKBACK_DAYS", "7")))
+
+    # I keep the financial year start month configurable (UK NHS default is April)
+    fy_start_month: int = field(default_factory=lambda: int(_env("FY_START_MONTH", "4")))
+
+    # I can add the run rules (shifts, trends, 2 of 3 beyond 2 SD, lower limits) to the flagged SPC output
+    spc_run_rules: bool = field(default_factory=lambda: _env_flag("SPC_RUN_RULES"))
+
+    # I can keep a persisted SPC state (baseline limits, running current-FY aggregates, last processed day) so each run
+    # only flags the days it has not seen yet; late corrections to processed days are spotted and the state is rebuilt
+    spc_incremental: bool = field(default_factory=lambda: _env_flag("SPC_INCREMENTAL"))
+
+    # I save a breach cube with subtotals for reporting: "rollup" (Status > FY > Month > Department > Location) or "cube" (every combination)
+    breach_cube_grouping: str = field(default_factory=lambda: _env("BREACH_CUBE_GROUPING", "rollup"))
+
+    # I can standardise events into compact dtypes (datetime64 dates, categorical text, downcast numbers) to cut memory
+    compact_transform: bool = field(default_factory=lambda: _env_flag("COMPACT_TRANSFORM"))
+
+    # I can process the event table in batches of this many rows (0 = load it all at once), for tables larger than memory
+    pipeline_chunk_size: int = field(default_factory=lambda: int(_env("PIPELINE_CHUNK_SIZE", "0")))
+    # In that mode I check duplicate EventIDs with a fixed-size Bloom filter sized for CHUNKED_EXPECTED_KEYS (about 1.8 MB
+    # per million keys, may slightly over-count), so memory stays flat however long the table; "exact" keeps every ID
+    chunked_duplicate_check: str = field(default_factory=lambda: _env("CHUNKED_DUPLICATE_CHECK", "bloom").lower())
+    chunked_expected_keys: int = field(default_factory=lambda: int(_env("CHUNKED_EXPECTED_KEYS", "100000000")))
+
+    # I list the event sources to extract from, in precedence order (the first wins when sources share an EventID),
+    # e.g. "sql,api,file:data/raw/manual_events.csv". More than one source runs them concurrently and unions the results.
+    extract_sources: tuple = field(default_factory=lambda: tuple(s.strip() for s in _env("EXTRACT_SOURCES", "sql").split(",") if s.strip()))
+
+    # I run the pipeline as cached stages (dag.py): a stage whose inputs, settings and code are unchanged is skipped.
+    # The source data moves on, so by default the extract runs every time (EXTRACT_TTL_MINUTES=0); a TTL above 0 reuses
+    # an extract for up to that many minutes (e.g. while iterating on charts), and the log says so when it does.
+    pipeline_cache: bool = field(default_factory=lambda: _env_flag("PIPELINE_CACHE", True))
+    extract_ttl_minutes: float = field(default_factory=lambda: float(_env("EXTRACT_TTL_MINUTES", "0")))
+
+    # I choose how data files are written: csv, parquet or feather (Arrow IPC). Parquet/Feather keep dtypes and are compressed
+    # (OUTPUT_COMPRESSION empty = format default). I can skip the raw/processed event files, and write files in the background.
+    output_format: str = field(default_factory=lambda: _env("OUTPUT_FORMAT", "csv").lower())
+    output_compression: str = field(default_factory=lambda: _env("OUTPUT_COMPRESSION", ""))
+    write_intermediate: bool = field(default_factory=lambda: _env_flag("WRITE_INTERMEDIATE", True))
+    background_writes: bool = field(default_factory=lambda: _env_flag("BACKGROUND_WRITES", True))
+
+    # I render many SPC charts across this many processes (0 = one per CPU core)
+    chart_workers: int = field(default_factory=lambda: int(_env("CHART_WORKERS", "0")))
+
+    # Service mode (python -m src.cli serve): jobs and their intervals in minutes, how many jobs may run at once,
+    # and how many SQL connections are kept open between runs. Jobs sharing a processed_dir share one stage cache and run
+    # one at a time, so I give a job its own with JOB=MINUTES@DIR (e.g. "all=60,spc=15@data/processed_spc") to let it
+    # run alongside the others.
+    service_schedule: str = field(default_factory=lambda: _env("SERVICE_SCHEDULE", "all=60"))
+    service_max_workers: int = field(default_factory=lambda: int(_env("SERVICE_MAX_WORKERS", "2")))
+    sql_pool_size: int = field(default_factory=lambda: int(_env("SQL_POOL_SIZE", "4")))
+
+    # Multi-metric runs (python -m src.cli metrics): the metric registry file, worker processes (0 = one per CPU core)
+    # and how many extracts may run against each source at once
+    metrics_registry: str = field(default_factory=lambda: _env("METRICS_REGISTRY", "metrics.json"))
+    metric_workers: int = field(default_factory=lambda: int(_env("METRIC_WORKERS", "0")))
+    metric_source_limits: str = field(default_factory=lambda: _env("METRIC_SOURCE_LIMITS", "sql=4,api=4,file=8,synthetic=8"))
+
+    # I can add tracemalloc (Python allocation) deltas to the per-stage metrics; it slows the run, so it is off by default
+    trace_memory: bool = field(default_factory=lambda: _env_flag("TRACE_MEMORY"))
 
     # Similarly,  I store API connection details so they are managed in one place
-    api_base_url: str = os.getenv("API_BASE_URL", "")
-    api_token: str = os.getenv("API_TOKEN", "")
+    api_base_url: str = field(default_factory=lambda: _env("API_BASE_URL", ""))
+    api_token: str = field(default_factory=lambda: _env("API_TOKEN", ""))
+    # I bound how many API pages are requested at once, so we do not overwhelm the API or hit rate limits
+    api_max_workers: int = field(default_factory=lambda: int(_env("API_MAX_WORKERS", "4")))
+    api_events_endpoint: str = field(default_factory=lambda: _env("API_EVENTS_ENDPOINT", "infection-events"))
+    # I keep an on-disk cache of API responses so unchanged endpoints are answered with a 304 instead of a full download
+    api_cache_dir: str = field(default_factory=lambda: _env("API_CACHE_DIR", "data/cache/http"))
+    api_cache_max_age_hours: float = field(default_factory=lambda: float(_env("API_CACHE_MAX_AGE_HOURS", "168")))
+    api_cache_max_mb: int = field(default_factory=lambda: int(_env("API_CACHE_MAX_MB", "256")))
 
-  """
+    """
     Project directory structure
     I define standard paths for raw data, processed data, reports, and charts. Keeping these in the config makes the pipeline easier to maintain and avoids hard-coded paths throughout the project.
-  """
-    raw_dir: str = "data/raw"
-    processed_dir: str = "data/processed"
-    reports_dir: str = "outputs/reports"
-    charts_dir: str = "outputs/charts"
+    Each can be moved through the environment; processed_dir also holds the stage cache and the SPC state.
+    """
+    raw_dir: str = field(default_factory=lambda: _env("RAW_DIR", "data/raw"))
+    processed_dir: str = field(default_factory=lambda: _env("PROCESSED_DIR", "data/processed"))
+    reports_dir: str = field(default_factory=lambda: _env("REPORTS_DIR", "outputs/reports"))
+    charts_dir: str = field(default_factory=lambda: _env("CHARTS_DIR", "outputs/charts"))
@@ -0,0 +1,284 @@
+"""
+Dr Nneoma O
+Stage executor: runs the pipeline as named stages with explicit inputs and outputs, and skips work that has not changed.
+1. Each stage is fingerprinted from its input data hashes, its parameters and its code: the stage function's source plus
+   the source of the modules it declares in `code` (so an edit to e.g. charts.py re-runs only the chart stage)
+2. Outputs are stored in a local artifact cache (under Config.processed_dir) keyed by content hash
+3. A stage whose fingerprint matches the last successful run, and whose files are all still on disk, is skipped;
+   its outputs are only loaded if a later stage needs them
+4. The manifest is saved after every successful stage, so a failed run resumes from the last good stage; a stage whose
+   files are still being written in the background is only recorded once they are on disk
+5. A stage whose cache_key returns ALWAYS_RUN (e.g. an extract that must be fresh every run) is never reused, so its
+   outputs are hashed for the stages downstream but not stored
+"""
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+MANIFEST_FILENAME = "manifest.json"
+FILES_KEY = "files"  # optional entry in a stage's result: the paths of the files it wrote
+ALWAYS_RUN = "__always_run__"  # a cache_key value meaning the stage can never be reused
+
+
+@dataclass
+class Stage:
+    """
+    func(**inputs) must return a dict with one entry per name in `outputs`, plus optionally FILES_KEY: the files it
+    wrote, which are recorded in the manifest; the stage is re-run if any of them has gone.
+    params are passed to the fingerprint only (bind them into func, e.g. with a closure).
+    code: modules (or functions) the stage depends on; their source is part of the fingerprint.
+    cache_key, if set, is called at run time and its value added to the fingerprint -
+    e.g. a time bucket so an extract stage is refreshed at most once per interval, or ALWAYS_RUN.
+    """
+    name: str
+    func: Callable[..., dict]
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+    params: dict = field(default_factory=dict)
+    cache_key: Callable[[], object] | None = None
+    code: tuple = ()
+
+
+def hash_value(value) -> str:
+    """
+    Content hash of an artifact. DataFrames are hashed row-wise with pandas' hashing (plus columns and dtypes),
+    everything else through its pickle.
+    """
+    h = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        h.update(json.dumps([list(map(str, value.columns)), list(map(str, value.dtypes))]).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    else:
+        h.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return h.hexdigest()
+
+
+def _source(obj) -> str:
+    # If the source is unavailable I fall back to the qualified name
+    while isinstance(obj, functools.partial):
+        obj = obj.func
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, "__qualname__", repr(obj))
+
+
+def _code_hash(func: Callable, code: tuple = ()) -> str:
+    # The stage function's source plus the source of the modules it calls is its "code version"
+    h = hashlib.sha256(_source(func).encode("utf-8"))
+    for obj in code:
+        h.update(_source(obj).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed pickle store plus a manifest of the last successful fingerprint and outputs per stage.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.manifest_path = os.path.join(root, MANIFEST_FILENAME)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, f"{digest}.pkl")
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self._object_path(digest))
+
+    def put(self, value) -> str:
+        digest = hash_value(value)
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest: str):
+        with open(self._object_path(digest), "rb") as f:
+            return pickle.load(f)
+
+    def record(self, stage: str, fingerprint: str, outputs: dict[str, str], files=()) -> None:
+        self.manifest[stage] = {
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            "files": [f for f in files if f],
+            "completed_at": time.time(),
+        }
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def prune(self) -> int:
+        """
+        Deletes stored objects that no stage in the manifest refers to; returns how many were removed.
+        """
+        live = {d for entry in self.manifest.values() for d in entry["outputs"].values()}
+        removed = 0
+        for name in os.listdir(self.objects_dir):
+            if name.endswith(".pkl") and name[:-4] not in live:
+                os.remove(os.path.join(self.objects_dir, name))
+                removed += 1
+        return removed
+
+
+class PipelineExecutor:
+    """
+    Runs stages in the order given (each stage's inputs must be produced by an earlier stage).
+    """
+
+    def __init__(self, stages: list[Stage], cache_dir: str, logger=None, metrics=None, wait_for_files=None):
+        produced = set()
+        for stage in stages:
+            missing = [i for i in stage.inputs if i not in produced]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' needs {missing}, which no earlier stage produces.")
+            produced.update(stage.outputs)
+        self.stages = stages
+        self.cache = ArtifactCache(cache_dir)
+        self.logger = logger
+        self.metrics = metrics  # logging_utils.RunMetrics: per-stage timing, rows and memory as JSON lines
+        # Waits for files still being written in the background (e.g. OutputWriter.flush) and raises if a write failed
+        self.wait_for_files = wait_for_files
+
+    def _log(self, msg: str) -> None:
+        if self.logger is not None:
+            self.logger.info(msg)
+
+    def _warn(self, msg: str) -> None:
+        if self.logger is not None:
+            self.logger.warning(msg)
+
+    def fingerprint(self, stage: Stage, input_hashes: dict[str, str]) -> str:
+        payload = {
+            "stage": stage.name,
+            "inputs": {k: input_hashes[k] for k in stage.inputs},
+            "params": stage.params,
+            "code": _code_hash(stage.func, stage.code),
+            "cache_key": stage.cache_key() if stage.cache_key is not None else None,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def upstream(self, targets) -> list[Stage]:
+        """
+        The target stages plus every stage they depend on, in run order.
+        """
+        names = {s.name for s in self.stages}
+        unknown = [t for t in targets if t not in names]
+        if unknown:
+            raise ValueError(f"Unknown stages {unknown}. Stages: {[s.name for s in self.stages]}")
+
+        producer = {out: s for s in self.stages for out in s.outputs}
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            stage = next(s for s in self.stages if s.name == name)
+            todo.extend(producer[i].name for i in stage.inputs)
+        return [s for s in self.stages if s.name in needed]
+
+    def run(self, force: tuple[str, ...] = (), targets: tuple[str, ...] | None = None) -> dict:
+        """
+        Runs (or skips) the stages and returns {stage name: "ran" | "skipped"}.
+        Stages named in `force` always run. With `targets`, only those stages and what they depend on are run.
+        """
+        stages = self.stages if targets is None else self.upstream(targets)
+        hashes: dict[str, str] = {}
+        values: dict[str, object] = {}
+        status = {}
+        unconfirmed = []  # manifest entries for stages whose files may still be queued for writing
+        try:
+            self._run_stages(stages, force, hashes, values, status, unconfirmed)
+        finally:
+            if unconfirmed:
+                # Nothing is recorded if a write failed, so those stages re-run next time instead of trusting the files
+                self.wait_for_files()
+                for entry in unconfirmed:
+                    self.cache.record(*entry)
+
+        self.cache.prune()
+        return status
+
+    def _run_stages(self, stages, force, hashes, values, status, unconfirmed) -> None:
+
+        def load(name: str):
+            if name not in values:
+                values[name] = self.cache.get(hashes[name])
+            return values[name]
+
+        for stage in stages:
+            fp = self.fingerprint(stage, hashes)
+            previous = self.cache.manifest.get(stage.name)
+            reusable = stage.cache_key is None or stage.cache_key() != ALWAYS_RUN
+
+            missing_files = [f for f in (previous or {}).get("files", []) if not os.path.exists(f)]
+            if missing_files and stage.name not in force and previous["fingerprint"] == fp:
+                self._log(f"Stage '{stage.name}' unchanged but {len(missing_files)} of its files are missing - re-running.")
+            if (
+                reusable
+                and stage.name not in force
+                and previous is not None
+                and previous["fingerprint"] == fp
+                and all(self.cache.has(d) for d in previous["outputs"].values())
+                and not missing_files
+            ):
+                hashes.update(previous["outputs"])
+                status[stage.name] = "skipped"
+                if stage.cache_key is not None:
+                    # A time-bucketed stage (the extract) is reused data, not just unchanged code, so say how old it is
+                    age = (time.time() - previous.get("completed_at", time.time())) / 60
+                    self._warn(
+                        f"Stage '{stage.name}' reused from the cache: its outputs are {age:.1f} minutes old "
+                        f"(run with --force for fresh data)."
+                    )
+                else:
+                    self._log(f"Stage '{stage.name}' unchanged - skipped.")
+                if self.metrics is not None:
+                    self.metrics.record(stage.name, status="skipped")
+                continue
+
+            t0 = time.perf_counter()
+            inputs = {name: load(name) for name in stage.inputs}
+            measure = self.metrics.stage(stage.name, rows_in=list(inputs.values())) if self.metrics else contextlib.nullcontext({})
+            with measure as m:
+                result = stage.func(**inputs) or {}
+                files = result.get(FILES_KEY) or ()
+                missing = [o for o in stage.outputs if o not in result]
+                if missing:
+                    raise ValueError(f"Stage '{stage.name}' did not return outputs {missing}.")
+                m["rows_out"] = [result[o] for o in stage.outputs]
+
+                # Hashing and storing outputs is part of the stage's cost, so it is timed too (and reported separately)
+                t_cache = time.perf_counter()
+                out_hashes = {}
+                for name in stage.outputs:
+                    values[name] = result[name]
+                    out_hashes[name] = self.cache.put(result[name]) if reusable else hash_value(result[name])
+                m["cache_s"] = round(time.perf_counter() - t_cache, 4)
+            hashes.update(out_hashes)
+            if files and self.wait_for_files is not None:
+                unconfirmed.append((stage.name, fp, out_hashes, files))
+            else:
+                self.cache.record(stage.name, fp, out_hashes, files)
+            status[stage.name] = "ran"
+            self._log(f"Stage '{stage.name}' completed in {time.perf_counter() - t0:.2f}s.")
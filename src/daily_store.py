@@ -0,0 +1,151 @@
+"""
+Daily store - dense daily counts for one or many series, indexed by day offset from an epoch.
+Zero days are implicit (a zero in the array), so there is no reindex/fillna step, and an FY window is a plain array slice.
+The store can be saved to disk and re-opened as a memory-mapped array.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .fy_calendar import UK_FY_START_MONTH, fy_bounds
+from .transform import ensure_datetime
+
+
+@dataclass
+class DailySeriesStore:
+    """
+    counts[i, d] is the number of events for series i on day epoch + d.
+    keys holds one row per series (the series columns, e.g. Department and Location);
+    a store built without series columns has a single series and a key frame with no columns.
+    """
+    keys: pd.DataFrame
+    epoch: np.datetime64
+    counts: np.ndarray
+
+    @classmethod
+    def from_events(cls, df: pd.DataFrame, series_cols=(), start_date=None, end_date=None) -> "DailySeriesStore":
+        """
+        Counts events per series per day in one pass (np.bincount over series code x day offset).
+        The day axis runs from start_date/end_date, defaulting to the first/last event date.
+        Events outside the range, or without a valid date, are ignored.
+        """
+        series_cols = list(series_cols)
+        missing = [c for c in ["CollectionDate", *series_cols] if c not in df.columns]
+        if missing:
+            raise ValueError(f"Columns required for daily counts are missing: {missing}")
+
+        dates = ensure_datetime(df["CollectionDate"]).to_numpy().astype("datetime64[D]")
+        valid = ~np.isnat(dates)
+        if not valid.any() and (start_date is None or end_date is None):
+            raise ValueError("No valid CollectionDate values; cannot build daily series.")
+
+        start = np.datetime64(pd.Timestamp(start_date), "D") if start_date is not None else dates[valid].min()
+        end = np.datetime64(pd.Timestamp(end_date), "D") if end_date is not None else dates[valid].max()
+        n_days = int((end - start).astype(np.int64)) + 1
+        if n_days < 1:
+            raise ValueError("end_date is before start_date.")
+
+        valid &= (dates >= start) & (dates <= end)
+        day_idx = (dates[valid] - start).astype(np.int64)
+
+        if series_cols:
+            grouped = df.loc[valid, series_cols].groupby(series_cols, sort=True, observed=True, dropna=False)
+            codes = grouped.ngroup().to_numpy()
+            keys = grouped.size().index.to_frame(index=False)[series_cols]
+        else:
+            codes = np.zeros(len(day_idx), dtype=np.int64)
+            keys = pd.DataFrame(index=range(1))
+
+        counts = np.bincount(codes * n_days + day_idx, minlength=len(keys) * n_days)
+        return cls(keys, start, counts.reshape(len(keys), n_days).astype(np.int32))
+
+    @classmethod
+    def from_daily(cls, daily_df: pd.DataFrame) -> "DailySeriesStore":
+        """
+        Builds a single-series store from a daily_counts-style frame (CollectionDate, DailyCases).
+        """
+        dates = ensure_datetime(daily_df["CollectionDate"]).to_numpy().astype("datetime64[D]")
+        valid = ~np.isnat(dates)
+        if not valid.any():
+            raise ValueError("No valid CollectionDate values; cannot build daily series.")
+
+        start = dates[valid].min()
+        day_idx = (dates[valid] - start).astype(np.int64)
+        cases = daily_df["DailyCases"].to_numpy()[valid]
+        counts = np.bincount(day_idx, weights=cases, minlength=int(day_idx.max()) + 1)
+        return cls(pd.DataFrame(index=range(1)), start, counts.astype(np.int32)[None, :])
+
+    @property
+    def n_series(self) -> int:
+        return self.counts.shape[0]
+
+    @property
+    def n_days(self) -> int:
+        return self.counts.shape[1]
+
+    @property
+    def end(self) -> np.datetime64:
+        return self.epoch + (self.n_days - 1)
+
+    @property
+    def days(self) -> np.ndarray:
+        return self.epoch + np.arange(self.n_days)
+
+    def day_offset(self, date) -> int:
+        return int((np.datetime64(pd.Timestamp(date), "D") - self.epoch).astype(np.int64))
+
+    def window(self, start_date=None, end_date=None) -> slice:
+        """
+        Column slice for a date range, clipped to the days held in the store.
+        """
+        lo = 0 if start_date is None else max(0, self.day_offset(start_date))
+        hi = self.n_days if end_date is None else min(self.n_days, self.day_offset(end_date) + 1)
+        return slice(lo, max(lo, hi))
+
+    def fy_window(self, fy: int, start_month: int = UK_FY_START_MONTH) -> slice:
+        """
+        Column slice for financial year `fy` (labelled by the year in which it ends), clipped to the store.
+        """
+        return self.window(*fy_bounds(fy, start_month))
+
+    def to_frame(self, window: slice | None = None) -> pd.DataFrame:
+        """
+        Long-format (series columns, CollectionDate, DailyCases) frame for a day window
+        (from window() / fy_window(); default all days), zero days included.
+        """
+        w = slice(0, self.n_days) if window is None else window
+        block = self.counts[:, w]
+        series_idx = np.repeat(np.arange(self.n_series), block.shape[1])
+
+        out = self.keys.iloc[series_idx].reset_index(drop=True)
+        out["CollectionDate"] = np.tile(self.days[w], self.n_series).astype("datetime64[ns]")
+        out["DailyCases"] = block.ravel().astype(int)
+        return out
+
+    def save(self, path: str) -> None:
+        """
+        Writes the store to a directory: counts.npy (raw int32 array), keys.parquet and meta.json.
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "counts.npy"), np.ascontiguousarray(self.counts, dtype=np.int32))
+        self.keys.to_parquet(os.path.join(path, "keys.parquet"), index=False)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"epoch": str(self.epoch), "n_series": self.n_series, "n_days": self.n_days}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "DailySeriesStore":
+        """
+        Opens a saved store. With mmap=True the counts are memory-mapped read-only, so only the
+        slices that are actually used get paged in.
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        counts = np.load(os.path.join(path, "counts.npy"), mmap_mode="r" if mmap else None)
+        keys = pd.read_parquet(os.path.join(path, "keys.parquet"))
+        if keys.empty and not len(keys.columns):
+            keys = pd.DataFrame(index=range(meta["n_series"]))
+        return cls(keys, np.datetime64(meta["epoch"], "D"), counts)
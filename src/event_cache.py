@@ -0,0 +1,258 @@
+"""
+Dr Nneoma O
+Event cache: incremental extraction so a daily run only pulls what has changed.
+1. Keeps a local copy of the event table under Config.raw_dir, partitioned by CollectionDate month (Parquet)
+2. Stores a high-water mark (the latest CollectionDate seen)
+3. Each run re-fetches rows from (watermark - lookback window) onwards, to pick up late arrivals and corrections
+4. Merges the fresh rows into the affected partitions, de-duplicating on EventID across every partition
+   (an event whose date is corrected into another month moves partition rather than appearing in both)
+5. A small index records each partition's EventID range, so only partitions whose range covers an incoming EventID
+   are opened; with increasing IDs a run reads only the months it refreshes, however long the history
+"""
+import glob
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .config import Config
+from .extract_sql import extract_infection_events_sql
+
+CACHE_DIRNAME = "infection_events_cache"
+WATERMARK_FILENAME = "_watermark.json"
+INDEX_FILENAME = "_event_index.json"
+
+
+def event_cache_dir(cfg: Config) -> str:
+    return os.path.join(cfg.raw_dir, CACHE_DIRNAME)
+
+
+def _partition_path(cfg: Config, month: str) -> str:
+    return os.path.join(event_cache_dir(cfg), f"CollectionMonth={month}", "events.parquet")
+
+
+def _partition_month(path: str) -> str:
+    return os.path.basename(os.path.dirname(path)).split("=", 1)[1]
+
+
+def read_watermark(cfg: Config) -> pd.Timestamp | None:
+    """
+    Returns the latest CollectionDate held in the cache, or None if the cache has not been built yet.
+    """
+    path = os.path.join(event_cache_dir(cfg), WATERMARK_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    return pd.Timestamp(state["watermark"]) if state.get("watermark") else None
+
+
+def write_watermark(cfg: Config, watermark: pd.Timestamp) -> None:
+    path = os.path.join(event_cache_dir(cfg), WATERMARK_FILENAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state = {
+        "watermark": str(pd.Timestamp(watermark).date()),
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    # I write to a temporary file and swap it in, so a crash never leaves a half-written watermark
+    _write_json(path, state)
+
+
+def _write_json(path: str, state: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _id_range(ids: pd.Series) -> list | None:
+    # [min, max] EventID of a partition as plain JSON values; None when it holds no EventIDs
+    ids = ids.dropna()
+    if ids.empty:
+        return None
+    return [v.item() if isinstance(v, np.generic) else v for v in (ids.min(), ids.max())]
+
+
+def _read_index(cfg: Config, paths: list[str]) -> dict[str, list | None]:
+    """
+    EventID range per cached month. Partitions missing from the index (e.g. a cache built before it existed)
+    have their EventID column read once and are added.
+    """
+    path = os.path.join(event_cache_dir(cfg), INDEX_FILENAME)
+    index = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)["id_ranges"]
+    for p in paths:
+        month = _partition_month(p)
+        if month not in index:
+            index[month] = _id_range(pd.read_parquet(p, columns=["EventID"])["EventID"])
+    return {_partition_month(p): index[_partition_month(p)] for p in paths}
+
+
+def _write_index(cfg: Config, index: dict[str, list | None]) -> None:
+    _write_json(os.path.join(event_cache_dir(cfg), INDEX_FILENAME), {"id_ranges": dict(sorted(index.items()))})
+
+
+def _may_hold(id_range: list | None, sorted_ids: np.ndarray) -> bool:
+    # True if any of the sorted incoming IDs falls inside the partition's EventID range
+    if id_range is None:
+        return False
+    lo, hi = id_range
+    try:
+        i = np.searchsorted(sorted_ids, lo, side="left")
+        return bool(i < len(sorted_ids) and sorted_ids[i] <= hi)
+    except TypeError:
+        return True  # IDs of another type than the index (e.g. the source changed): check the partition itself
+
+
+def _write_partition(path: str, df: pd.DataFrame) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def merge_into_event_cache(
+    cfg: Config,
+    df_new: pd.DataFrame,
+    refreshed_from: pd.Timestamp | None = None,
+) -> list[str]:
+    """
+    Merges freshly extracted events into the monthly partitions and returns the months rewritten.
+
+    If `refreshed_from` is given, the source is treated as authoritative from that date onwards:
+    cached rows on or after it are replaced by `df_new`, so corrections and deletions inside the
+    lookback window are picked up. Rows are then de-duplicated on EventID (latest extract wins) across all
+    partitions: a cached copy of an incoming EventID is dropped from whichever month it was in. Older partitions
+    are only opened when their indexed EventID range covers an incoming EventID.
+    """
+    if "CollectionDate" not in df_new.columns:
+        raise ValueError("CollectionDate is required to partition the event cache.")
+
+    df_new = df_new.copy()
+    df_new["CollectionDate"] = pd.to_datetime(df_new["CollectionDate"], errors="coerce")
+    df_new = df_new[df_new["CollectionDate"].notna()]
+    new_ids = None
+    if "EventID" in df_new.columns:
+        df_new = df_new.drop_duplicates(subset="EventID", keep="last")
+        new_ids = pd.Index(df_new["EventID"].dropna().unique())
+    new_months = df_new["CollectionDate"].dt.strftime("%Y-%m")
+
+    months = set(new_months.unique())
+    if refreshed_from is not None:
+        refreshed_from = pd.Timestamp(refreshed_from).normalize()
+    paths = glob.glob(os.path.join(event_cache_dir(cfg), "CollectionMonth=*", "events.parquet"))
+    index = _read_index(cfg, paths) if "EventID" in df_new.columns else {}
+    sorted_ids = np.sort(new_ids.to_numpy()) if new_ids is not None else None
+    for path in paths:
+        month = _partition_month(path)
+        if month in months:
+            continue
+        if refreshed_from is not None and month >= f"{refreshed_from:%Y-%m}":
+            months.add(month)
+        elif sorted_ids is not None and len(sorted_ids) and _may_hold(index.get(month), sorted_ids):
+            # Only the EventID column is read, to find older partitions still holding an incoming event
+            cached_ids = pd.read_parquet(path, columns=["EventID"])["EventID"]
+            if cached_ids.isin(new_ids).any():
+                months.add(month)
+
+    for month in sorted(months):
+        path = _partition_path(cfg, month)
+        fresh = df_new[new_months == month]
+
+        if os.path.exists(path):
+            cached = pd.read_parquet(path)
+            if refreshed_from is not None:
+                cached = cached[cached["CollectionDate"] < refreshed_from]
+            if new_ids is not None and "EventID" in cached.columns:
+                cached = cached[~cached["EventID"].isin(new_ids)]
+            merged = pd.concat([cached, fresh], ignore_index=True)
+        else:
+            merged = fresh
+
+        if "EventID" in merged.columns:
+            merged = merged.drop_duplicates(subset="EventID", keep="last")
+
+        if merged.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            index.pop(month, None)
+            continue
+
+        _write_partition(path, merged.sort_values("CollectionDate", kind="stable"))
+        if "EventID" in merged.columns:
+            index[month] = _id_range(merged["EventID"])
+
+    if index:
+        _write_index(cfg, index)
+    return sorted(months)
+
+
+def load_event_cache(cfg: Config, start_date=None, end_date=None) -> pd.DataFrame:
+    """
+    Reads the cached events back as one DataFrame, optionally limited to a date range.
+    Only the monthly partitions overlapping the range are opened.
+    """
+    paths = sorted(glob.glob(os.path.join(event_cache_dir(cfg), "CollectionMonth=*", "events.parquet")))
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        paths = [p for p in paths if _partition_month(p) >= f"{start_date:%Y-%m}"]
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+        paths = [p for p in paths if _partition_month(p) <= f"{end_date:%Y-%m}"]
+
+    if not paths:
+        return pd.DataFrame(columns=["EventID", "CollectionDate"])
+
+    df = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+    if start_date is not None:
+        df = df[df["CollectionDate"] >= start_date]
+    if end_date is not None:
+        df = df[df["CollectionDate"] <= end_date]
+    return df.reset_index(drop=True)
+
+
+def extract_incremental_events(
+    cfg: Config,
+    query: str,
+    lookback_days: int | None = None,
+    extract=extract_infection_events_sql,
+    load_all: bool = True,
+    **extract_kwargs,
+) -> tuple[pd.DataFrame | None, pd.DataFrame]:
+    """
+    Incrementally refreshes the local event cache from `query` and returns (all cached events, newly fetched rows).
+
+    On the first run the full query is extracted. Afterwards only rows with
+    CollectionDate >= watermark - lookback_days are fetched, by wrapping the query
+    with a parameterised date filter. `extract` defaults to the SQL Server extractor.
+    The watermark moves on from the fetched rows alone; load_all=False skips reading the whole cache back
+    (None is returned in its place) when only the refresh is wanted.
+    """
+    if lookback_days is None:
+        lookback_days = cfg.incremental_lookback_days
+    if lookback_days < 0:
+        raise ValueError("lookback_days cannot be negative.")
+
+    watermark = read_watermark(cfg)
+
+    if watermark is None:
+        cutoff = None
+        df_new = extract(cfg, query, **extract_kwargs)
+    else:
+        cutoff = watermark - timedelta(days=lookback_days)
+        inner = query.strip().rstrip(";")
+        incremental_query = f"SELECT * FROM ({inner}) AS src WHERE src.CollectionDate >= ?"
+        df_new = extract(cfg, incremental_query, params=[cutoff.date().isoformat()], **extract_kwargs)
+
+    merge_into_event_cache(cfg, df_new, refreshed_from=cutoff)
+
+    latest = pd.to_datetime(df_new["CollectionDate"], errors="coerce").max() if "CollectionDate" in df_new else pd.NaT
+    if pd.notna(latest):
+        write_watermark(cfg, latest if watermark is None else max(latest, watermark))
+
+    return (load_event_cache(cfg) if load_all else None), df_new
@@ -4,51 +4,50 @@ Extract API: An easy, reusable method to extract from REST APIs and convert the
 1. Build the API URL safely
 2. Handles authentication (if needed)
 3. Validates response format and fails if there is a problem
+4. Handles paginated APIs (page number or cursor), fetching pages concurrently with retries and backoff
 5. Returns data in standard format for the pipeline
 
 """
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
+
 import pandas as pd
-import requests # I import requests so I can make HTTP calls to external APIs
 from .config import Config # Again importing from Config
+from .http_cache import ResponseCache, fetch_json_cached
 
+if TYPE_CHECKING:
+    import requests
 
-# I define a generic function to extract data from an API endpoint.
-# The endpoint is passed in so this function can be reused for different API resources.
+# requests is imported inside the functions that make HTTP calls, so runs that never call an API do not pay for loading it
 
-def extract_from_api(cfg: Config, endpoint: str) -> pd.DataFrame:
-    """
-    Generic API extractor.
+# Status codes that are worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-    Expects a JSON response in one of the following formats:
-    - A list of dictionaries
-    - A dictionary containing a 'data' key with a list of dictionaries
-    """
 
+def _build_url(cfg: Config, endpoint: str) -> str:
     # I check that the API base URL has been provided in the configuration
     # If it is missing, I fail early with a clear error message
     if not cfg.api_base_url:
         raise ValueError("API_BASE_URL not set in .env")
 
     # I construct the full API URL safely by removing any trailing or leading slashes to avoid malformed URLs.
-    url = cfg.api_base_url.rstrip("/") + "/" + endpoint.lstrip("/")
+    return cfg.api_base_url.rstrip("/") + "/" + endpoint.lstrip("/")
+
 
+def _auth_headers(cfg: Config) -> dict:
     # I prepare the request headers (these are empty by default and only populated if an API token exists)
     headers = {}
 
     # If an API token is provided, I add it as a Bearer token in the authorisation header
     if cfg.api_token:
         headers["Authorization"] = f"Bearer {cfg.api_token}"
+    return headers
 
-    # I send a GET request to the API with a 30-second timeout to prevent the pipeline from hanging indefinitely
-    resp = requests.get(url, headers=headers, timeout=30)
-
-    # I raise an exception automatically if the response status code indicates an error (e.g. 4xx or 5xx)
-    resp.raise_for_status()
-
-    # I parse the JSON response body into a Python object
-    payload = resp.json()
 
+def _records_from_payload(payload) -> list:
     # Some APIs wrap the actual data inside a 'data' key - if this is the case, I extract the list stored there.
     if isinstance(payload, dict) and "data" in payload:
         payload = payload["data"]
@@ -60,6 +59,242 @@ def extract_from_api(cfg: Config, endpoint: str) -> pd.DataFrame:
             "API response format not recognised. "
             "Expected list or dict with 'data' list."
         )
+    return payload
+
+
+# I define a generic function to extract data from an API endpoint.
+# The endpoint is passed in so this function can be reused for different API resources.
+
+def extract_from_api(
+    cfg: Config,
+    endpoint: str,
+    params: dict | None = None,
+    cache: ResponseCache | None = None,
+    bypass_cache: bool = False,
+) -> pd.DataFrame:
+    """
+    Generic API extractor.
+
+    Expects a JSON response in one of the following formats:
+    - A list of dictionaries
+    - A dictionary containing a 'data' key with a list of dictionaries
+
+    If a ResponseCache is given, the request is made conditional on the cached
+    ETag / Last-Modified and a 304 is served from the cache (see http_cache.py).
+    """
+    url = _build_url(cfg, endpoint)
+    headers = _auth_headers(cfg)
+
+    # I send a GET request to the API with a 30-second timeout to prevent the pipeline from hanging indefinitely
+    # and raise an exception automatically if the response status code indicates an error (e.g. 4xx or 5xx)
+    import requests # I import requests so I can make HTTP calls to external APIs
+
+    def get(url, params, extra_headers):
+        resp = requests.get(url, params=params, headers={**headers, **extra_headers}, timeout=30)
+        resp.raise_for_status()
+        return resp
+
+    # I parse the JSON response body into a Python object, check its shape, and convert the list of dictionaries
+    # into a pandas DataFrame and return it for transformation, validation, and analysis
+    payload = fetch_json_cached(get, url, params, cache=cache, bypass_cache=bypass_cache)
+    return pd.DataFrame(_records_from_payload(payload))
+
+
+def make_session(cfg: Config, pool_size: int = 10) -> "requests.Session":
+    """
+    Returns a requests.Session with the auth header set and a connection pool
+    large enough for `pool_size` concurrent requests to the same host.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.headers.update(_auth_headers(cfg))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _retry_after_seconds(value: str | None) -> float | None:
+    # Retry-After can be a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_with_retries(
+    session: "requests.Session",
+    url: str,
+    params: dict | None = None,
+    headers: dict | None = None,
+    max_retries: int = 5,
+    backoff_factor: float = 0.5,
+    max_backoff: float = 60.0,
+    timeout: float = 30,
+) -> "requests.Response":
+    """
+    GET with retries on 429/5xx and connection errors.
+    Waits for Retry-After when the server sends it, otherwise backs off exponentially
+    (backoff_factor * 2**attempt, capped at max_backoff).
+    """
+    import requests
+
+    attempt = 0
+    while True:
+        try:
+            resp = session.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= max_retries:
+                raise
+            time.sleep(min(max_backoff, backoff_factor * 2 ** attempt))
+            attempt += 1
+            continue
+
+        if resp.status_code in RETRY_STATUSES and attempt < max_retries:
+            wait = _retry_after_seconds(resp.headers.get("Retry-After"))
+            if wait is None:
+                wait = backoff_factor * 2 ** attempt
+            resp.close()
+            time.sleep(min(max_backoff, wait))
+            attempt += 1
+            continue
+
+        resp.raise_for_status()
+        return resp
+
+
+def _lookup(payload, keys: tuple[str, ...]):
+    # I look for a pagination field either at the top level or inside a 'meta' / 'pagination' block
+    if not isinstance(payload, dict):
+        return None
+    for block in (payload, payload.get("meta"), payload.get("pagination")):
+        if isinstance(block, dict):
+            for key in keys:
+                if block.get(key) is not None:
+                    return block[key]
+    return None
+
+
+def _is_url(value) -> bool:
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
+
+
+def extract_paginated_api(
+    cfg: Config,
+    endpoint: str,
+    pagination: str = "page",
+    params: dict | None = None,
+    page_param: str = "page",
+    start_page: int = 1,
+    page_size: int | None = None,
+    size_param: str = "page_size",
+    cursor_param: str = "cursor",
+    cursor_key: str = "next_cursor",
+    next_url_key: str = "next",
+    max_workers: int | None = None,
+    max_retries: int = 5,
+    backoff_factor: float = 0.5,
+    session: "requests.Session | None" = None,
+    cache: ResponseCache | None = None,
+    bypass_cache: bool = False,
+) -> pd.DataFrame:
+    """
+    Extracts every page of a paginated endpoint into one DataFrame, in page order.
+
+    pagination="page": page numbers are requested concurrently on a bounded thread pool.
+      The page count is read from the first response (total_pages / page_count, or total / total_count
+      with page_size, at the top level or under 'meta'/'pagination'). If the API does not report it,
+      pages are fetched in waves of `max_workers` until an empty page is returned.
+    pagination="cursor": each response carries the next cursor under `cursor_key`, sent back as `cursor_param`;
+      a full next-page URL (under `next_url_key`, or `cursor_key`) is requested as it is. Pages are fetched one
+      after another, reusing the pooled session, until there is no next cursor or a page comes back empty.
+
+    Every request retries 429/5xx with exponential backoff and honours Retry-After.
+    With a ResponseCache, each page is requested conditionally and served from the cache on a 304.
+    """
+    if pagination not in ("page", "cursor"):
+        raise ValueError("pagination must be 'page' or 'cursor'.")
+
+    url = _build_url(cfg, endpoint)
+    max_workers = max_workers or cfg.api_max_workers
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1.")
+
+    own_session = session is None
+    if own_session:
+        session = make_session(cfg, pool_size=max_workers)
+
+    base_params = dict(params or {})
+    if page_size is not None:
+        base_params[size_param] = page_size
+
+    def get(url, params, headers):
+        return _get_with_retries(
+            session, url, params=params, headers=headers,
+            max_retries=max_retries, backoff_factor=backoff_factor,
+        )
+
+    def fetch(extra: dict):
+        return fetch_json_cached(get, url, {**base_params, **extra}, cache=cache, bypass_cache=bypass_cache)
+
+    try:
+        if pagination == "cursor":
+            pages = []
+            cursor, seen = None, set()
+            while True:
+                if _is_url(cursor):
+                    # A next-page URL already carries the query (page size, cursor), so it is requested as it is
+                    payload = fetch_json_cached(get, cursor, None, cache=cache, bypass_cache=bypass_cache)
+                else:
+                    payload = fetch({cursor_param: cursor} if cursor else {})
+                pages.append(_records_from_payload(payload))
+                cursor = _lookup(payload, (cursor_key,))
+                if cursor is None and _is_url(_lookup(payload, (next_url_key,))):
+                    cursor = _lookup(payload, (next_url_key,))
+                if not cursor or not pages[-1]:
+                    break
+                if cursor in seen:
+                    raise ValueError(f"API returned the cursor {cursor!r} twice; stopping instead of looping.")
+                seen.add(cursor)
+        else:
+            first = fetch({page_param: start_page})
+            pages = [_records_from_payload(first)]
+
+            total_pages = _lookup(first, ("total_pages", "page_count"))
+            if total_pages is None and page_size:
+                total = _lookup(first, ("total", "total_count"))
+                if total is not None:
+                    total_pages = -(-int(total) // page_size)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                if total_pages is not None:
+                    numbers = range(start_page + 1, start_page + int(total_pages))
+                    # pool.map returns results in submission order, so pages are assembled in page order
+                    pages += [_records_from_payload(p) for p in pool.map(lambda n: fetch({page_param: n}), numbers)]
+                elif pages[0]:
+                    next_page = start_page + 1
+                    while True:
+                        numbers = range(next_page, next_page + max_workers)
+                        wave = [_records_from_payload(p) for p in pool.map(lambda n: fetch({page_param: n}), numbers)]
+                        # Everything after the first empty page is past the end of the data
+                        done = any(not records for records in wave)
+                        for records in wave:
+                            if not records:
+                                break
+                            pages.append(records)
+                        if done:
+                            break
+                        next_page += max_workers
+    finally:
+        if own_session:
+            session.close()
 
-    # I convert the list of dictionaries into a pandas DataFrame and return it for transformation, validation, and analysis
-    return pd.DataFrame(payload)
+    return pd.DataFrame([row for page in pages for row in page])
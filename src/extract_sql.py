@@ -3,11 +3,16 @@ Dr N.O
 Extract SQL: A module that extracts data from an SQL server and returns it as a dataframe using pandas for further processing
 This calls on the Config file created earlier and is good as it keeps SQL logic separate from analysis. IF it fails, likely config needs checking. 
 
+For large event tables there is also a streaming mode (fetchmany batches feeding a running per-day count)
+and a pushdown mode (GROUP BY in SQL Server) so only daily aggregates cross the network.
 """
+from collections.abc import Iterator
+
 import pandas as pd
-import pyodbc # I import pyodbc so I can connect to SQL Server using ODBC
 from .config import Config
 
+# pyodbc is imported inside the functions that open a connection, so runs that never touch SQL do not pay for loading it
+
 
 # I define a helper function to build a SQL Server connection string using values stored in the Config object
 def _build_conn_str(cfg: Config) -> str:
@@ -22,18 +27,9 @@ def _build_conn_str(cfg: Config) -> str:
     )
 
 
-# I define a function to extract infection event data from SQL Server
-# The SQL query itself is passed in as an argument, keeping this function reusable and decoupled from specific business logic
-def extract_infection_events_sql(cfg: Config, query: str) -> pd.DataFrame:
-    """
-    Extract data from SQL Server using pyodbc.
-
-    If SQL connection details are not provided, the caller should
-    fall back to synthetic or test data instead.
-    """
-
-    # I check that all required SQL configuration values are present
-    # If any are missing, I raise a clear error early rather than failing later with a cryptic database connection error
+# I check that all required SQL configuration values are present
+# If any are missing, I raise a clear error early rather than failing later with a cryptic database connection error
+def _require_sql_config(cfg: Config) -> None:
     if not all([
         cfg.sql_server,
         cfg.sql_database,
@@ -45,11 +41,140 @@ def extract_infection_events_sql(cfg: Config, query: str) -> pd.DataFrame:
             "Provide SQL_* values in .env or use synthetic data."
         )
 
+
+# I define a function to extract infection event data from SQL Server
+# The SQL query itself is passed in as an argument, keeping this function reusable and decoupled from specific business logic
+def extract_infection_events_sql(cfg: Config, query: str, params=None, conn=None) -> pd.DataFrame:
+    """
+    Extract data from SQL Server using pyodbc.
+
+    `params` are passed through as query parameters (`?` placeholders).
+    An open connection can be supplied instead of connecting from the config.
+
+    If SQL connection details are not provided, the caller should
+    fall back to synthetic or test data instead.
+    """
+    if conn is not None:
+        return pd.read_sql(query, conn, params=params)
+
+    _require_sql_config(cfg)
+
+    import pyodbc # I import pyodbc so I can connect to SQL Server using ODBC
+
     conn_str = _build_conn_str(cfg)    # Build the SQL Server connection string from the config
 
     # I open a database connection using a context manager
     # This ensures the connection is always closed cleanly, even if an error occurs
   
     with pyodbc.connect(conn_str) as conn: 
-        df = pd.read_sql(query, conn) # Execute SQL and put into a pandas DataFrame
+        df = pd.read_sql(query, conn, params=params) # Execute SQL and put into a pandas DataFrame
     return df
+
+
+def iter_infection_events_sql(
+    cfg: Config,
+    query: str,
+    batch_size: int = 50_000,
+    params=None,
+    conn=None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream the result of `query` as DataFrames of at most `batch_size` rows,
+    using cursor.fetchmany so only one batch is held in memory at a time.
+
+    An open DB-API connection can be passed in (e.g. from a pool); otherwise
+    a new pyodbc connection is opened from the config and closed afterwards.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+
+    own_conn = conn is None
+    if own_conn:
+        _require_sql_config(cfg)
+        import pyodbc
+        conn = pyodbc.connect(_build_conn_str(cfg))
+
+    try:
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            columns = [col[0] for col in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                # pyodbc returns Row objects, so I convert each to a tuple before building the batch frame
+                yield pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns)
+        finally:
+            cursor.close()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _daily_counts_pushdown_query(query: str, date_col: str, day_expr: str) -> str:
+    # I wrap the caller's query as a derived table so any WHERE clause is kept,
+    # and let the database collapse it to one row per day
+    inner = query.strip().rstrip(";")
+    day = day_expr.format(col=f"src.{date_col}")
+    return (
+        f"SELECT {day} AS {date_col}, COUNT(*) AS DailyCases "
+        f"FROM ({inner}) AS src "
+        f"WHERE src.{date_col} IS NOT NULL "
+        f"GROUP BY {day}"
+    )
+
+
+def extract_daily_counts_sql(
+    cfg: Config,
+    query: str,
+    date_col: str = "CollectionDate",
+    batch_size: int = 50_000,
+    pushdown: bool = False,
+    day_expr: str = "CAST({col} AS date)",
+    conn=None,
+) -> pd.DataFrame:
+    """
+    Returns daily event counts for `query` in the same shape as spc.daily_counts
+    (CollectionDate, DailyCases), without materialising the event table.
+
+    - pushdown=False: events are streamed in fetchmany batches and folded into a
+      running per-day count, so peak memory depends on the number of days, not rows.
+    - pushdown=True: the GROUP BY runs in SQL; `day_expr` is the SQL expression that
+      truncates the date column to a day (the default suits SQL Server).
+
+    Rows with a missing or unparseable date are dropped, as they cannot be placed on a day.
+    """
+    if pushdown:
+        query = _daily_counts_pushdown_query(query, date_col, day_expr)
+
+    running = None
+    for batch in iter_infection_events_sql(cfg, query, batch_size=batch_size, conn=conn):
+        if date_col not in batch.columns:
+            raise ValueError(f"{date_col} is required for daily counts.")
+        days = pd.to_datetime(batch[date_col], errors="coerce").dt.normalize()
+
+        if pushdown:
+            counts = pd.Series(batch["DailyCases"].to_numpy(), index=days)
+            counts = counts[counts.index.notna()].groupby(level=0).sum()
+        else:
+            counts = days.dropna().value_counts()
+
+        running = counts if running is None else running.add(counts, fill_value=0)
+
+    if running is None or running.empty:
+        return pd.DataFrame({
+            "CollectionDate": pd.Series(dtype="datetime64[ns]"),
+            "DailyCases": pd.Series(dtype=int),
+        })
+
+    out = (
+        running.astype(int)
+               .rename("DailyCases")
+               .rename_axis("CollectionDate")
+               .reset_index()
+    )
+    return out.sort_values("CollectionDate", ignore_index=True)
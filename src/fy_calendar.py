@@ -0,0 +1,75 @@
+"""
+Financial-year calendar - vectorised date labelling for SPC and reporting.
+FY labels, FY quarters and calendar periods are computed with array arithmetic on datetime64 month numbers,
+so a whole column is labelled in one operation instead of one Python call per row.
+The FY start month is configurable (UK default: April).
+"""
+
+import numpy as np
+import pandas as pd
+
+UK_FY_START_MONTH = 4  # April
+
+
+def _month_numbers(dates):
+    # Months since 1970-01 for each date (a scalar in, a scalar out); NaT is rejected so every date gets a real label
+    values = pd.to_datetime(np.atleast_1d(np.asarray(dates)), errors="coerce").to_numpy().astype("datetime64[M]")
+    if np.isnat(values).any():
+        raise ValueError("Date is NaT; cannot determine financial year.")
+    months = values.astype(np.int64)
+    return months[0] if np.ndim(dates) == 0 else months
+
+
+def financial_year(dates, start_month: int = UK_FY_START_MONTH) -> np.ndarray:
+    """
+    Financial year labels for an array/Series of dates, labelled by the year in which the FY ends.
+    Example (April start):
+      - 2024-04-01 to 2025-03-31 => FY 2025
+    """
+    months = _month_numbers(dates)
+    year = months // 12 + 1970
+    month = months % 12 + 1
+    if start_month == 1:
+        return year
+    return year + (month >= start_month)
+
+
+def fy_quarter(dates, start_month: int = UK_FY_START_MONTH) -> np.ndarray:
+    """
+    Quarter within the financial year (1-4); Q1 starts in `start_month`.
+    """
+    months = _month_numbers(dates)
+    return ((months % 12 + 1 - start_month) % 12) // 3 + 1
+
+
+def fy_bounds(fy: int, start_month: int = UK_FY_START_MONTH) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """
+    First and last day of financial year `fy`.
+    """
+    start_year = fy if start_month == 1 else fy - 1
+    start = pd.Timestamp(year=start_year, month=start_month, day=1)
+    end = pd.Timestamp(year=start_year + 1, month=start_month, day=1) - pd.Timedelta(days=1)
+    return start, end
+
+
+def add_calendar_columns(
+    df: pd.DataFrame,
+    date_col: str = "CollectionDate",
+    start_month: int = UK_FY_START_MONTH,
+    quarters: bool = False,
+    calendar: bool = False,
+) -> pd.DataFrame:
+    """
+    Adds FinancialYear (and optionally FYQuarter, CalendarYear, CalendarMonth) columns.
+    """
+    d = df.copy()
+    d[date_col] = pd.to_datetime(d[date_col], errors="coerce")
+
+    d["FinancialYear"] = financial_year(d[date_col], start_month)
+    if quarters:
+        d["FYQuarter"] = fy_quarter(d[date_col], start_month)
+    if calendar:
+        months = _month_numbers(d[date_col])
+        d["CalendarYear"] = months // 12 + 1970
+        d["CalendarMonth"] = months % 12 + 1
+    return d
@@ -0,0 +1,195 @@
+"""
+Dr Nneoma O
+HTTP cache: an on-disk cache for API responses so repeated runs do not download identical payloads.
+1. Each response is stored under a key built from the URL and query parameters, with its ETag / Last-Modified
+2. The next request for the same key sends If-None-Match / If-Modified-Since
+3. On a 304 Not Modified, the cached decoded payload is served instead of downloading it again
+4. Entries are evicted once they are older than max_age, and least-recently-used entries go when the cache exceeds max_bytes
+   (a running size total is kept, so the directory is only scanned when the total goes over the limit)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .config import Config
+
+
+class ResponseCache:
+    """
+    On-disk cache of decoded JSON payloads keyed by URL + parameters.
+    One JSON file per entry; the file modification time records when it was last used.
+    """
+
+    def __init__(self, cache_dir: str, max_age_seconds: float = 7 * 24 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: int | None = None  # bytes on disk; None until the first scan
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> "ResponseCache":
+        return cls(
+            cfg.api_cache_dir,
+            max_age_seconds=cfg.api_cache_max_age_hours * 3600,
+            max_bytes=cfg.api_cache_max_mb * 1024 * 1024,
+        )
+
+    @staticmethod
+    def key(url: str, params: dict | None = None) -> str:
+        # I sort the parameters so the same request always maps to the same key regardless of argument order
+        raw = json.dumps([url, sorted((str(k), str(v)) for k, v in (params or {}).items())])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        """
+        Returns the cached entry ({"etag", "last_modified", "stored_at", "payload", ...}) or None.
+        Entries older than max_age are removed rather than returned.
+        """
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+            if time.time() - st.st_mtime > self.max_age_seconds:
+                os.remove(path)
+                self._add_size(-st.st_size)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def conditional_headers(entry: dict | None) -> dict:
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def touch(self, key: str) -> None:
+        # A 304 confirms the entry is still current, so it counts as fresh and recently used
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def put(self, key: str, url: str, params: dict | None, headers, payload) -> None:
+        """
+        Stores a decoded payload, provided the response carries a validator (ETag or Last-Modified).
+        """
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+
+        entry = {
+            "url": url,
+            "params": params or {},
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+            "payload": payload,
+        }
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        added = os.stat(tmp).st_size
+        os.replace(tmp, path)
+        # Listing the directory on every write would make an N-page extract O(N^2) in file system calls,
+        # so I keep a running total and only scan once it passes the limit (or on the first write)
+        if self._add_size(added - replaced) > self.max_bytes:
+            self.evict()
+
+    def _add_size(self, delta: int) -> float:
+        with self._lock:
+            if self._size is None:
+                return float("inf")
+            self._size = max(self._size + delta, 0)
+            return self._size
+
+    def evict(self) -> None:
+        """
+        Removes expired entries, then the least recently used ones until the cache fits in max_bytes
+        (down to 90% of it, so a cache at the limit is not rescanned on every write).
+        """
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - st.st_mtime > self.max_age_seconds:
+                    self._remove(path)
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    if total <= 0.9 * self.max_bytes:
+                        break
+                    self._remove(path)
+                    total -= size
+            self._size = total
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                self._remove(os.path.join(self.cache_dir, name))
+        with self._lock:
+            self._size = 0
+
+
+def fetch_json_cached(
+    get,
+    url: str,
+    params: dict | None = None,
+    cache: ResponseCache | None = None,
+    bypass_cache: bool = False,
+):
+    """
+    Fetches and decodes a JSON payload through `get(url, params, headers) -> requests.Response`,
+    using `cache` for conditional requests when given.
+
+    bypass_cache=True skips the conditional headers and always downloads the payload;
+    the fresh response still replaces the cached entry.
+    """
+    if cache is None:
+        return get(url, params, {}).json()
+
+    key = cache.key(url, params)
+    entry = None if bypass_cache else cache.get(key)
+
+    resp = get(url, params, cache.conditional_headers(entry))
+    if resp.status_code == 304 and entry is not None:
+        cache.touch(key)
+        return entry["payload"]
+
+    payload = resp.json()
+    cache.put(key, url, params, resp.headers, payload)
+    return payload
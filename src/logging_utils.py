@@ -3,27 +3,68 @@ Dr Nneoma O
 Logging utility:  The purpose of this is to see exactly what the pipeline is doing, for easily diagnosis and clear audit trail.
 This essentially replaces using print() after each block of code and is better as it has more information, which can be saved in files
 
+It also records per-stage performance metrics (wall time, process CPU time, rows in and out, RSS at the start and end of
+the stage, how far the stage raised the process peak RSS, tracemalloc deltas) as JSON lines next to the run log, and ends
+each run with a summary of the slowest stages.
+Log records go through a QueueHandler, so console and file I/O happen on a listener thread, off the hot path.
 """
 # Import relevant libraries
+import atexit
+import contextlib
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
 from datetime import datetime
 
+REPORTS_DIR = "outputs/reports"
+_listeners: list[logging.handlers.QueueListener] = []
+_setup_lock = threading.Lock()  # jobs running at once in service mode must not each attach handlers to the same logger
+
+
+def _start_queue_listener(logger: logging.Logger, *handlers: logging.Handler) -> None:
+    # The logger only puts records on a queue; a background listener thread formats and writes them
+    q = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(q))
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+@atexit.register
+def stop_log_listeners() -> None:
+    """
+    Flushes queued log records and stops the listener threads (also run automatically at exit).
+    """
+    while _listeners:
+        _listeners.pop().stop()
+
 
 # I define a function that creates and returns a configured logger
 # The optional 'name' argument allows me to create different loggers for different parts of the pipeline if required
 
 def get_logger(name: str = "pipeline") -> logging.Logger:
+    with _setup_lock:
+        return _get_logger(name)
+
+
+def _get_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)   
     if logger.handlers:
         return logger # If this logger already has handlers attached, I return it immediately to avoid adding duplicate handlers
     
-  os.makedirs("outputs/reports", exist_ok=True) # I ensure the reports output directory exists, and exist_ok=True prevents an error if the folder already exists
+    os.makedirs(REPORTS_DIR, exist_ok=True) # I ensure the reports output directory exists, and exist_ok=True prevents an error if the folder already exists
 
     # I build a file path for the log file, including today’s date so each run is logged to a daily file
     log_path = os.path.join(
-        "outputs/reports",
+        REPORTS_DIR,
         f"run_log_{datetime.now():%Y%m%d}.log"
     )
 
@@ -40,7 +81,152 @@ def get_logger(name: str = "pipeline") -> logging.Logger:
     fh = logging.FileHandler(log_path, encoding="utf-8")
     fh.setFormatter(fmt)
 
-    # Attach both handlers to the logger so every log message goes to both the console and the log file
-    logger.addHandler(ch)
-    logger.addHandler(fh)
+    # Attach both handlers (through the queue) so every log message goes to both the console and the log file
+    _start_queue_listener(logger, ch, fh)
     return logger
+
+
+def get_metrics_logger() -> logging.Logger:
+    """
+    A logger whose messages are JSON lines written to outputs/reports/metrics_YYYYMMDD.jsonl (queued like get_logger).
+    """
+    with _setup_lock:
+        logger = logging.getLogger("pipeline.metrics")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if logger.handlers:
+            return logger
+
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        fh = logging.FileHandler(os.path.join(REPORTS_DIR, f"metrics_{datetime.now():%Y%m%d}.jsonl"), encoding="utf-8")
+        fh.setFormatter(logging.Formatter("%(message)s"))
+        _start_queue_listener(logger, fh)
+        return logger
+
+
+def _rss_mb() -> float | None:
+    # Current resident memory of this process (Linux only; None elsewhere)
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _peak_rss_mb() -> float | None:
+    # Peak resident memory of this process so far (not available on Windows without extra packages)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def _rows(value) -> int | None:
+    # A row count given directly, or the total rows of the DataFrames/arrays given; None when there is no tabular data
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    items = value if isinstance(value, (list, tuple)) else [value]
+    counts = [len(v) for v in items if hasattr(v, "shape")]
+    return sum(counts) if counts else None
+
+
+class RunMetrics:
+    """
+    Collects per-stage metrics for one run and writes each as a JSON line.
+
+        metrics = RunMetrics("pipeline")
+        with metrics.stage("transform", rows_in=df_raw) as m:
+            df_std = standardise_infection_events(df_raw)
+            m["rows_out"] = len(df_std)
+        metrics.log_summary(logger)
+
+    CPU and memory come from the whole process (the background writer and log threads included), so each stage records
+    the change over the stage: process_cpu_s is the process CPU time used while it ran, rss_start_mb/rss_end_mb the
+    resident memory either side of it, and peak_rss_growth_mb how far it raised the process peak RSS (0 when an
+    earlier stage had already used more). process_peak_rss_mb is the process high-water mark so far, not the stage's.
+    trace_memory=True also records tracemalloc deltas (Python allocations), which slows the run down noticeably.
+    """
+
+    def __init__(self, run_name: str = "pipeline", trace_memory: bool = False, metrics_logger: logging.Logger | None = None):
+        self.run_name = run_name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.trace_memory = trace_memory
+        self.records: list[dict] = []
+        self._metrics_logger = metrics_logger or get_metrics_logger()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, stage: str, **fields) -> dict:
+        """
+        Writes a metrics record as-is (e.g. for a stage that was skipped).
+        """
+        rec = {"run_id": self.run_id, "run": self.run_name, "stage": stage, "ts": datetime.now().isoformat(timespec="seconds")}
+        rec.update(fields)
+        self.records.append(rec)
+        self._metrics_logger.info(json.dumps(rec, default=str))
+        return rec
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in=None):
+        """
+        Times the block and yields a dict; set m["rows_out"] (a count or the output itself) and any extra fields on it.
+        The record is written even if the block raises (with status "failed").
+        """
+        extra = {"rows_out": None}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            mem_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        rss0, peak0 = _rss_mb(), _peak_rss_mb()
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        status = "ran"
+        try:
+            yield extra
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            wall_s, cpu_s = time.perf_counter() - wall0, time.process_time() - cpu0
+            rss1, peak1 = _rss_mb(), _peak_rss_mb()
+            fields = {
+                "status": status,
+                "wall_s": round(wall_s, 4),
+                "process_cpu_s": round(cpu_s, 4),
+                "rows_in": _rows(rows_in),
+                "rows_out": _rows(extra.pop("rows_out")),
+                "rss_start_mb": None if rss0 is None else round(rss0, 1),
+                "rss_end_mb": None if rss1 is None else round(rss1, 1),
+                "peak_rss_growth_mb": None if peak1 is None else round(peak1 - peak0, 1),
+                "process_peak_rss_mb": None if peak1 is None else round(peak1, 1),
+            }
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                fields["tracemalloc_delta_mb"] = round((current - mem_before) / 2**20, 3)
+                fields["tracemalloc_peak_mb"] = round((peak - mem_before) / 2**20, 3)
+            fields.update(extra)
+            self.record(name, **fields)
+
+    def slowest(self, n: int = 5) -> list[dict]:
+        timed = [r for r in self.records if r.get("status") != "skipped" and "wall_s" in r]
+        return sorted(timed, key=lambda r: r["wall_s"], reverse=True)[:n]
+
+    def log_summary(self, logger: logging.Logger, n: int = 5) -> None:
+        total = sum(r.get("wall_s", 0) for r in self.records)
+        lines = [
+            f"  {r['stage']:<12} {r['wall_s']:>8.3f}s wall {r['process_cpu_s']:>8.3f}s process cpu"
+            + (f"  rows {r['rows_in']}->{r['rows_out']}" if r.get("rows_in") is not None or r.get("rows_out") is not None else "")
+            + (f"  RSS {r['rss_start_mb']:.0f}->{r['rss_end_mb']:.0f} MB" if r.get("rss_end_mb") is not None else "")
+            + (f" (raised process peak by {r['peak_rss_growth_mb']:.0f} MB)" if (r.get("peak_rss_growth_mb") or 0) >= 1 else "")
+            for r in self.slowest(n)
+        ]
+        skipped = sum(1 for r in self.records if r.get("status") == "skipped")
+        peak = max((r["process_peak_rss_mb"] for r in self.records if r.get("process_peak_rss_mb") is not None), default=None)
+        logger.info(
+            f"Run {self.run_id}: {len(self.records)} stages ({skipped} skipped), {total:.2f}s in stages"
+            + (f", process peak RSS {peak:.0f} MB" if peak is not None else "")
+            + ". Slowest:\n"
+            + ("\n".join(lines) or "  (none ran)")
+        )
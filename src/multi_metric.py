@@ -0,0 +1,277 @@
+"""
+Dr Nneoma O
+Multi-metric runs - many SPC metrics (organisms, falls, readmissions ...) in one run instead of one process per metric in turn.
+1. Each metric is declared in a registry (JSON): its source and query/endpoint/path, a column mapping into the standard
+   schema (transform.py), and its SPC settings
+2. Extraction is I/O, so it runs on threads, with a cap on how many extracts hit each source at once
+3. As each extract lands it goes to a process pool for the CPU work (standardise, validate, SPC, report, charts),
+   so extraction of the next metrics overlaps with processing and processing scales with the number of cores.
+   At most two metrics per worker process are extracted or waiting to be processed at once, so only that many raw
+   frames are held in memory however many metrics are registered
+4. One combined run report lists every metric's outcome, breach counts and timings; a failing metric never stops the others
+
+    python -m src.cli metrics                          # every metric in METRICS_REGISTRY
+    python -m src.cli metrics --only cdiff falls --workers 4
+
+metrics.json:
+    {"metrics": [
+        {"name": "cdiff", "source": "sql", "query": "SELECT EventID, SpecimenDate FROM dbo.CDiff",
+         "columns": {"SpecimenDate": "CollectionDate"}, "series_cols": ["Location"], "run_rules": true},
+        {"name": "falls", "source": "api", "query": "falls", "params": {"paginated": true}},
+        {"name": "demo", "source": "synthetic", "params": {"base_rate": 3, "n_locations": 5}, "series_cols": ["Location"]}
+    ]}
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from .config import Config
+from .logging_utils import get_logger
+from .outputs import OutputWriter
+from .transform import CATEGORY_COLUMNS
+
+SOURCES = ("sql", "api", "file", "synthetic")
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """
+    name: used in output file names (<name>_daily_spc_flagged_FY<fy> etc.), so it must be unique.
+    source: "sql" (query is the SQL), "api" (query is the endpoint; params go to the API extractor, with paginated=True
+      for paged endpoints), "file" (query is a CSV/Parquet path) or "synthetic" (params go to synthetic_events).
+    columns: raw column name -> standard name (e.g. {"SpecimenDate": "CollectionDate"}), applied before standardising.
+    series_cols: Department and/or Location to run SPC per series; empty for one series.
+    fy_start_month / current_fy: None uses the Config / latest FY in the data.
+    """
+    name: str
+    source: str = "sql"
+    query: str = ""
+    columns: dict = field(default_factory=dict)
+    series_cols: tuple = ()
+    fy_start_month: int | None = None
+    current_fy: int | None = None
+    run_rules: bool = False
+    charts: bool = True
+    title: str = ""
+    params: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.source not in SOURCES:
+            raise ValueError(f"Metric '{self.name}': unknown source '{self.source}'. Use one of {SOURCES}.")
+        if self.source != "synthetic" and not self.query:
+            raise ValueError(f"Metric '{self.name}': a query, endpoint or path is required for source '{self.source}'.")
+        unknown = [c for c in self.series_cols if c not in CATEGORY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Metric '{self.name}': series columns must be among {CATEGORY_COLUMNS}, not {unknown}.")
+        object.__setattr__(self, "series_cols", tuple(self.series_cols))
+
+
+def load_metric_registry(path: str) -> list[MetricSpec]:
+    """
+    Reads metric definitions from JSON: a list of metrics, or {"metrics": [...]}.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("metrics", []) if isinstance(data, dict) else data
+    try:
+        metrics = [MetricSpec(**entry) for entry in entries]
+    except TypeError as ex:
+        raise ValueError(f"Invalid metric definition in {path}: {ex}") from None
+    names = [m.name for m in metrics]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Metric names in {path} must be unique.")
+    return metrics
+
+
+def parse_source_limits(text: str) -> dict[str, int]:
+    """
+    "sql=4,api=2" -> {"sql": 4, "api": 2}: the most extracts that may run against each source at once.
+    """
+    limits = {}
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        source, _, n = item.partition("=")
+        try:
+            limits[source.strip()] = max(int(n), 1)
+        except ValueError:
+            raise ValueError(f"Source limit '{item}' needs a number, e.g. {source.strip()}=4.") from None
+    return limits
+
+
+def extract_metric(cfg: Config, metric: MetricSpec) -> pd.DataFrame:
+    """
+    The raw event table for one metric, with its column mapping applied.
+    """
+    from .multi_source import api_source, file_source, sql_source
+
+    if metric.source == "sql":
+        raw = sql_source(cfg, metric.query).extract()
+    elif metric.source == "api":
+        raw = api_source(cfg, metric.query, **metric.params).extract()
+    elif metric.source == "file":
+        raw = file_source(metric.query).extract()
+    else:
+        from .synthetic import synthetic_events
+        raw = synthetic_events(**metric.params)
+    return raw.rename(columns=metric.columns) if metric.columns else raw
+
+
+def process_metric(cfg: Config, metric: MetricSpec, raw: pd.DataFrame) -> dict:
+    """
+    Standardise, validate, SPC (per series when series_cols is set), report and charts for one metric.
+    Runs in a worker process; returns a small summary row for the run report.
+    """
+    from .analyse import breach_cube, summarise_breaches
+    from .charts import chart_specs_from_flagged, render_charts
+    from .spc import SPC_STATUSES
+    from .spc_multi import grouped_spc
+    from .transform import standardise_infection_events
+    from .validate import validate_infection_events
+
+    t0 = time.perf_counter()
+    std = standardise_infection_events(raw, compact=True)
+    checks = validate_infection_events(std)
+    flagged = grouped_spc(
+        std,
+        metric.series_cols,
+        current_fy=metric.current_fy,
+        start_month=metric.fy_start_month or cfg.fy_start_month,
+        run_rules=metric.run_rules,
+    )
+    current_fy = int(flagged["FinancialYear"].iloc[0])
+    status = flagged["SPCStatus"].astype(str)
+
+    # Each worker renders its own charts (max_workers=1): the metrics are already spread over the processes
+    with OutputWriter.from_config(cfg) as writer:
+        flagged_path = writer.write(flagged, cfg.processed_dir, f"{metric.name}_daily_spc_flagged_FY{current_fy}")
+        writer.write(summarise_breaches(flagged), cfg.reports_dir, f"{metric.name}_spc_breach_summary")
+        writer.write(breach_cube(flagged, grouping=cfg.breach_cube_grouping), cfg.reports_dir, f"{metric.name}_spc_breach_cube")
+        charts = []
+        if metric.charts:
+            title = metric.title or metric.name
+            specs = chart_specs_from_flagged(
+                flagged,
+                cfg.charts_dir,
+                series_cols=metric.series_cols,
+                name=f"{metric.name}_spc_FY{current_fy}",
+                title=f"{title} (FY{current_fy}) vs Baseline SPC Limits (FY{current_fy - 1})",
+            )
+            charts = render_charts(specs, max_workers=1)
+
+    last_day = flagged["CollectionDate"].max()
+    return {
+        "Rows": checks["row_count"],
+        "Series": len(flagged[list(metric.series_cols)].drop_duplicates()) if metric.series_cols else 1,
+        "CurrentFY": current_fy,
+        "Warnings2SD": int((status == SPC_STATUSES[1]).sum()),
+        "Breaches3SD": int((status == SPC_STATUSES[2]).sum()),
+        "LatestDate": str(pd.Timestamp(last_day).date()),
+        "SeriesInBreachLatestDay": int((status[flagged["CollectionDate"] == last_day] == SPC_STATUSES[2]).sum()),
+        "FlaggedPath": flagged_path,
+        "Charts": len(charts),
+        "ProcessSeconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def run_metrics(
+    metrics: list[MetricSpec],
+    cfg: Config | None = None,
+    max_workers: int | None = None,
+    source_limits: dict[str, int] | None = None,
+    logger=None,
+) -> pd.DataFrame:
+    """
+    Runs every metric: extracts on threads (at most source_limits[source] at once per source), processing in a
+    pool of max_workers processes as extracts complete. An extract waits for a free slot (2 per worker process) before it
+    starts, and the slot is freed when that metric's processing finishes. Returns the combined run report (one row per metric),
+    which is also saved as metric_run_report in reports_dir.
+    """
+    cfg = cfg or Config()
+    logger = logger or get_logger("pipeline")
+    names = [m.name for m in metrics]
+    if len(set(names)) != len(names):
+        raise ValueError("Metric names must be unique.")
+    for d in (cfg.processed_dir, cfg.reports_dir, cfg.charts_dir):
+        os.makedirs(d, exist_ok=True)
+
+    limits = source_limits if source_limits is not None else parse_source_limits(cfg.metric_source_limits)
+    gates = {s: threading.BoundedSemaphore(limits.get(s, 4)) for s in SOURCES}
+    workers = max_workers or cfg.metric_workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    logger.info(f"Running {len(metrics)} metric(s) on {workers} process(es); source limits {limits}.")
+
+    # Caps raw frames in flight (extracting, or extracted and waiting for a worker); released once processing is done
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def extract_and_submit(metric: MetricSpec):
+        # The raw frame is handed straight to the process pool, so no extract future keeps a reference to it
+        slots.acquire()
+        try:
+            with gates[metric.source]:
+                t0 = time.perf_counter()
+                raw = extract_metric(cfg, metric)
+                seconds = time.perf_counter() - t0
+            processed = cpu_pool.submit(process_metric, cfg, metric, raw)
+        except BaseException:
+            slots.release()
+            raise
+        processed.add_done_callback(lambda _: slots.release())
+        return processed, seconds
+
+    rows = {m.name: {"Metric": m.name, "Source": m.source, "Status": "failed"} for m in metrics}
+    # Workers are spawned rather than forked: this process has extract and logging threads running
+    context = multiprocessing.get_context("spawn")
+    io_threads = sum(limits.get(s, 4) for s in SOURCES)
+    with ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="metric-extract") as io_pool, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context) as cpu_pool:
+        extracts = {io_pool.submit(extract_and_submit, m): m for m in metrics}
+        processing = {}
+        for future in as_completed(extracts):
+            metric = extracts[future]
+            try:
+                processed, seconds = future.result()
+            except Exception as ex:
+                rows[metric.name]["Error"] = f"extract: {ex}"
+                logger.exception(f"Metric '{metric.name}': extraction failed.")
+                continue
+            rows[metric.name]["ExtractSeconds"] = round(seconds, 3)
+            processing[processed] = metric
+
+        for future in as_completed(processing):
+            metric = processing[future]
+            try:
+                rows[metric.name].update(future.result(), Status="ok")
+                logger.info(f"Metric '{metric.name}' done: {rows[metric.name]['Breaches3SD']} 3 SD breach day(s).")
+            except Exception as ex:
+                rows[metric.name]["Error"] = f"process: {ex}"
+                logger.exception(f"Metric '{metric.name}': processing failed.")
+
+    # Nullable dtypes keep counts as integers when a failed metric leaves them empty
+    report = pd.DataFrame([rows[n] for n in names]).convert_dtypes()
+    with OutputWriter.from_config(cfg) as writer:
+        report_path = writer.write(report, cfg.reports_dir, "metric_run_report")
+    ok = int((report["Status"] == "ok").sum())
+    logger.info(
+        f"Metric run finished in {time.perf_counter() - started:.2f}s: {ok}/{len(metrics)} ok. Report: {report_path}"
+    )
+    return report
+
+
+def main(registry: str | None = None, only: list[str] | None = None, max_workers: int | None = None) -> pd.DataFrame:
+    cfg = Config()
+    metrics = load_metric_registry(registry or cfg.metrics_registry)
+    if only:
+        unknown = sorted(set(only) - {m.name for m in metrics})
+        if unknown:
+            raise ValueError(f"Metrics not in the registry: {unknown}")
+        metrics = [m for m in metrics if m.name in only]
+    return run_metrics(metrics, cfg, max_workers=max_workers)
+
@@ -0,0 +1,165 @@
+"""
+Dr Nneoma O
+Multi-source extraction: pulls events from SQL, API and file sources at the same time and combines them.
+1. Every source is extracted on its own thread, so total time is close to the slowest source rather than the sum
+2. Each result is standardised (transform.py) as soon as it arrives, while the other sources are still downloading
+3. Results are unioned and de-duplicated on EventID through a 64-bit hash index
+4. When sources disagree about the same EventID, a configurable precedence order decides which record is kept
+"""
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .config import Config
+from .transform import standardise_infection_events
+from .validation_rules import hash_keys
+
+
+@dataclass(frozen=True)
+class Source:
+    """
+    A named event source; `extract` is a zero-argument callable returning the raw DataFrame.
+    """
+    name: str
+    extract: Callable[[], pd.DataFrame]
+
+
+def sql_source(cfg: Config, query: str, name: str = "sql", conn=None) -> Source:
+    from .extract_sql import extract_infection_events_sql
+    return Source(name, lambda: extract_infection_events_sql(cfg, query, conn=conn))
+
+
+def api_source(cfg: Config, endpoint: str, name: str = "api", paginated: bool = False, **kwargs) -> Source:
+    from .extract_api import extract_from_api, extract_paginated_api
+    if paginated:
+        return Source(name, lambda: extract_paginated_api(cfg, endpoint, **kwargs))
+    return Source(name, lambda: extract_from_api(cfg, endpoint, **kwargs))
+
+
+def file_source(path: str, name: str | None = None) -> Source:
+    # CSV or Parquet, decided by the file extension
+    reader = pd.read_parquet if path.lower().endswith((".parquet", ".pq")) else pd.read_csv
+    return Source(name or os.path.basename(path), lambda: reader(path))
+
+
+def sources_from_config(cfg: Config, query: str, conn=None, session=None) -> list[Source]:
+    """
+    Builds the source list from EXTRACT_SOURCES, e.g. "sql,api,file:data/raw/manual_events.csv".
+    An open SQL connection and HTTP session (e.g. kept warm by service.py) are reused when given.
+    """
+    sources = []
+    for item in cfg.extract_sources:
+        kind, _, arg = item.partition(":")
+        if kind == "sql":
+            sources.append(sql_source(cfg, query, conn=conn))
+        elif kind == "api":
+            sources.append(api_source(cfg, arg or cfg.api_events_endpoint, paginated=True, session=session))
+        elif kind == "file":
+            sources.append(file_source(arg))
+        else:
+            raise ValueError(f"Unknown extract source '{item}'. Use sql, api[:endpoint] or file:<path>.")
+    return sources
+
+
+def _union_by_precedence(combined: pd.DataFrame | None, new: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """
+    Adds a standardised source to the running union and returns (union, EventIDs whose CollectionDate disagrees).
+    The lowest _Rank wins for each EventID key; rows without an EventID (_HasKey False) cannot be matched, so they are all kept.
+    """
+    conflicts = 0
+    if combined is not None:
+        shared = new.loc[new["_HasKey"], ["_Key", "CollectionDate"]].merge(
+            combined.loc[combined["_HasKey"], ["_Key", "CollectionDate"]], on="_Key", suffixes=("", "_Other")
+        )
+        conflicts = int(shared.loc[shared["CollectionDate"] != shared["CollectionDate_Other"], "_Key"].nunique())
+        new = pd.concat([combined, new], ignore_index=True)
+
+    keyed = new["_HasKey"].to_numpy()
+    winners = new[keyed].sort_values("_Rank", kind="stable").drop_duplicates("_Key")
+    return pd.concat([winners, new[~keyed]], ignore_index=True), conflicts
+
+
+def extract_all_sources(
+    sources: list[Source],
+    precedence: list[str] | None = None,
+    max_workers: int | None = None,
+    compact: bool = False,
+    raise_on_error: bool = False,
+    logger=None,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Extracts every source concurrently and returns (standardised, de-duplicated events, run report).
+
+    precedence: source names in priority order (first wins when sources share an EventID);
+      defaults to the order of `sources`. The output has a `Source` column naming where each row came from.
+    A failing source is logged and skipped unless raise_on_error=True.
+    """
+    names = [s.name for s in sources]
+    if len(set(names)) != len(names):
+        raise ValueError("Source names must be unique.")
+    order = precedence or names
+    rank = {name: i for i, name in enumerate(order)}
+    missing = [n for n in names if n not in rank]
+    if missing:
+        raise ValueError(f"Sources missing from precedence order: {missing}")
+
+    report = {"sources": {}, "conflicting_eventids": 0}
+    combined = None
+    started = time.perf_counter()
+
+    def run(source: Source):
+        t0 = time.perf_counter()
+        return source.extract(), time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(sources)) as pool:
+        futures = {pool.submit(run, s): s for s in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                raw, seconds = future.result()
+            except Exception as ex:
+                report["sources"][source.name] = {"error": str(ex)}
+                if logger is not None:
+                    logger.info(f"Source '{source.name}' failed ({ex}); continuing without it.")
+                if raise_on_error:
+                    raise
+                continue
+
+            std = standardise_infection_events(raw, compact=compact)
+            std["Source"] = source.name
+            std["_Rank"] = rank[source.name]
+            if "EventID" in std.columns:
+                # IDs that are numeric in one source can arrive as text from another (e.g. JSON), so I key them numerically when possible
+                ids = pd.to_numeric(std["EventID"], errors="coerce")
+                if ids.isna().sum() > std["EventID"].isna().sum():
+                    ids = std["EventID"].astype(str)
+                # The keys stay uint64 (float64 cannot hold every 64-bit hash, so distinct events could collide);
+                # missing EventIDs are marked in _HasKey instead of being nulled out
+                std["_Key"] = hash_keys(ids)
+                std["_HasKey"] = std["EventID"].notna().to_numpy()
+            else:
+                std["_Key"] = np.zeros(len(std), dtype=np.uint64)
+                std["_HasKey"] = False
+
+            report["sources"][source.name] = {"rows": len(std), "seconds": round(seconds, 3)}
+            if logger is not None:
+                logger.info(f"Source '{source.name}': {len(std)} rows in {seconds:.2f}s.")
+
+            combined, conflicts = _union_by_precedence(combined, std)
+            report["conflicting_eventids"] += conflicts
+
+    if combined is None:
+        raise ValueError("No source returned data.")
+
+    total_rows = sum(s.get("rows", 0) for s in report["sources"].values())
+    report["union_rows"] = len(combined)
+    report["duplicates_removed"] = total_rows - len(combined)
+    report["wall_seconds"] = round(time.perf_counter() - started, 3)
+
+    out = combined.sort_values(["CollectionDate", "_Rank"], kind="stable").drop(columns=["_Rank", "_Key", "_HasKey"])
+    return out.reset_index(drop=True), report
@@ -0,0 +1,237 @@
+"""
+Dr Nneoma O
+Outputs - one place that writes the pipeline's data files, in CSV, Parquet or Arrow IPC (Feather).
+1. Parquet and Feather keep dtypes (dates, categoricals, downcast numbers), so readers do not re-parse dates, and are compressed
+2. Intermediate files (raw and processed events) can be skipped entirely when only the SPC outputs are needed
+3. Writes run on a background thread, in submission order, so they overlap with the next stage; only a couple of writes
+   may be pending at once, so a producer that outruns the disk waits instead of piling frames up in memory
+4. Streams of batches (chunked mode) are appended to a single file
+5. Whole-frame writes go to a temporary file that is renamed into place, so a reader never sees a half-written file
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+
+from .config import Config
+
+FORMAT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+def output_path(directory: str, name: str, fmt: str) -> str:
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown output format '{fmt}'. Use one of {sorted(FORMAT_EXTENSIONS)}.")
+    return os.path.join(directory, name + FORMAT_EXTENSIONS[fmt])
+
+
+def write_frame(df: pd.DataFrame, path: str, fmt: str, compression: str | None = None) -> None:
+    """
+    Writes one DataFrame (compression=None uses each format's default: snappy for Parquet, lz4 for Feather).
+    """
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown output format '{fmt}'. Use one of {sorted(FORMAT_EXTENSIONS)}.")
+    # The temporary name keeps the real extension last, so CSV compression is still inferred from it
+    directory, filename = os.path.split(path)
+    tmp = os.path.join(directory, f".tmp-{os.getpid()}-{threading.get_ident()}-{filename}")
+    try:
+        if fmt == "csv":
+            df.to_csv(tmp, index=False, compression=compression or "infer")
+        elif fmt == "parquet":
+            df.to_parquet(tmp, index=False, compression=compression or "snappy")
+        else:
+            df.reset_index(drop=True).to_feather(tmp, compression=compression or "lz4")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_frame(path: str, **kwargs) -> pd.DataFrame:
+    """
+    Reads a file written by this module, choosing the reader from the extension.
+    """
+    lower = path.lower()
+    if lower.endswith((".parquet", ".pq")):
+        return pd.read_parquet(path, **kwargs)
+    if lower.endswith((".feather", ".arrow")):
+        return pd.read_feather(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def _stream_schema(table, fmt: str):
+    # Batches are downcast independently, so I widen integers (and dictionary indices) to a type every batch fits in.
+    # Arrow IPC files allow one dictionary per column, so Feather streams store categoricals as plain strings.
+    import pyarrow as pa
+
+    fields = []
+    for f in table.schema:
+        t = f.type
+        if pa.types.is_integer(t):
+            t = pa.int64()
+        elif pa.types.is_dictionary(t):
+            t = t.value_type if fmt == "feather" else pa.dictionary(pa.int32(), t.value_type)
+        fields.append(pa.field(f.name, t))
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+
+class FrameStream:
+    """
+    Appends batches to one file; created by OutputWriter.open_stream.
+    """
+
+    def __init__(self, writer: "OutputWriter", path: str):
+        self._writer = writer
+        self.path = path
+        self._sink = None
+        self._schema = None
+        self.rows = 0
+
+    def _write(self, df: pd.DataFrame) -> None:
+        fmt = self._writer.fmt
+        if fmt == "csv":
+            first = self._sink is None
+            df.to_csv(self.path, index=False, mode="w" if first else "a", header=first)
+            self._sink = True
+            return
+
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._sink is None:
+            self._schema = _stream_schema(table, fmt)
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                self._sink = pq.ParquetWriter(self.path, self._schema, compression=self._writer.compression or "snappy")
+            else:
+                import pyarrow.ipc as ipc
+                options = ipc.IpcWriteOptions(compression=self._writer.compression or "lz4")
+                self._sink = ipc.new_file(self.path, self._schema, options=options)
+        self._sink.write_table(table.cast(self._schema))
+
+    def _close(self) -> None:
+        if self._sink is not None and self._sink is not True:
+            self._sink.close()
+
+    def append(self, df: pd.DataFrame) -> None:
+        self.rows += len(df)
+        self._writer._submit(self._write, df)
+
+    def close(self, on_written=None) -> None:
+        """
+        Finishes the file; on_written(path) is called once it is complete (on the writer thread when in the background).
+        """
+        self._writer._submit(self._close, on_done=None if on_written is None else lambda: on_written(self.path))
+
+
+class OutputWriter:
+    """
+    Writes DataFrames in the configured format. With background=True, write() returns straight away and the
+    file is written on a single worker thread; call flush() (or use `with`) before relying on the files.
+    At most max_pending writes are queued or running at once; write()/append() block until one finishes,
+    so memory is bounded by a few frames however far the writer falls behind.
+    Frames handed to write()/append() must not be modified afterwards.
+    """
+
+    def __init__(
+        self,
+        fmt: str = "csv",
+        compression: str | None = None,
+        write_intermediate: bool = True,
+        background: bool = True,
+        max_pending: int = 2,
+    ):
+        if fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unknown output format '{fmt}'. Use one of {sorted(FORMAT_EXTENSIONS)}.")
+        self.fmt = fmt
+        self.compression = compression or None
+        self.write_intermediate = write_intermediate
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="output-writer") if background else None
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._pending: list[Future] = []
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> "OutputWriter":
+        return cls(
+            fmt=cfg.output_format,
+            compression=cfg.output_compression,
+            write_intermediate=cfg.write_intermediate,
+            background=cfg.background_writes,
+        )
+
+    def _submit(self, func, *args, on_done=None) -> None:
+        if self._pool is None:
+            func(*args)
+            if on_done is not None:
+                on_done()
+            return
+
+        # Backpressure: wait for a free slot, so queued work (and the frames it holds) stays bounded
+        self._slots.acquire()
+
+        def run():
+            try:
+                func(*args)
+            finally:
+                self._slots.release()
+            if on_done is not None:
+                on_done()
+
+        try:
+            future = self._pool.submit(run)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Finished writes are dropped as we go (failed ones are kept so flush() can raise them)
+        self._pending = [f for f in self._pending if not f.done() or f.exception() is not None]
+        self._pending.append(future)
+
+    def write(
+        self,
+        df: pd.DataFrame,
+        directory: str,
+        name: str,
+        intermediate: bool = False,
+        on_written=None,
+    ) -> str | None:
+        """
+        Writes `df` as directory/name.<ext> and returns the path (None if it is a skipped intermediate).
+        on_written(path) is called once the file is complete (on the writer thread when in the background),
+        e.g. to log that it was saved.
+        """
+        if intermediate and not self.write_intermediate:
+            return None
+        path = output_path(directory, name, self.fmt)
+        done = None if on_written is None else lambda: on_written(path)
+        self._submit(write_frame, df, path, self.fmt, self.compression, on_done=done)
+        return path
+
+    def open_stream(self, directory: str, name: str, intermediate: bool = False) -> FrameStream | None:
+        """
+        Opens a file that batches are appended to (None if it is a skipped intermediate).
+        """
+        if intermediate and not self.write_intermediate:
+            return None
+        return FrameStream(self, output_path(directory, name, self.fmt))
+
+    def flush(self) -> None:
+        """
+        Waits for queued writes and re-raises the first error.
+        """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,359 @@
+"""
+Dr Nneoma O
+Query - fast reads over the latest SPC results for dashboards, instead of re-parsing the output files on every refresh.
+1. The latest flagged file is loaded once into an index: rows sorted by series then date, with each series' row range,
+   so "status for series X between dates A and B" is a dict lookup plus a binary search
+2. Rows for each status in the latest FY are listed up front, so "all current 3 SD breaches" is a single take
+3. Query results are kept in an LRU cache bounded by size in bytes (and by number of entries)
+4. A new index is built to one side and swapped in with a single reference assignment, so a query sees the old results
+   or the new ones, never a mix; cache keys include the index version, so a stale entry is never served
+5. A small HTTP JSON API (standard library only), which can run on its own or next to the service (see cli.py)
+
+    python -m src.cli query --port 8765
+    curl "http://127.0.0.1:8765/series?start=2024-01-01&end=2024-01-31"
+    curl "http://127.0.0.1:8765/breaches"
+"""
+import glob
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from .config import Config
+from .logging_utils import get_logger
+from .outputs import FORMAT_EXTENSIONS, read_frame
+from .spc import SPC_STATUSES
+from .spc_multi import DEFAULT_SERIES_COLS
+from .transform import ensure_datetime
+
+BREACH_STATUS = SPC_STATUSES[2]
+RESULTS_PATTERN = "daily_spc_flagged_FY*"
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache. Entries are evicted oldest first once the total size passes
+    max_bytes or the count passes max_entries; an entry bigger than max_bytes on its own is not kept.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size: int) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes or len(self._items) > self.max_entries:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+@dataclass(frozen=True)
+class SPCIndex:
+    """
+    One loaded set of flagged SPC results, read-only once built.
+    frame: the flagged rows sorted by series then CollectionDate.
+    ranges: series key (tuple of series column values as strings; () for a single series) -> (first row, end row).
+    status_rows: SPCStatus -> row numbers in the latest FY.
+    """
+    frame: pd.DataFrame
+    series_cols: tuple[str, ...]
+    ranges: dict
+    dates: np.ndarray
+    status_rows: dict
+    version: str
+
+    @classmethod
+    def from_frame(cls, flagged: pd.DataFrame, series_cols=None, version: str = "") -> "SPCIndex":
+        if series_cols is None:
+            series_cols = [c for c in DEFAULT_SERIES_COLS if c in flagged.columns]
+        series_cols = tuple(series_cols)
+        missing = [c for c in ("CollectionDate", "SPCStatus", *series_cols) if c not in flagged.columns]
+        if missing:
+            raise ValueError(f"Flagged results are missing columns: {missing}")
+
+        d = flagged.copy()
+        d["CollectionDate"] = ensure_datetime(d["CollectionDate"])
+        d = d.sort_values([*series_cols, "CollectionDate"], kind="stable").reset_index(drop=True)
+
+        # Rows of each series are contiguous after the sort, so a series is a (start, stop) row range
+        change = np.zeros(len(d), dtype=bool)
+        change[:1] = True
+        for c in series_cols:
+            codes = pd.factorize(d[c], use_na_sentinel=False)[0]
+            change[1:] |= codes[1:] != codes[:-1]
+        starts = np.flatnonzero(change)
+        stops = np.r_[starts[1:], len(d)].astype(np.int64)
+        if series_cols:
+            keys = d.loc[starts, list(series_cols)].astype(str).itertuples(index=False, name=None)
+        else:
+            keys = [()] * len(starts)
+        ranges = {tuple(k): (int(a), int(b)) for k, a, b in zip(keys, starts, stops)}
+
+        latest = np.ones(len(d), dtype=bool)
+        if "FinancialYear" in d.columns and len(d):
+            fy = d["FinancialYear"].to_numpy()
+            latest = fy == fy.max()
+        status_codes, statuses = pd.factorize(d["SPCStatus"])
+        status_rows = {str(s): np.flatnonzero(latest & (status_codes == i)) for i, s in enumerate(statuses)}
+
+        dates = d["CollectionDate"].to_numpy().astype("datetime64[D]")
+        return cls(d, series_cols, ranges, dates, status_rows, version)
+
+    @classmethod
+    def from_file(cls, path: str, series_cols=None) -> "SPCIndex":
+        version = f"{os.path.abspath(path)}@{os.stat(path).st_mtime_ns}"
+        return cls.from_frame(read_frame(path), series_cols, version)
+
+    def series_key(self, series=None) -> tuple:
+        """
+        Normalises a series given as a dict of series columns, a tuple/list, a single value, or None (single series).
+        """
+        if series is None:
+            key = ()
+        elif isinstance(series, dict):
+            unknown = set(series) - set(self.series_cols)
+            if unknown:
+                raise ValueError(f"Not series columns: {sorted(unknown)}. Series columns: {list(self.series_cols)}")
+            key = tuple(str(series.get(c, "")) for c in self.series_cols)
+        elif isinstance(series, (tuple, list)):
+            key = tuple(str(v) for v in series)
+        else:
+            key = (str(series),)
+        if key not in self.ranges:
+            raise ValueError(f"Unknown series {key}.")
+        return key
+
+    def series_rows(self, series=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Flagged rows for one series with CollectionDate between start and end (inclusive; None = open-ended).
+        """
+        lo, hi = self.ranges[self.series_key(series)]
+        dates = self.dates[lo:hi]
+        a = lo + int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "D"), "left")) if start is not None else lo
+        b = lo + int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "D"), "right")) if end is not None else hi
+        return self.frame.iloc[a:max(a, b)]
+
+    def breaches(self, status: str = BREACH_STATUS) -> pd.DataFrame:
+        """
+        Every row with `status` in the latest FY.
+        """
+        if status not in SPC_STATUSES:
+            raise ValueError(f"Unknown status '{status}'. Use one of {SPC_STATUSES}.")
+        return self.frame.iloc[self.status_rows.get(status, np.array([], dtype=np.int64))]
+
+    def limits(self) -> pd.DataFrame:
+        """
+        One row per series: the limits applied on its latest day.
+        """
+        cols = [c for c in (*self.series_cols, "FinancialYear", "Mean", "UWL_2SD", "UCL_3SD") if c in self.frame.columns]
+        last_rows = [stop - 1 for _, stop in self.ranges.values()]
+        return self.frame.iloc[last_rows][cols].reset_index(drop=True)
+
+
+class SPCQueryService:
+    """
+    Answers queries from the current SPCIndex, with an LRU cache of results.
+    Returned frames are shared with the cache: copy one before modifying it.
+    """
+
+    def __init__(
+        self,
+        cfg: Config | None = None,
+        results_dir: str | None = None,
+        cache_bytes: int = 64 * 1024 * 1024,
+        cache_entries: int = 1024,
+        logger=None,
+    ):
+        self.cfg = cfg or Config()
+        self.results_dir = results_dir or self.cfg.processed_dir
+        self.cache = LRUCache(cache_bytes, cache_entries)
+        self.logger = logger or get_logger("query")
+        self._index: SPCIndex | None = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def index(self) -> SPCIndex:
+        index = self._index
+        if index is None:
+            raise ValueError(f"No SPC results loaded yet (nothing matching {RESULTS_PATTERN} in {self.results_dir}).")
+        return index
+
+    def latest_results_path(self) -> str | None:
+        paths = [
+            p for ext in FORMAT_EXTENSIONS.values()
+            for p in glob.glob(os.path.join(self.results_dir, RESULTS_PATTERN + ext))
+        ]
+        return max(paths, key=os.path.getmtime) if paths else None
+
+    def swap(self, index: SPCIndex) -> None:
+        """
+        Makes `index` the one queries use. In-flight queries finish against the index they started with.
+        """
+        self._index = index
+        self.cache.clear()
+
+    def reload(self, path: str | None = None) -> bool:
+        """
+        Loads the latest results file (or `path`) if it differs from the current index. Returns True if it swapped.
+        A file that cannot be read leaves the current index in place.
+        """
+        with self._reload_lock:
+            path = path or self.latest_results_path()
+            if path is None:
+                return False
+            try:
+                version = f"{os.path.abspath(path)}@{os.stat(path).st_mtime_ns}"
+                if self._index is not None and self._index.version == version:
+                    return False
+                index = SPCIndex.from_file(path)
+            except Exception as ex:
+                self.logger.warning(f"SPC results not reloaded from {path} ({ex}); keeping the current index.")
+                return False
+            self.swap(index)
+            self.logger.info(f"SPC results loaded from {path}: {len(index.frame)} rows, {len(index.ranges)} series.")
+            return True
+
+    def _cached(self, index: SPCIndex, key: tuple, compute) -> pd.DataFrame:
+        key = (index.version, *key)
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.put(key, result, _frame_bytes(result))
+        return result
+
+    def series_status(self, series=None, start=None, end=None) -> pd.DataFrame:
+        index = self.index
+        key = index.series_key(series)
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        return self._cached(index, ("series", key, start, end), lambda: index.series_rows(key, start, end))
+
+    def current_breaches(self, status: str = BREACH_STATUS) -> pd.DataFrame:
+        index = self.index
+        return self._cached(index, ("breaches", status), lambda: index.breaches(status))
+
+    def limits(self) -> pd.DataFrame:
+        index = self.index
+        return self._cached(index, ("limits",), index.limits)
+
+    def watch(self, interval_seconds: float, stop: threading.Event) -> threading.Thread:
+        """
+        Checks for a newer results file every `interval_seconds` until `stop` is set.
+        """
+        def loop():
+            while not stop.wait(interval_seconds):
+                self.reload()
+
+        thread = threading.Thread(target=loop, name="spc-query-watch", daemon=True)
+        thread.start()
+        return thread
+
+
+def _json_records(df: pd.DataFrame) -> bytes:
+    return df.to_json(orient="records", date_format="iso").encode()
+
+
+def make_query_server(queries: SPCQueryService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """
+    HTTP JSON API over `queries`:
+      GET /series?<series column>=...&start=YYYY-MM-DD&end=YYYY-MM-DD
+      GET /breaches?status=3 SD Breach
+      GET /limits
+      GET /health
+      POST /reload
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: bytes) -> None:
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            args = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == "/health":
+                    index = queries._index
+                    body = {
+                        "version": index.version if index else None,
+                        "rows": len(index.frame) if index else 0,
+                        "series": len(index.ranges) if index else 0,
+                        "cache": queries.cache.stats(),
+                    }
+                    self._send(200, json.dumps(body).encode())
+                elif url.path == "/series":
+                    start, end = args.pop("start", None), args.pop("end", None)
+                    self._send(200, _json_records(queries.series_status(args or None, start, end)))
+                elif url.path == "/breaches":
+                    self._send(200, _json_records(queries.current_breaches(args.get("status", BREACH_STATUS))))
+                elif url.path == "/limits":
+                    self._send(200, _json_records(queries.limits()))
+                else:
+                    self._send(404, json.dumps({"error": f"Unknown path {url.path}"}).encode())
+            except ValueError as ex:
+                self._send(400, json.dumps({"error": str(ex)}).encode())
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/reload":
+                self._send(404, json.dumps({"error": "Unknown path"}).encode())
+                return
+            self._send(200, json.dumps({"reloaded": queries.reload()}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def start_query_server(queries: SPCQueryService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """
+    Runs the HTTP API on a background thread; call .shutdown() on the returned server to stop it.
+    """
+    server = make_query_server(queries, host, port)
+    threading.Thread(target=server.serve_forever, name="spc-query-http", daemon=True).start()
+    queries.logger.info(f"SPC query API listening on http://{host}:{server.server_port}")
+    return server
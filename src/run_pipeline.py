@@ -3,23 +3,38 @@ Dr Nneoma O
 The pipeline: Bring it all together!
 
 """
+import functools
+import itertools
 import os
+import time
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from .config import Config
-from .logging_utils import get_logger
-from .extract_sql import extract_infection_events_sql
+from .logging_utils import RunMetrics, get_logger
+from .extract_sql import extract_infection_events_sql, extract_daily_counts_sql, iter_infection_events_sql
+from .chunked import iter_frame_chunks, run_chunked
+from .multi_source import extract_all_sources, sources_from_config
+from .event_cache import extract_incremental_events, event_cache_dir
 from .transform import standardise_infection_events
 from .validate import validate_infection_events
+from .validation_rules import default_rules
 from .spc import (
     daily_counts,
-    add_zero_days,
-    split_baseline_and_current,
-    spc_limits_from_baseline,
+    spc_limits_from_counts,
     flag_breaches_against_limits,
 )
-from .analyse import summarise_breaches
+from .daily_store import DailySeriesStore
+from .spc_state import incremental_spc
+from .fy_calendar import financial_year
+from .analyse import breach_cube, summarise_breaches
+from .dag import ALWAYS_RUN, FILES_KEY, PipelineExecutor, Stage
+from .outputs import OutputWriter
+from .charts import chart_specs_from_flagged, render_charts
+from .synthetic import SyntheticSpec, synthetic_events
+from . import (
+    analyse, charts, chunked, daily_store, event_cache, extract_api, extract_sql, fy_calendar, http_cache,
+    multi_source, outputs, spc, spc_multi, spc_rules, spc_state, synthetic, transform, validate, validation_rules,
+)
 
 def _ensure_dirs(cfg: Config) -> None:
     os.makedirs(cfg.raw_dir, exist_ok=True)
@@ -27,112 +42,316 @@ def _ensure_dirs(cfg: Config) -> None:
     os.makedirs(cfg.reports_dir, exist_ok=True)
     os.makedirs(cfg.charts_dir, exist_ok=True)
 
+# Synthetic example mimicking a realistic event table: two financial years (so there is a baseline FY),
+# a weekly pattern and two injected spikes
+SYNTHETIC_SPEC = SyntheticSpec(
+    start="2022-04-01",
+    end="2024-03-31",
+    base_rate=1.0,
+    weekday_profile=(1.0, 2.0, 1.0, 0.2, 1.0, 2.0, 0.2),
+    spike_dates=("2023-08-10", "2024-01-05"),
+    spike_multiplier=6.0,
+    seed=42,
+)
+
+
 def _synthetic_infection_events() -> pd.DataFrame:
-    # Synthetic example mimicking a realistic event table
-    dates = pd.date_range("2022-01-01", "2022-03-31", freq="D")
-    # baseline low counts + a few spikes
-    base = pd.Series([0, 1, 2, 1, 0, 1, 2], index=range(7))
-    daily = [int(base[i % 7]) for i in range(len(dates))]
-    # inject spikes
-    for spike_day in ["2022-02-10", "2022-03-05"]:
-        idx = (dates == spike_day).argmax()
-        daily[idx] = 8
-
-    rows = []
-    event_id = 1
-    for dt, n in zip(dates, daily):
-        for _ in range(n):
-            rows.append({"EventID": event_id, "CollectionDate": dt.date()})
-            event_id += 1
-
-    return pd.DataFrame(rows)
-
-def main():
-    cfg = Config()
-    logger = get_logger("pipeline")
-    _ensure_dirs(cfg)
+    return synthetic_events(SYNTHETIC_SPEC)
 
-    logger.info("Starting pipeline run.")
 
-    # 1) Extract
-    sql_query = """
+SPC_STATE_DIRNAME = "spc_state"
+
+SQL_QUERY = """
     SELECT EventID, CollectionDate
     FROM dbo.InfectionEvents
     WHERE CollectionDate IS NOT NULL;
     """
 
-    try:
-        df_raw = extract_infection_events_sql(cfg, sql_query)
-        logger.info("Extracted data from SQL Server.")
-    except Exception as ex:
-        logger.info(f"SQL extraction not used ({ex}). Falling back to synthetic dataset.")
-        df_raw = _synthetic_infection_events()
 
-    raw_path = os.path.join(cfg.raw_dir, "infection_events_raw.csv")
-    df_raw.to_csv(raw_path, index=False)
-    logger.info(f"Raw data saved: {raw_path}")
+# Each stage takes its inputs as keyword arguments and returns a dict of named outputs (see dag.py)
+
+def _stage_extract(cfg: Config, logger, writer: OutputWriter, sql_conn=None, http_session=None) -> dict:
+    # 1) Extract. Stream/pushdown and chunked modes produce daily counts directly and no event table
+    # sql_conn / http_session are reused when given (service mode keeps them warm); otherwise each extract connects itself
+    daily = None
+    files = []
+    if cfg.sql_daily_mode in ("stream", "pushdown"):
+        # Daily counts only: the event table is never materialised, so raw/processed files and row-level validation are skipped
+        try:
+            daily = extract_daily_counts_sql(
+                cfg,
+                SQL_QUERY,
+                batch_size=cfg.sql_batch_size,
+                pushdown=cfg.sql_daily_mode == "pushdown",
+                conn=sql_conn,
+            )
+            logger.info(f"Extracted daily counts from SQL Server ({cfg.sql_daily_mode} mode, {len(daily)} days).")
+        except Exception as ex:
+            logger.info(f"SQL daily extraction not used ({ex}). Falling back to event-level extraction.")
+
+    if daily is None and cfg.pipeline_chunk_size > 0:
+        # Out-of-core mode: each batch is standardised, validated and counted, then appended to the raw/processed files
+        # (the writer's queue is bounded, so batches never pile up in memory behind a slow disk; see chunked.py)
+        chunks = iter_infection_events_sql(cfg, SQL_QUERY, batch_size=cfg.pipeline_chunk_size, conn=sql_conn)
+        try:
+            chunks = itertools.chain([next(chunks)], chunks)
+            logger.info(f"Streaming events from SQL Server in batches of {cfg.pipeline_chunk_size}.")
+        except StopIteration:
+            chunks = iter([])
+        except Exception as ex:
+            logger.info(f"SQL extraction not used ({ex}). Falling back to synthetic dataset.")
+            chunks = iter_frame_chunks(_synthetic_infection_events(), cfg.pipeline_chunk_size)
+
+        raw_out = writer.open_stream(cfg.raw_dir, "infection_events_raw", intermediate=True)
+        processed_out = writer.open_stream(cfg.processed_dir, "infection_events_processed", intermediate=True)
+        written = []
+
+        def append_chunk(raw: pd.DataFrame, std: pd.DataFrame) -> None:
+            if raw_out is not None:
+                raw_out.append(raw)
+                processed_out.append(std)
+            written.append(len(raw))
 
-    # 2) Transform
-    df_std = standardise_infection_events(df_raw)
+        rules = default_rules(cfg.chunked_duplicate_check, cfg.chunked_expected_keys)
+        daily, checks = run_chunked(chunks, compact=cfg.compact_transform, on_chunk=append_chunk, rules=rules)
+        logger.info(f"Processed {len(written)} batches ({sum(written)} rows).")
+        if cfg.chunked_duplicate_check == "bloom" and sum(written) > cfg.chunked_expected_keys:
+            logger.warning(
+                f"{sum(written)} rows exceed CHUNKED_EXPECTED_KEYS={cfg.chunked_expected_keys}, so the duplicate "
+                f"EventID count may be over-stated; raise it to size the Bloom filter for this table."
+            )
+        logger.info(f"Validation summary: {checks}")
+        files = []
+        for out in (raw_out, processed_out):
+            if out is not None:
+                out.close(on_written=lambda p: logger.info(f"Data saved: {p}"))
+                files.append(out.path)
 
-    # 3) Validate
-    checks = validate_infection_events(df_std)
+    if daily is not None:
+        return {"events_raw": None, "events_standardised": False, "daily_extracted": daily, FILES_KEY: files}
+
+    df_raw = None
+    standardised = False
+    from_cache = False
+    if cfg.sql_incremental:
+        # The partitioned cache under raw_dir is the raw copy in this mode, so no raw CSV is rewritten
+        try:
+            df_raw, df_new = extract_incremental_events(cfg, SQL_QUERY, conn=sql_conn)
+            logger.info(
+                f"Incremental extract: {len(df_new)} rows fetched, {len(df_raw)} rows in cache "
+                f"({event_cache_dir(cfg)})."
+            )
+            from_cache = True
+        except Exception as ex:
+            logger.info(f"Incremental SQL extraction not used ({ex}). Falling back to full extraction.")
+
+    if df_raw is None and len(cfg.extract_sources) > 1:
+        # Several sources: extracted concurrently, standardised as they arrive and de-duplicated on EventID
+        try:
+            df_raw, source_report = extract_all_sources(
+                sources_from_config(cfg, SQL_QUERY, conn=sql_conn, session=http_session), compact=cfg.compact_transform, logger=logger
+            )
+            logger.info(f"Multi-source extract: {source_report}")
+            standardised = True
+        except Exception as ex:
+            logger.info(f"Multi-source extraction not used ({ex}). Falling back to SQL extraction.")
+
+    if df_raw is None:
+        try:
+            df_raw = extract_infection_events_sql(cfg, SQL_QUERY, conn=sql_conn)
+            logger.info("Extracted data from SQL Server.")
+        except Exception as ex:
+            logger.info(f"SQL extraction not used ({ex}). Falling back to synthetic dataset.")
+            df_raw = _synthetic_infection_events()
+
+    if not from_cache:
+        # The single- or multi-source extract (the union, for several sources) is kept for audit and replay;
+        # files are written in the background, so each "saved" line is logged once its write has finished
+        raw_path = writer.write(
+            df_raw, cfg.raw_dir, "infection_events_raw", intermediate=True,
+            on_written=lambda p: logger.info(f"Raw data saved: {p}"),
+        )
+        files.append(raw_path)
+
+    return {"events_raw": df_raw, "events_standardised": standardised, "daily_extracted": None, FILES_KEY: files}
+
+
+def _stage_transform(cfg: Config, logger, writer: OutputWriter, events_raw, events_standardised) -> dict:
+    # 2) Transform (the multi-source extract already standardises each source as it arrives)
+    if events_raw is None:
+        return {"events_std": None}
+    if events_standardised:
+        df_std = events_raw
+    else:
+        df_std = standardise_infection_events(events_raw, compact=cfg.compact_transform)
+
+    processed_path = writer.write(
+        df_std, cfg.processed_dir, "infection_events_processed", intermediate=True,
+        on_written=lambda p: logger.info(f"Processed data saved: {p}"),
+    )
+    return {"events_std": df_std, FILES_KEY: [processed_path]}
+
+
+def _stage_validate(cfg: Config, logger, writer: OutputWriter, events_std) -> dict:
+    # 3) Validate (chunked mode validates inside the extract stage)
+    if events_std is None:
+        return {"checks": None}
+    checks = validate_infection_events(events_std)
     logger.info(f"Validation summary: {checks}")
+    return {"checks": checks}
+
+
+def _stage_daily(cfg: Config, logger, writer: OutputWriter, events_std, daily_extracted) -> dict:
+    return {"daily": daily_extracted if events_std is None else daily_counts(events_std)}
 
-    processed_path = os.path.join(cfg.processed_dir, "infection_events_processed.csv")
-    df_std.to_csv(processed_path, index=False)
-    logger.info(f"Processed data saved: {processed_path}")
-
-             
-   # 4) SPC (Baseline = previous financial year; monitor = current financial year)
-             
-    daily = daily_counts(df_std)
-    daily_full = add_zero_days(daily)  # includes zero-case days for the full date range
-    baseline, current, current_fy = split_baseline_and_current(daily_full, current_fy=None)
-    
-    # If you want to ensure baseline/current include all days within each FY, you can re-zero-fill within those FY windows as well:
-    if not baseline.empty:
-        baseline = add_zero_days(baseline[["CollectionDate", "DailyCases"]].copy(),
-                                 start_date=baseline["CollectionDate"].min(),
-                                 end_date=baseline["CollectionDate"].max())
-    if not current.empty:
-        current = add_zero_days(current[["CollectionDate", "DailyCases"]].copy(),
-                                start_date=current["CollectionDate"].min(),
-                                end_date=current["CollectionDate"].max())
-    
-    limits = spc_limits_from_baseline(baseline)
-    
-    flagged_current = flag_breaches_against_limits(current, limits)
-    flagged_path = os.path.join(cfg.processed_dir, f"daily_spc_flagged_FY{current_fy}.csv")
-    flagged_current.to_csv(flagged_path, index=False)
-    logger.info(f"SPC flagged output saved: {flagged_path}")
+
+def _stage_spc(cfg: Config, logger, writer: OutputWriter, daily) -> dict:
+    # 4) SPC (Baseline = previous financial year; monitor = current financial year)
+    # Daily counts go into a dense day-indexed array: zero-case days are implicit and each FY is a plain slice
+    store = DailySeriesStore.from_daily(daily)
+    if cfg.spc_incremental:
+        # The saved state's baseline limits are reused and only the days after its last processed day are flagged
+        state, flagged_current = incremental_spc(
+            os.path.join(cfg.processed_dir, SPC_STATE_DIRNAME), store, cfg.fy_start_month, logger=logger
+        )
+        current_fy = state.current_fy
+        limits = {k: float(v[0]) for k, v in state.limits.items()}
+        flagged_current = flagged_current[["CollectionDate", "DailyCases", "FinancialYear", "Mean", "UWL_2SD", "UCL_3SD", "SPCStatus"]]
+        if cfg.spc_run_rules:
+            # Run rules look back over earlier days, so they are worked out over the whole current FY
+            flagged_current = flag_breaches_against_limits(flagged_current.iloc[:, :3], limits, run_rules=True)
+    else:
+        current_fy = int(financial_year(store.end, cfg.fy_start_month))
+
+        limits = spc_limits_from_counts(store.counts[0, store.fy_window(current_fy - 1, cfg.fy_start_month)])
+
+        current = store.to_frame(store.fy_window(current_fy, cfg.fy_start_month))
+        current["FinancialYear"] = current_fy
+        flagged_current = flag_breaches_against_limits(current, limits, run_rules=cfg.spc_run_rules)
+    flagged_path = writer.write(
+        flagged_current, cfg.processed_dir, f"daily_spc_flagged_FY{current_fy}",
+        on_written=lambda p: logger.info(f"SPC flagged output saved: {p}"),
+    )
     logger.info(f"Baseline FY: FY{current_fy-1} | Current FY: FY{current_fy}")
     logger.info(f"SPC limits from baseline FY{current_fy-1}: {limits}")
-    
+    return {"flagged": flagged_current, "limits": limits, "current_fy": current_fy, FILES_KEY: [flagged_path]}
 
+
+def _stage_report(cfg: Config, logger, writer: OutputWriter, flagged) -> dict:
     # 5) Summary report
     summary = summarise_breaches(flagged)
-    report_path = os.path.join(cfg.reports_dir, "spc_breach_summary.csv")
-    summary.to_csv(report_path, index=False)
-    logger.info(f"Summary report saved: {report_path}")
-
-    # 6) Simple chart output (matplotlib)
-    plt.figure()
-    plt.plot(flagged_current["CollectionDate"], flagged_current["DailyCases"])
-    plt.axhline(limits["uwl"], linestyle="--")
-    plt.axhline(limits["ucl"], linestyle="--")
-    plt.title(f"Daily Cases (FY{current_fy}) vs Baseline SPC Limits (FY{current_fy-1})")
-    plt.xlabel("Date")
-    plt.ylabel("Daily cases")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    chart_path = os.path.join(cfg.charts_dir, f"daily_cases_spc_FY{current_fy}.png")
-    plt.savefig(chart_path, dpi=150)
-    logger.info(f"Chart saved: {chart_path}")
+    report_path = writer.write(
+        summary, cfg.reports_dir, "spc_breach_summary", on_written=lambda p: logger.info(f"Summary report saved: {p}")
+    )
+
+    # Breach cube with subtotals, saved once so dashboards slice the file instead of re-pivoting (see analyse.py)
+    cube = breach_cube(flagged, grouping=cfg.breach_cube_grouping)
+    cube_path = writer.write(
+        cube, cfg.reports_dir, "spc_breach_cube", on_written=lambda p: logger.info(f"Breach cube saved: {p} ({len(cube)} rows)")
+    )
+    return {"summary": summary, "cube": cube, FILES_KEY: [report_path, cube_path]}
+
+
+def _stage_chart(cfg: Config, logger, writer: OutputWriter, flagged, current_fy) -> dict:
+    # 6) Chart output (headless Agg rendering, see charts.py)
+    specs = chart_specs_from_flagged(
+        flagged,
+        cfg.charts_dir,
+        name=f"daily_cases_spc_FY{current_fy}",
+        title=f"Daily Cases (FY{current_fy}) vs Baseline SPC Limits (FY{current_fy-1})",
+    )
+    chart_paths = render_charts(specs, max_workers=cfg.chart_workers or None)
+    for chart_path in chart_paths:
+        logger.info(f"Chart saved: {chart_path}")
+    return {"chart_paths": chart_paths, FILES_KEY: chart_paths}
+
+
+def _extract_cache_key(cfg: Config):
+    # The source tables change under us, so the extract is only reused within the same EXTRACT_TTL_MINUTES window
+    if cfg.extract_ttl_minutes <= 0:
+        return ALWAYS_RUN
+    return int(time.time() // (cfg.extract_ttl_minutes * 60))
+
+
+def build_stages(cfg: Config, logger, writer: OutputWriter, sql_conn=None, http_session=None) -> list[Stage]:
+    """
+    The pipeline as declared stages. params hold the settings each stage depends on and code the modules it calls,
+    so changing either re-runs that stage (and, if its outputs change, everything downstream of it).
+    """
+    def bind(func):
+        return functools.partial(func, cfg, logger, writer)
+
+    # Stages that write files also re-run when the output settings change
+    output = {"format": writer.fmt, "compression": writer.compression, "intermediate": writer.write_intermediate}
+
+    return [
+        Stage(
+            "extract",
+            functools.partial(_stage_extract, cfg, logger, writer, sql_conn=sql_conn, http_session=http_session),
+            outputs=("events_raw", "events_standardised", "daily_extracted"),
+            params={
+                "query": SQL_QUERY,
+                "sql_daily_mode": cfg.sql_daily_mode,
+                "sql_incremental": cfg.sql_incremental,
+                "pipeline_chunk_size": cfg.pipeline_chunk_size,
+                "chunked_duplicate_check": [cfg.chunked_duplicate_check, cfg.chunked_expected_keys],
+                "extract_sources": list(cfg.extract_sources),
+                "compact": cfg.compact_transform,
+                "output": output,
+            },
+            cache_key=lambda: _extract_cache_key(cfg),
+            code=(extract_sql, extract_api, http_cache, event_cache, multi_source, chunked, synthetic,
+                  transform, validate, validation_rules, outputs),
+        ),
+        Stage("transform", bind(_stage_transform), inputs=("events_raw", "events_standardised"), outputs=("events_std",),
+              params={"compact": cfg.compact_transform, "output": output}, code=(transform, outputs)),
+        Stage("validate", bind(_stage_validate), inputs=("events_std",), outputs=("checks",),
+              code=(validate, validation_rules)),
+        Stage("daily", bind(_stage_daily), inputs=("events_std", "daily_extracted"), outputs=("daily",), code=(spc,)),
+        Stage("spc", bind(_stage_spc), inputs=("daily",), outputs=("flagged", "limits", "current_fy"),
+              params={"fy_start_month": cfg.fy_start_month, "run_rules": cfg.spc_run_rules,
+                      "incremental": cfg.spc_incremental, "output": output},
+              code=(spc, spc_rules, spc_multi, daily_store, spc_state, fy_calendar, outputs)),
+        Stage("report", bind(_stage_report), inputs=("flagged",), outputs=("summary", "cube"),
+              params={"cube_grouping": cfg.breach_cube_grouping, "output": output}, code=(analyse, outputs)),
+        Stage("chart", bind(_stage_chart), inputs=("flagged", "current_fy"), outputs=("chart_paths",), code=(charts,)),
+    ]
+
+
+def main(
+    targets: tuple[str, ...] | None = None,
+    force: bool = False,
+    cfg: Config | None = None,
+    sql_conn=None,
+    http_session=None,
+) -> dict:
+    """
+    Runs the pipeline. `targets` limits the run to those stages and what they depend on (e.g. ("spc",));
+    force=True re-runs every stage instead of reusing cached outputs.
+    A long-running caller (service.py) passes its Config and a pooled SQL connection / HTTP session to reuse.
+    """
+    cfg = cfg or Config()
+    logger = get_logger("pipeline")
+    _ensure_dirs(cfg)
+
+    logger.info("Starting pipeline run.")
 
+    # Stage outputs are cached under processed_dir; unchanged stages are skipped and a failed run resumes where it stopped
+    # Files are written on a background thread while the next stage runs; leaving the block waits for them
+    # Each stage's wall/CPU time, rows and memory go to outputs/reports/metrics_YYYYMMDD.jsonl
+    metrics = RunMetrics("pipeline", trace_memory=cfg.trace_memory)
+    with OutputWriter.from_config(cfg) as writer:
+        stages = build_stages(cfg, logger, writer, sql_conn=sql_conn, http_session=http_session)
+        executor = PipelineExecutor(
+            stages, os.path.join(cfg.processed_dir, ".artifacts"), logger=logger, metrics=metrics, wait_for_files=writer.flush
+        )
+        force_stages = tuple(s.name for s in stages) if force or not cfg.pipeline_cache else ()
+        status = executor.run(force=force_stages, targets=targets)
+    logger.info(f"Stage status: {status}")
+    metrics.log_summary(logger)
 
     logger.info("Pipeline run completed successfully.")
+    return status
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,298 @@
+"""
+Dr Nneoma O
+Service mode - keeps the pipeline loaded between runs instead of starting a fresh process for every refresh.
+1. A pool of SQL Server connections (SQLAlchemy QueuePool over pyodbc) and a pooled HTTP session stay warm
+2. Jobs (a set of pipeline stages) run on an in-process schedule, or on demand
+3. A bounded worker pool runs jobs; a job never overlaps with itself, and jobs sharing a stage cache run one at a time.
+   The stage cache and the SPC state live under processed_dir (and the incremental event cache under raw_dir), so a job
+   given its own processed_dir in the schedule (spc=15@data/processed_spc) runs alongside the others
+4. SIGINT/SIGTERM stop scheduling, let running jobs finish and then close the connections (SIGHUP runs every job now)
+5. Optionally serves the SPC query API (query.py) and swaps in fresh results as each job finishes
+
+    python -m src.cli serve                       # schedule from SERVICE_SCHEDULE
+    python -m src.cli serve --every spc=15 --every all=60 --run-now
+    python -m src.cli serve --every spc=15@data/processed_spc --every all=60   # spc and all can run at the same time
+    python -m src.cli serve --query-port 8765
+"""
+import contextlib
+import dataclasses
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .config import Config
+from .logging_utils import get_logger
+
+
+@dataclass
+class Job:
+    """
+    A named pipeline run: `targets` are the stages to bring up to date (None = all),
+    repeated every `interval_minutes` (0 = on demand only).
+    """
+    name: str
+    targets: tuple[str, ...] | None = None
+    interval_minutes: float = 0
+    force: bool = False
+    cfg: Config | None = None  # a job can run against its own Config (e.g. its own processed_dir / stage cache)
+    next_run: float = field(default=0.0, repr=False)
+
+
+def parse_schedule(text: str, cfg: Config | None = None) -> list[Job]:
+    """
+    "all=60,spc=15" -> jobs running those subcommands every N minutes.
+    "spc=15@data/processed_spc" also gives that job its own processed_dir (its own stage cache), built from `cfg`.
+    """
+    from .cli import COMMANDS
+
+    cfg = cfg or Config()
+    jobs = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, minutes = item.partition("=")
+        name = name.strip()
+        minutes, _, processed_dir = minutes.partition("@")
+        processed_dir = processed_dir.strip()
+        if name not in COMMANDS:
+            raise ValueError(f"Unknown job '{name}' in schedule. Use one of {sorted(COMMANDS)}.")
+        try:
+            interval = float(minutes)
+        except ValueError:
+            raise ValueError(f"Schedule entry '{item}' needs an interval in minutes, e.g. {name}=60.") from None
+        job_cfg = dataclasses.replace(cfg, processed_dir=processed_dir) if processed_dir else cfg
+        jobs.append(Job(name, COMMANDS[name], interval, cfg=job_cfg))
+    return jobs
+
+
+class SqlConnectionPool:
+    """
+    Warm pyodbc connections via SQLAlchemy's QueuePool. Connections are checked (pre-ping) before reuse
+    and recycled after `recycle_seconds`, so a dropped server connection is replaced instead of failing a run.
+    """
+
+    def __init__(self, cfg: Config, size: int = 4, recycle_seconds: int = 1800):
+        from sqlalchemy import create_engine
+        from .extract_sql import _build_conn_str, _require_sql_config
+
+        _require_sql_config(cfg)
+        conn_str = _build_conn_str(cfg)
+
+        def connect():
+            import pyodbc
+            return pyodbc.connect(conn_str)
+
+        self.engine = create_engine(
+            "mssql+pyodbc://",
+            creator=connect,
+            pool_size=size,
+            max_overflow=0,
+            pool_pre_ping=True,
+            pool_recycle=recycle_seconds,
+        )
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        A DB-API connection from the pool; it goes back to the pool (not closed) on exit.
+        """
+        conn = self.engine.raw_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def dispose(self) -> None:
+        self.engine.dispose()
+
+
+class PipelineService:
+    def __init__(self, jobs: list[Job], cfg: Config | None = None, max_workers: int | None = None, logger=None):
+        names = [j.name for j in jobs]
+        if len(set(names)) != len(names):
+            raise ValueError("Job names must be unique.")
+        self.cfg = cfg or Config()
+        self.jobs = {j.name: j for j in jobs}
+        self.logger = logger or get_logger("service")
+        self.max_workers = max_workers or self.cfg.service_max_workers
+
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline-job")
+        self._job_locks = {name: threading.Lock() for name in self.jobs}
+        self._cache_locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stop = threading.Event()
+        self._stop_requested = threading.Event()  # set by signal handlers; the main thread does the actual shutdown
+        self._wake = threading.Event()
+        self._scheduler: threading.Thread | None = None
+        self.sql_pool: SqlConnectionPool | None = None
+        self.http_session = None
+        self.on_job_finished: list = []  # callables(job, status) run after each successful job, e.g. a query index reload
+
+    # Warm resources
+
+    def _open_resources(self) -> None:
+        try:
+            self.sql_pool = SqlConnectionPool(self.cfg, size=self.cfg.sql_pool_size)
+            self.logger.info(f"SQL connection pool ready (size {self.cfg.sql_pool_size}).")
+        except Exception as ex:
+            self.logger.info(f"SQL connection pool not used ({ex}).")
+        if self.cfg.api_base_url:
+            from .extract_api import make_session
+            self.http_session = make_session(self.cfg, pool_size=max(self.cfg.api_max_workers, 1))
+            self.logger.info("HTTP session ready.")
+
+    def _close_resources(self) -> None:
+        if self.sql_pool is not None:
+            self.sql_pool.dispose()
+            self.sql_pool = None
+        if self.http_session is not None:
+            self.http_session.close()
+            self.http_session = None
+
+    # Running jobs
+
+    def _cache_keys(self, cfg: Config) -> list[str]:
+        # The stage cache manifest and the SPC state are per processed_dir; an incremental extract also rewrites
+        # the event cache under raw_dir
+        keys = [os.path.abspath(cfg.processed_dir)]
+        if cfg.sql_incremental:
+            from .event_cache import event_cache_dir
+            keys.append(os.path.abspath(event_cache_dir(cfg)))
+        return sorted(set(keys))
+
+    def _cache_lock(self, cfg: Config) -> contextlib.ExitStack:
+        # Jobs writing the same caches are serialised; locks are always taken in sorted order, so two jobs never deadlock
+        stack = contextlib.ExitStack()
+        with self._locks_guard:
+            locks = [self._cache_locks.setdefault(key, threading.Lock()) for key in self._cache_keys(cfg)]
+        for lock in locks:
+            stack.enter_context(lock)
+        return stack
+
+    def _run_job(self, job: Job, lock: threading.Lock) -> dict | None:
+        from .run_pipeline import main as run_pipeline
+
+        cfg = job.cfg or self.cfg
+        t0 = time.perf_counter()
+        try:
+            with self._cache_lock(cfg), contextlib.ExitStack() as stack:
+                conn = None
+                if self.sql_pool is not None:
+                    try:
+                        conn = stack.enter_context(self.sql_pool.connection())
+                    except Exception as ex:
+                        self.logger.info(f"Job '{job.name}': no pooled SQL connection ({ex}).")
+                status = run_pipeline(
+                    targets=job.targets, force=job.force, cfg=cfg, sql_conn=conn, http_session=self.http_session
+                )
+            self.logger.info(f"Job '{job.name}' finished in {time.perf_counter() - t0:.2f}s.")
+            for callback in self.on_job_finished:
+                callback(job, status)
+            return status
+        except Exception:
+            self.logger.exception(f"Job '{job.name}' failed.")
+            return None
+        finally:
+            lock.release()
+
+    def trigger(self, name: str) -> Future | None:
+        """
+        Runs a job now. Returns its Future, or None if that job is still running (runs never overlap) or the service is stopping.
+        """
+        if name not in self.jobs:
+            raise ValueError(f"Unknown job '{name}'. Jobs: {sorted(self.jobs)}")
+        if self._stop.is_set():
+            return None
+        lock = self._job_locks[name]
+        if not lock.acquire(blocking=False):
+            self.logger.info(f"Job '{name}' is still running; skipped this run.")
+            return None
+        try:
+            return self._pool.submit(self._run_job, self.jobs[name], lock)
+        except RuntimeError:
+            lock.release()
+            return None
+
+    def trigger_all(self) -> None:
+        for name in self.jobs:
+            self.trigger(name)
+
+    # Scheduling
+
+    def _schedule_loop(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due = [j for j in self.jobs.values() if j.interval_minutes > 0 and j.next_run <= now]
+            for job in due:
+                job.next_run = now + job.interval_minutes * 60
+                self.trigger(job.name)
+            upcoming = [j.next_run for j in self.jobs.values() if j.interval_minutes > 0]
+            timeout = max(0.0, min(upcoming) - time.monotonic()) if upcoming else None
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _cache_groups(self) -> dict[str, list[str]]:
+        # Job names per cache directory: jobs in one group never run at the same time
+        groups: dict[str, list[str]] = {}
+        for job in self.jobs.values():
+            for key in self._cache_keys(job.cfg or self.cfg):
+                groups.setdefault(key, []).append(job.name)
+        return groups
+
+    def start(self, run_now: bool = False) -> None:
+        self._open_resources()
+        now = time.monotonic()
+        for job in self.jobs.values():
+            job.next_run = now if run_now else now + job.interval_minutes * 60
+        if run_now:
+            # On-demand-only jobs are included in the first run too
+            for job in self.jobs.values():
+                if job.interval_minutes <= 0:
+                    self.trigger(job.name)
+        self._scheduler = threading.Thread(target=self._schedule_loop, name="pipeline-scheduler", daemon=True)
+        self._scheduler.start()
+        self.logger.info(
+            f"Service started: {len(self.jobs)} job(s), {self.max_workers} worker(s): "
+            + ", ".join(f"{j.name} every {j.interval_minutes:g} min" if j.interval_minutes > 0 else f"{j.name} on demand"
+                        for j in self.jobs.values())
+        )
+        for cache_dir, names in self._cache_groups().items():
+            if len(names) > 1 and self.max_workers > 1:
+                self.logger.info(
+                    f"Jobs {names} share the cache in {cache_dir}, so they run one at a time; "
+                    f"give a job its own processed_dir in the schedule (e.g. {names[-1]}=15@data/processed_{names[-1]})."
+                )
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stops scheduling, waits for running jobs (queued runs are cancelled) and closes the warm connections.
+        """
+        if self._stop.is_set():
+            return
+        self.logger.info("Service stopping; waiting for running jobs.")
+        self._stop.set()
+        self._wake.set()
+        if self._scheduler is not None:
+            self._scheduler.join(timeout)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._close_resources()
+        self.logger.info("Service stopped.")
+
+    def serve_forever(self, run_now: bool = False) -> None:
+        """
+        Starts the service and blocks until SIGINT/SIGTERM. Must be called from the main thread.
+        """
+        signal.signal(signal.SIGINT, lambda *_: self._stop_requested.set())
+        signal.signal(signal.SIGTERM, lambda *_: self._stop_requested.set())
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *_: self.trigger_all())
+        self.start(run_now=run_now)
+        try:
+            while not self._stop_requested.wait(1.0):
+                pass
+        finally:
+            self.stop()
@@ -5,7 +5,10 @@ SPC values - needed for analysis to compare current to previous year values
 import pandas as pd
 import numpy as np
 
-UK_FY_START_MONTH = 4  # April
+from .fy_calendar import UK_FY_START_MONTH, financial_year
+from .spc_rules import run_rule_hits
+from .transform import ensure_datetime
+SPC_STATUSES = ["Within Expected Range", "2 SD Warning", "3 SD Breach"]
 
 def daily_counts(df: pd.DataFrame) -> pd.DataFrame:
     if "CollectionDate" not in df.columns:
@@ -18,13 +21,13 @@ def daily_counts(df: pd.DataFrame) -> pd.DataFrame:
           .reset_index()
     )
 
-    out["CollectionDate"] = pd.to_datetime(out["CollectionDate"], errors="coerce")
+    out["CollectionDate"] = ensure_datetime(out["CollectionDate"])
     return out.sort_values("CollectionDate")
 
 
 def add_zero_days(daily_df: pd.DataFrame, start_date=None, end_date=None) -> pd.DataFrame:
     d = daily_df.copy()
-    d["CollectionDate"] = pd.to_datetime(d["CollectionDate"], errors="coerce")
+    d["CollectionDate"] = ensure_datetime(d["CollectionDate"])
 
     if start_date is None:
         start_date = d["CollectionDate"].min()
@@ -60,14 +63,18 @@ def uk_financial_year_for_date(dt: pd.Timestamp) -> int:
     return dt.year + 1 if dt.month >= UK_FY_START_MONTH else dt.year
 
 
-def add_financial_year(daily_df: pd.DataFrame) -> pd.DataFrame:
+def add_financial_year(daily_df: pd.DataFrame, start_month: int = UK_FY_START_MONTH) -> pd.DataFrame:
     d = daily_df.copy()
-    d["CollectionDate"] = pd.to_datetime(d["CollectionDate"], errors="coerce")
-    d["FinancialYear"] = d["CollectionDate"].apply(uk_financial_year_for_date)
+    d["CollectionDate"] = ensure_datetime(d["CollectionDate"])
+    d["FinancialYear"] = financial_year(d["CollectionDate"], start_month)
     return d
 
 
-def split_baseline_and_current(daily_df: pd.DataFrame, current_fy: int | None = None) -> tuple[pd.DataFrame, pd.DataFrame, int]:
+def split_baseline_and_current(
+    daily_df: pd.DataFrame,
+    current_fy: int | None = None,
+    start_month: int = UK_FY_START_MONTH,
+) -> tuple[pd.DataFrame, pd.DataFrame, int]:
     """
     Splits daily data into:
       - baseline FY (previous FY)
@@ -75,11 +82,11 @@ def split_baseline_and_current(daily_df: pd.DataFrame, current_fy: int | None =
 
     If current_fy is None, it uses the FY of the latest date present.
     """
-    d = add_financial_year(daily_df)
+    d = add_financial_year(daily_df, start_month)
 
     if current_fy is None:
         latest_date = d["CollectionDate"].max()
-        current_fy = uk_financial_year_for_date(pd.to_datetime(latest_date))
+        current_fy = int(financial_year(latest_date, start_month))
 
     baseline_fy = current_fy - 1
 
@@ -89,18 +96,21 @@ def split_baseline_and_current(daily_df: pd.DataFrame, current_fy: int | None =
     return baseline, current, current_fy
 
 
-def spc_limits_from_baseline(baseline_daily_df: pd.DataFrame) -> dict:
+def spc_limits_from_counts(counts: np.ndarray) -> dict:
     """
-    Calculates SPC limits from baseline daily cases.
+    Calculates SPC limits along the last axis of a count array.
+    A 1-D array of daily counts gives float limits; a series x day matrix gives one limit per series.
     Uses sample standard deviation (ddof=1), aligned with common SPC practice.
     """
-    if baseline_daily_df.empty:
-        raise ValueError("Baseline dataframe is empty. Cannot calculate SPC limits.")
-
-    x = baseline_daily_df["DailyCases"].astype(float).to_numpy()
+    x = np.asarray(counts, dtype=float)
+    n = x.shape[-1]
+    if n == 0:
+        raise ValueError("Baseline is empty. Cannot calculate SPC limits.")
 
-    mean = float(np.mean(x))
-    std = float(np.std(x, ddof=1)) if len(x) > 1 else 0.0
+    mean = x.mean(axis=-1)
+    std = x.std(axis=-1, ddof=1) if n > 1 else np.zeros_like(mean)
+    if x.ndim == 1:
+        mean, std = float(mean), float(std)
 
     return {
         "mean": mean,
@@ -110,24 +120,48 @@ def spc_limits_from_baseline(baseline_daily_df: pd.DataFrame) -> dict:
     }
 
 
-def flag_breaches_against_limits(daily_df: pd.DataFrame, limits: dict) -> pd.DataFrame:
+def spc_limits_from_baseline(baseline_daily_df: pd.DataFrame) -> dict:
+    """
+    Calculates SPC limits from baseline daily cases.
+    Uses sample standard deviation (ddof=1), aligned with common SPC practice.
+    """
+    if baseline_daily_df.empty:
+        raise ValueError("Baseline dataframe is empty. Cannot calculate SPC limits.")
+
+    return spc_limits_from_counts(baseline_daily_df["DailyCases"].to_numpy())
+
+
+def spc_status_codes(counts: np.ndarray, limits: dict) -> np.ndarray:
+    """
+    Index into SPC_STATUSES for each count: 0 within range, 1 at/above UWL, 2 at/above UCL.
+    For a series x day matrix the limits may be per-series arrays.
+    """
+    counts = np.asarray(counts)
+    uwl = np.asarray(limits["uwl"])
+    ucl = np.asarray(limits["ucl"])
+    if counts.ndim == 2 and uwl.ndim == 1:
+        uwl, ucl = uwl[:, None], ucl[:, None]
+
+    return np.select([counts >= ucl, counts >= uwl], [2, 1], default=0)
+
+
+def flag_breaches_against_limits(daily_df: pd.DataFrame, limits: dict, run_rules: bool = False) -> pd.DataFrame:
     """
     Applies baseline limits to a (typically current FY) daily series.
+    With run_rules, the lower limits and one True/False column per run rule are added too (see spc_rules.py).
     """
     d = daily_df.copy()
     d["Mean"] = limits["mean"]
     d["UWL_2SD"] = limits["uwl"]
     d["UCL_3SD"] = limits["ucl"]
 
-    d["SPCStatus"] = np.select(
-        [
-            d["DailyCases"] >= d["UCL_3SD"],
-            d["DailyCases"] >= d["UWL_2SD"],
-        ],
-        [
-            "3 SD Breach",
-            "2 SD Warning",
-        ],
-        default="Within Expected Range",
-    )
+    counts = d["DailyCases"].to_numpy()
+    codes = spc_status_codes(counts, limits)
+    d["SPCStatus"] = np.array(SPC_STATUSES, dtype=object)[codes]
+
+    if run_rules:
+        d["LWL_2SD"] = limits["mean"] - 2 * limits["std"]
+        d["LCL_3SD"] = limits["mean"] - 3 * limits["std"]
+        for rule, hits in run_rule_hits(counts, limits).items():
+            d[rule] = hits
     return d
@@ -0,0 +1,145 @@
+"""
+Multi-series SPC - the same baseline/current FY logic as spc.py, but for every series (e.g. Department x Location) at once.
+Counts are laid out as a series x day matrix (see daily_store.py), so zero-filling, FY splits, limits and flags are whole-array NumPy operations
+instead of a Python loop over series.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .daily_store import DailySeriesStore
+from .fy_calendar import UK_FY_START_MONTH, financial_year
+from .spc import SPC_STATUSES, spc_limits_from_counts, spc_status_codes
+from .spc_rules import run_rule_hits
+
+DEFAULT_SERIES_COLS = ("Department", "Location")
+
+
+def grouped_spc(
+    data,
+    series_cols=DEFAULT_SERIES_COLS,
+    current_fy: int | None = None,
+    start_month: int = UK_FY_START_MONTH,
+    run_rules: bool = False,
+) -> pd.DataFrame:
+    """
+    Baseline (previous FY) limits and current FY breach flags for every series, in long format:
+    one row per series per current-FY day with DailyCases, Mean, UWL_2SD, UCL_3SD and SPCStatus
+    (plus the lower limits and run rule columns with run_rules).
+
+    `data` is either an event DataFrame (counted per `series_cols`) or a DailySeriesStore.
+    Zero days come from the store's day axis, which spans the first to the last event date across all series.
+    If current_fy is None, it uses the FY of the latest date present across all series.
+    """
+    store = data if isinstance(data, DailySeriesStore) else DailySeriesStore.from_events(data, series_cols)
+
+    if current_fy is None:
+        current_fy = int(financial_year(store.end, start_month))
+
+    baseline = store.counts[:, store.fy_window(current_fy - 1, start_month)]
+    cur = store.fy_window(current_fy, start_month)
+    current = store.counts[:, cur]
+    if baseline.shape[1] == 0:
+        raise ValueError("Baseline dataframe is empty. Cannot calculate SPC limits.")
+
+    limits = spc_limits_from_counts(baseline)
+    return spc_long_frame(store.keys, store.days[cur], current, limits, current_fy, run_rules)
+
+
+def _per_day(values: np.ndarray, shape: tuple) -> np.ndarray:
+    # Per-series limits are repeated across the days; per-day limits are already the right shape
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[:, None]
+    return np.broadcast_to(values, shape).ravel()
+
+
+def spc_long_frame(
+    keys: pd.DataFrame,
+    days: np.ndarray,
+    counts: np.ndarray,
+    limits: dict,
+    fy,
+    run_rules: bool = False,
+) -> pd.DataFrame:
+    """
+    Flags a series x day count block against limits and lays it out in long format
+    (series columns, CollectionDate, FinancialYear, DailyCases, Mean, UWL_2SD, UCL_3SD, SPCStatus).
+    Limits are either one value per series or a full series x day array; fy is a scalar or one label per day.
+    With run_rules, LWL_2SD, LCL_3SD and one True/False column per run rule follow (rules run along each series' days).
+    """
+    status = spc_status_codes(counts, limits)
+
+    n_series, n_days = counts.shape
+    series_idx = np.repeat(np.arange(n_series), n_days)
+
+    out = keys.iloc[series_idx].reset_index(drop=True)
+    out["CollectionDate"] = np.tile(days, n_series).astype("datetime64[ns]")
+    out["FinancialYear"] = np.tile(np.broadcast_to(fy, n_days), n_series)
+    out["DailyCases"] = counts.ravel()
+    out["Mean"] = _per_day(limits["mean"], counts.shape)
+    out["UWL_2SD"] = _per_day(limits["uwl"], counts.shape)
+    out["UCL_3SD"] = _per_day(limits["ucl"], counts.shape)
+    out["SPCStatus"] = pd.Categorical.from_codes(status.ravel(), categories=SPC_STATUSES)
+
+    if run_rules:
+        mean, std = out["Mean"].to_numpy(), _per_day(limits["std"], counts.shape)
+        out["LWL_2SD"] = mean - 2 * std
+        out["LCL_3SD"] = mean - 3 * std
+        for rule, hits in run_rule_hits(counts, limits).items():
+            out[rule] = hits.ravel()
+    return out
+
+
+def backfill_spc(
+    data,
+    series_cols=DEFAULT_SERIES_COLS,
+    start_month: int = UK_FY_START_MONTH,
+    run_rules: bool = False,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    SPC limits and breach flags for every FY in the history in one pass: each FY is flagged
+    against limits from the FY before it (the first FY in the data has no baseline, so it is only used as one).
+
+    Returns (flagged days in long format for every FY that has a baseline,
+             limits table with one row per series per FY: FinancialYear, BaselineFY, Mean, Std, UWL_2SD, UCL_3SD).
+    """
+    store = data if isinstance(data, DailySeriesStore) else DailySeriesStore.from_events(data, series_cols)
+
+    fy = financial_year(store.days, start_month)
+    # FYs are contiguous runs on the day axis, so per-FY sums are a single reduceat over the run starts
+    starts = np.flatnonzero(np.r_[True, fy[1:] != fy[:-1]])
+    fys = fy[starts]
+    if len(fys) < 2:
+        raise ValueError("Backfill needs at least two financial years of data.")
+
+    x = np.asarray(store.counts, dtype=float)
+    n = np.diff(np.r_[starts, store.n_days])
+    mean = np.add.reduceat(x, starts, axis=1) / n
+    fy_idx = np.repeat(np.arange(len(fys)), n)
+    m2 = np.add.reduceat((x - mean[:, fy_idx]) ** 2, starts, axis=1)
+    std = np.where(n > 1, np.sqrt(m2 / np.maximum(n - 1, 1)), 0.0)
+
+    # Limits for FY k come from FY k-1; days in the first FY have no baseline and are left out
+    flagged_days = fy_idx > 0
+    base_idx = fy_idx[flagged_days] - 1
+    limits = {
+        "mean": mean[:, base_idx],
+        "std": std[:, base_idx],
+        "uwl": mean[:, base_idx] + 2 * std[:, base_idx],
+        "ucl": mean[:, base_idx] + 3 * std[:, base_idx],
+    }
+    flagged = spc_long_frame(
+        store.keys, store.days[flagged_days], np.asarray(store.counts)[:, flagged_days], limits, fy[flagged_days], run_rules
+    )
+
+    n_series, n_fy = store.n_series, len(fys) - 1
+    series_idx = np.repeat(np.arange(n_series), n_fy)
+    limits_table = store.keys.iloc[series_idx].reset_index(drop=True)
+    limits_table["FinancialYear"] = np.tile(fys[1:], n_series)
+    limits_table["BaselineFY"] = np.tile(fys[:-1], n_series)
+    limits_table["Mean"] = mean[:, :-1].ravel()
+    limits_table["Std"] = std[:, :-1].ravel()
+    limits_table["UWL_2SD"] = limits_table["Mean"] + 2 * limits_table["Std"]
+    limits_table["UCL_3SD"] = limits_table["Mean"] + 3 * limits_table["Std"]
+    return flagged, limits_table
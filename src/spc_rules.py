@@ -0,0 +1,107 @@
+"""
+SPC run rules - the special-cause patterns beyond a single point over the upper limits
+(Western Electric / NHS Making Data Count style), for one series or a whole series x day matrix at once.
+1. Lower limits: a point below the 2 SD warning or 3 SD control limit
+2. Shift: a run of `shift_length` or more points all above, or all below, the mean
+3. Trend: `trend_length` or more points each higher (or each lower) than the one before
+4. Two of three: 2 of any 3 consecutive points beyond the same 2 SD limit
+The rules are rolling counts over short windows (a run of L points is a window of L that is all True), built from
+shifted whole-array adds, so there is no loop over points or series. Every point in a qualifying run or window
+is marked, as on an SPC chart. A point exactly on the mean, or equal to the
+point before, ends a shift or trend. Upper limits count a point that equals them (as SPCStatus does); lower limits
+must be passed strictly, so a flat series (SD 0) is not flagged low on every day.
+Rules only look at the days passed in (e.g. the current FY), not across the boundary.
+"""
+
+import numpy as np
+
+# Rule names double as the column names added to flagged frames
+RUN_RULES = ("BelowLWL", "BelowLCL", "ShiftAbove", "ShiftBelow", "TrendUp", "TrendDown", "TwoOfThreeHigh", "TwoOfThreeLow")
+
+
+def window_counts(mask: np.ndarray, window: int) -> np.ndarray:
+    """
+    Number of Trues in each full window of `window` consecutive points along the last axis
+    (last axis length n - window + 1; entry s covers points s .. s + window - 1).
+    """
+    m = np.asarray(mask, dtype=bool)
+    width = max(m.shape[-1] - window + 1, 0)
+    out = np.zeros(m.shape[:-1] + (width,), dtype=np.uint8 if window < 256 else np.int32)
+    # One shifted add per position in the window - the loop is over the window, never over points or series
+    for offset in range(window):
+        out += m[..., offset:offset + width]
+    return out
+
+
+def in_hit_window(mask: np.ndarray, k: int, window: int) -> np.ndarray:
+    """
+    Marks the True points of `mask` that sit inside any window of `window` consecutive points holding at least k Trues.
+    With k == window this is every point of a run at least `window` long.
+    """
+    m = np.asarray(mask, dtype=bool)
+    out = np.zeros(m.shape, dtype=bool)
+    width = m.shape[-1] - window + 1
+    if width < 1:
+        return out
+    hit = window_counts(m, window) >= k
+    # Spread each qualifying window back over the points it covers
+    for offset in range(window):
+        out[..., offset:offset + width] |= hit
+    return out & m
+
+
+def _trend(steps: np.ndarray, trend_length: int, shape: tuple) -> np.ndarray:
+    # steps[..., j] compares point j + 1 with point j; a trend of L points is a run of L - 1 steps in the same direction
+    out = np.zeros(shape, dtype=bool)
+    if shape[-1] < 2:
+        return out
+    in_trend = in_hit_window(steps, trend_length - 1, trend_length - 1)
+    out[..., 1:] |= in_trend
+    out[..., :-1] |= in_trend
+    return out
+
+
+def _per_series(values, counts: np.ndarray) -> np.ndarray:
+    # Per-series limits for a series x day matrix become a column so they broadcast across the days
+    values = np.asarray(values, dtype=float)
+    if counts.ndim == 2 and values.ndim == 1:
+        return values[:, None]
+    return values
+
+
+def _cutoff(limit: np.ndarray, counts: np.ndarray, round_up: bool) -> np.ndarray:
+    # Integer counts compare the same against a whole-number cutoff (x > m  <=>  x > floor(m); x >= m  <=>  x >= ceil(m)),
+    # and an int-to-int comparison over the matrix is much cheaper than int-to-float.
+    # A NaN or infinite limit has no integer equivalent, so those limits keep the float comparison (NaN never flags)
+    limit = np.asarray(limit, dtype=float)
+    if not np.issubdtype(counts.dtype, np.integer) or not np.isfinite(limit).all():
+        return limit
+    info = np.iinfo(counts.dtype)
+    whole = np.ceil(limit) if round_up else np.floor(limit)
+    return np.clip(whole, info.min, info.max).astype(counts.dtype)
+
+
+def run_rule_hits(counts: np.ndarray, limits: dict, shift_length: int = 7, trend_length: int = 6) -> dict:
+    """
+    Boolean hits per rule (see RUN_RULES), each the same shape as `counts` (one series' days, or series x day).
+    `limits` needs "mean" and "std", as scalars, one value per series, or a full series x day array;
+    the lower limits are mean - 2 SD and mean - 3 SD.
+    """
+    if shift_length < 2 or trend_length < 3:
+        raise ValueError("shift_length must be at least 2 and trend_length at least 3.")
+    x = np.asarray(counts)
+    mean = _per_series(limits["mean"], x)
+    std = _per_series(limits["std"], x)
+    below_lwl = x < _cutoff(mean - 2 * std, x, round_up=True)
+    uwl = _cutoff(mean + 2 * std, x, round_up=True)
+
+    return {
+        "BelowLWL": below_lwl,
+        "BelowLCL": x < _cutoff(mean - 3 * std, x, round_up=True),
+        "ShiftAbove": in_hit_window(x > _cutoff(mean, x, round_up=False), shift_length, shift_length),
+        "ShiftBelow": in_hit_window(x < _cutoff(mean, x, round_up=True), shift_length, shift_length),
+        "TrendUp": _trend(x[..., 1:] > x[..., :-1], trend_length, x.shape),
+        "TrendDown": _trend(x[..., 1:] < x[..., :-1], trend_length, x.shape),
+        "TwoOfThreeHigh": in_hit_window(x >= uwl, 2, 3),
+        "TwoOfThreeLow": in_hit_window(below_lwl, 2, 3),
+    }
@@ -0,0 +1,348 @@
+"""
+SPC state - persisted per-series SPC state so a daily run only processes the days it has not seen yet.
+For each series it keeps the frozen baseline limits, running (Welford-style) count/mean/M2 aggregates for the
+current FY, and the last processed date. At the start of a new FY the completed year's running aggregates become
+the new baseline limits. If late corrections change days that were already processed, invalidate and rebuild.
+incremental_spc also keeps the current FY flagged so far next to the state, which the pipeline's spc stage uses
+(SPC_INCREMENTAL); it spots late corrections itself and rebuilds.
+"""
+
+import json
+import os
+import shutil
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .daily_store import DailySeriesStore
+from .spc import spc_limits_from_counts
+from .fy_calendar import UK_FY_START_MONTH, financial_year, fy_bounds
+from .spc_multi import spc_long_frame
+
+STATE_FILENAME = "state.json"
+SERIES_FILENAME = "series.parquet"
+FLAGGED_FILENAME = "flagged_current.parquet"
+
+
+@dataclass
+class SPCState:
+    """
+    keys: one row per series (same columns as the DailySeriesStore keys).
+    limits: baseline mean/std/uwl/ucl, one value per series, frozen for the current FY.
+    n_days: days of the current FY processed so far (shared by every series, as the day axis is shared).
+    run_mean / run_m2: running mean and sum of squared deviations of daily counts in the current FY.
+    start_month: the FY start month the FY labels and boundaries were computed with.
+    """
+    keys: pd.DataFrame
+    current_fy: int
+    last_processed: np.datetime64
+    limits: dict
+    n_days: int
+    run_mean: np.ndarray
+    run_m2: np.ndarray
+    start_month: int = UK_FY_START_MONTH
+
+    def current_fy_limits(self) -> dict:
+        """
+        Limits from the current FY so far (these become the baseline at the next FY boundary).
+        """
+        std = np.sqrt(self.run_m2 / (self.n_days - 1)) if self.n_days > 1 else np.zeros_like(self.run_mean)
+        mean = self.run_mean.copy()
+        return {"mean": mean, "std": std, "uwl": mean + 2 * std, "ucl": mean + 3 * std}
+
+
+def _update_running(state: SPCState, block: np.ndarray) -> None:
+    # Chan et al. parallel update: merges the new block's count/mean/M2 into the running aggregates in one step
+    n_b = block.shape[1]
+    if n_b == 0:
+        return
+    x = block.astype(float)
+    mean_b = x.mean(axis=1)
+    m2_b = ((x - mean_b[:, None]) ** 2).sum(axis=1)
+
+    n = state.n_days + n_b
+    delta = mean_b - state.run_mean
+    state.run_mean = state.run_mean + delta * n_b / n
+    state.run_m2 = state.run_m2 + m2_b + delta ** 2 * state.n_days * n_b / n
+    state.n_days = n
+
+
+def _align_keys(state: SPCState, store_keys: pd.DataFrame) -> np.ndarray:
+    """
+    Extends the state with any series that appear for the first time in the store, and returns
+    the state row for each store series. A new series had no events on the days already processed,
+    so it joins with zero baseline limits and zero running aggregates.
+    """
+    cols = list(state.keys.columns)
+    if not cols:
+        return np.zeros(len(store_keys), dtype=np.int64)
+
+    if list(store_keys.columns) != cols:
+        raise ValueError(f"Store series columns {list(store_keys.columns)} do not match the SPC state {cols}.")
+
+    matched = store_keys.merge(
+        state.keys.reset_index(names="_row"), on=cols, how="left"
+    )["_row"]
+
+    new = matched.isna().to_numpy()
+    if new.any():
+        n_new = int(new.sum())
+        matched[new] = np.arange(len(state.keys), len(state.keys) + n_new)
+        state.keys = pd.concat([state.keys, store_keys[new]], ignore_index=True)
+        state.limits = {k: np.concatenate([v, np.zeros(n_new)]) for k, v in state.limits.items()}
+        state.run_mean = np.concatenate([state.run_mean, np.zeros(n_new)])
+        state.run_m2 = np.concatenate([state.run_m2, np.zeros(n_new)])
+
+    return matched.to_numpy().astype(np.int64)
+
+
+def build_spc_state(
+    store: DailySeriesStore,
+    current_fy: int | None = None,
+    start_month: int = UK_FY_START_MONTH,
+) -> tuple[SPCState, pd.DataFrame]:
+    """
+    Builds the state from scratch from a store holding the full history, and returns
+    (state, flagged current-FY days in long format).
+    """
+    if current_fy is None:
+        current_fy = int(financial_year(store.end, start_month))
+
+    limits = spc_limits_from_counts(store.counts[:, store.fy_window(current_fy - 1, start_month)])
+    cur = store.fy_window(current_fy, start_month)
+    block = np.asarray(store.counts[:, cur])
+
+    state = SPCState(
+        keys=store.keys.reset_index(drop=True),
+        current_fy=current_fy,
+        last_processed=store.end,
+        limits=limits,
+        n_days=0,
+        run_mean=np.zeros(store.n_series),
+        run_m2=np.zeros(store.n_series),
+        start_month=start_month,
+    )
+    _update_running(state, block)
+    return state, spc_long_frame(state.keys, store.days[cur], block, limits, current_fy)
+
+
+def update_spc_state(state: SPCState, store: DailySeriesStore) -> pd.DataFrame:
+    """
+    Flags only the days after state.last_processed up to store.end, updates the running aggregates
+    in place, and returns the newly flagged days in long format.
+
+    The store only needs to cover the new days (e.g. built from an incremental extract); days
+    between last_processed and the store's first day count as zero-case days. When the new days
+    cross into a new FY, the completed FY's running aggregates become the baseline limits.
+    """
+    first_new = state.last_processed + 1
+    if store.end < first_new:
+        return spc_long_frame(state.keys, np.array([], dtype="datetime64[D]"),
+                              np.zeros((len(state.keys), 0), dtype=np.int32), state.limits, state.current_fy)
+
+    rows = _align_keys(state, store.keys)
+
+    # I lay the new days out on their own zero-filled block, so gaps before the store's first day are zeros
+    days = first_new + np.arange(int((store.end - first_new).astype(np.int64)) + 1)
+    block = np.zeros((len(state.keys), len(days)), dtype=np.int32)
+    w = store.window(pd.Timestamp(first_new), pd.Timestamp(store.end))
+    offset = int((store.epoch + w.start - first_new).astype(np.int64))
+    block[rows, offset:offset + (w.stop - w.start)] = store.counts[:, w]
+
+    fy = financial_year(days, state.start_month)
+    parts = []
+    for seg_fy in np.unique(fy):
+        seg = fy == seg_fy
+        if seg_fy != state.current_fy:
+            if seg_fy == state.current_fy + 1:
+                state.limits = state.current_fy_limits()
+            else:
+                # More than a full FY was skipped, so there are no running aggregates for the new baseline year
+                raise ValueError(
+                    f"SPC state is at FY{state.current_fy} but new data starts in FY{seg_fy}; rebuild the state."
+                )
+            state.current_fy = int(seg_fy)
+            state.n_days = 0
+            state.run_mean = np.zeros(len(state.keys))
+            state.run_m2 = np.zeros(len(state.keys))
+
+        parts.append(spc_long_frame(state.keys, days[seg], block[:, seg], state.limits, state.current_fy))
+        _update_running(state, block[:, seg])
+
+    state.last_processed = days[-1]
+    return pd.concat(parts, ignore_index=True)
+
+
+def save_spc_state(state: SPCState, path: str) -> None:
+    os.makedirs(path, exist_ok=True)
+    series = state.keys.copy()
+    series["BaselineMean"] = state.limits["mean"]
+    series["BaselineStd"] = state.limits["std"]
+    series["RunMean"] = state.run_mean
+    series["RunM2"] = state.run_m2
+    series.to_parquet(os.path.join(path, SERIES_FILENAME), index=False)
+
+    meta = {
+        "series_cols": list(state.keys.columns),
+        "current_fy": state.current_fy,
+        "last_processed": str(state.last_processed),
+        "n_days": state.n_days,
+        "start_month": state.start_month,
+    }
+    # The JSON file is written last and swapped in atomically, so it only ever points at a complete series file
+    tmp = os.path.join(path, STATE_FILENAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, STATE_FILENAME))
+
+
+def load_spc_state(path: str) -> SPCState | None:
+    """
+    Returns the saved state, or None if there is none (never built, or invalidated).
+    """
+    meta_path = os.path.join(path, STATE_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    series = pd.read_parquet(os.path.join(path, SERIES_FILENAME))
+
+    mean = series["BaselineMean"].to_numpy()
+    std = series["BaselineStd"].to_numpy()
+    return SPCState(
+        keys=series[meta["series_cols"]].reset_index(drop=True),
+        current_fy=int(meta["current_fy"]),
+        last_processed=np.datetime64(meta["last_processed"], "D"),
+        limits={"mean": mean, "std": std, "uwl": mean + 2 * std, "ucl": mean + 3 * std},
+        n_days=int(meta["n_days"]),
+        run_mean=series["RunMean"].to_numpy(),
+        run_m2=series["RunM2"].to_numpy(),
+        start_month=int(meta.get("start_month", UK_FY_START_MONTH)),
+    )
+
+
+def invalidate_spc_state(path: str, since=None) -> bool:
+    """
+    Drops the saved state so the next run rebuilds it from the full history.
+    With `since` (the earliest corrected date), the state is only dropped if that date
+    was already processed. Returns True if the state was removed.
+    """
+    state = load_spc_state(path)
+    if state is None:
+        return False
+    if since is not None and np.datetime64(pd.Timestamp(since), "D") > state.last_processed:
+        return False
+    shutil.rmtree(path)
+    return True
+
+
+def refresh_spc_state(
+    path: str,
+    store: DailySeriesStore,
+    full_store=None,
+    start_month: int = UK_FY_START_MONTH,
+) -> pd.DataFrame:
+    """
+    Loads the state at `path`, flags the new days in `store` and saves it again, returning the newly flagged days.
+    If there is no saved state (or it was built with another FY start month), it is built from `full_store`
+    (or `store` if that already holds the full history).
+    """
+    state = load_spc_state(path)
+    if state is None or state.start_month != start_month:
+        state, flagged = build_spc_state(full_store if full_store is not None else store, start_month=start_month)
+    else:
+        flagged = update_spc_state(state, store)
+    save_spc_state(state, path)
+    return flagged
+
+
+def _store_rows(store: DailySeriesStore, keys: pd.DataFrame) -> np.ndarray:
+    # Store row for each series in `keys` (-1 where the store does not hold the series)
+    cols = list(keys.columns)
+    if not cols:
+        return np.zeros(len(keys), dtype=np.int64)
+    matched = keys.merge(store.keys.reset_index(names="_row"), on=cols, how="left")["_row"]
+    return matched.fillna(-1).to_numpy().astype(np.int64)
+
+
+def _corrected(state: SPCState, flagged: pd.DataFrame, store: DailySeriesStore) -> bool:
+    """
+    True if the store disagrees with what the state has already processed: a count on a day already flagged,
+    or (when the store holds the whole baseline FY) the baseline mean. Days the store does not cover are not checked.
+    """
+    dates = flagged["CollectionDate"].to_numpy().astype("datetime64[D]")
+    offsets = (dates - store.epoch).astype(np.int64)
+    inside = (offsets >= 0) & (offsets < store.n_days)
+    series_cols = list(state.keys.columns)
+    rows = _store_rows(store, flagged[series_cols]) if series_cols else np.zeros(len(flagged), dtype=np.int64)
+    stored = np.zeros(len(flagged), dtype=np.int64)
+    held = inside & (rows >= 0)
+    stored[held] = store.counts[rows[held], offsets[held]]
+    if (stored[inside] != flagged["DailyCases"].to_numpy()[inside]).any():
+        return True
+
+    base_start, _ = fy_bounds(state.current_fy - 1, state.start_month)
+    if store.epoch > np.datetime64(base_start, "D"):
+        return False
+    rows = _store_rows(store, state.keys)
+    baseline = np.zeros((len(state.keys), 0))
+    window = store.fy_window(state.current_fy - 1, state.start_month)
+    if window.stop > window.start:
+        baseline = np.where(rows[:, None] >= 0, np.asarray(store.counts[:, window])[np.maximum(rows, 0)], 0)
+    if baseline.shape[1] == 0:
+        return False
+    return not np.allclose(baseline.mean(axis=1), state.limits["mean"])
+
+
+def incremental_spc(
+    path: str,
+    store: DailySeriesStore,
+    start_month: int = UK_FY_START_MONTH,
+    logger=None,
+) -> tuple[SPCState, pd.DataFrame]:
+    """
+    The current FY flagged so far, from the state at `path` plus only the days after its last processed date.
+    `store` holds the full history (as in the pipeline). The flagged current FY is kept next to the state; if it
+    is missing, the FY start month changed, or the store shows a late correction to days already processed,
+    the state is rebuilt from the store. Returns (state, flagged current-FY days in long format).
+    """
+    state = load_spc_state(path)
+    flagged_path = os.path.join(path, FLAGGED_FILENAME)
+    previous = None
+    reason = None
+    if state is None:
+        reason = "no saved state"
+    elif state.start_month != start_month:
+        reason = f"FY start month changed from {state.start_month} to {start_month}"
+    elif not os.path.exists(flagged_path):
+        reason = "no saved flagged days"
+    else:
+        previous = pd.read_parquet(flagged_path)
+        last = previous["CollectionDate"].max()
+        if pd.isna(last) or np.datetime64(last, "D") != state.last_processed:
+            reason = "saved flagged days out of step with the state"
+        elif _corrected(state, previous, store):
+            reason = "late corrections to days already processed"
+
+    if reason is None:
+        n_before = len(previous)
+        new = update_spc_state(state, store)
+        # Rows from a completed FY drop out once the state rolls over into the next one
+        previous = previous[previous["FinancialYear"] == state.current_fy]
+        flagged = pd.concat([previous, new[new["FinancialYear"] == state.current_fy]], ignore_index=True)
+        if logger is not None:
+            logger.info(f"Incremental SPC: {len(new)} new row(s) flagged, {n_before} reused from {path}.")
+    else:
+        state, flagged = build_spc_state(store, start_month=start_month)
+        if logger is not None:
+            logger.info(f"Incremental SPC: state rebuilt from the full history ({reason}).")
+
+    # The flagged days go first: if the run stops before the state is saved, the two no longer line up and the next
+    # run rebuilds rather than flagging days twice
+    os.makedirs(path, exist_ok=True)
+    tmp = flagged_path + ".tmp"
+    flagged.to_parquet(tmp, index=False)
+    os.replace(tmp, flagged_path)
+    save_spc_state(state, path)
+    return state, flagged
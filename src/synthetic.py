@@ -0,0 +1,237 @@
+"""
+Dr Nneoma O
+Synthetic data - realistic infection event tables at any scale, for demos and load testing.
+1. Daily counts per Department x Location series are drawn as one Poisson matrix (series x day)
+2. The rate can follow a weekly pattern, a long-term trend, per-series differences and injected spikes
+3. Counts are expanded to one row per event with np.repeat - no Python loop over events or days
+4. Duplicate rows and missing dates can be injected at set rates to exercise validation
+5. Large tables are produced in chunks of days, or streamed straight to Parquet, so memory depends on the chunk size
+   (chunk_days x series x rate), not the table size: one chunk being generated plus at most two waiting to be written
+The same seed (and chunk_days) always gives the same table.
+
+    python -m src.synthetic data/raw/load_test.parquet --departments 50 --locations 200 --rate 13.7   # ~100M events
+"""
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from .outputs import OutputWriter
+
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    """
+    base_rate: mean events per series per day (before pattern, trend and spikes).
+    weekday_profile: 7 multipliers, Monday first (None = flat week).
+    trend_per_year: compound growth of the rate per year, e.g. 0.1 = +10% a year.
+    series_rate_spread: sigma of a log-normal multiplier per series (0 = every series has the same rate).
+    spike_prob: chance that a series-day spikes; spike_dates spike every series. Spiked days have rate x spike_multiplier.
+    duplicate_rate / null_date_rate: fraction of rows repeated / given a missing CollectionDate.
+    """
+    start: str = "2022-04-01"
+    end: str = "2024-03-31"
+    n_departments: int = 1
+    n_locations: int = 1
+    base_rate: float = 1.0
+    weekday_profile: tuple | None = None
+    trend_per_year: float = 0.0
+    series_rate_spread: float = 0.0
+    spike_prob: float = 0.0
+    spike_dates: tuple = ()
+    spike_multiplier: float = 5.0
+    duplicate_rate: float = 0.0
+    null_date_rate: float = 0.0
+    seed: int = 0
+
+    @property
+    def n_series(self) -> int:
+        return self.n_departments * self.n_locations
+
+
+def _days(spec: SyntheticSpec) -> np.ndarray:
+    days = pd.date_range(spec.start, spec.end, freq="D").to_numpy()
+    if len(days) == 0:
+        raise ValueError("Synthetic date range is empty (start is after end).")
+    return days
+
+
+def daily_rate_matrix(spec: SyntheticSpec) -> np.ndarray:
+    """
+    Expected events per series per day (series x day), with the weekly pattern, trend, per-series spread and spikes applied.
+    """
+    days = _days(spec)
+    rng = np.random.default_rng([spec.seed, 0])
+
+    day_factor = np.ones(len(days))
+    if spec.weekday_profile is not None:
+        profile = np.asarray(spec.weekday_profile, dtype=float)
+        if profile.shape != (7,):
+            raise ValueError("weekday_profile needs 7 values (Monday first).")
+        weekday = (days.astype("datetime64[D]").astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        day_factor *= profile[weekday]
+    if spec.trend_per_year:
+        years = np.arange(len(days)) / 365.25
+        day_factor *= (1 + spec.trend_per_year) ** years
+
+    series_factor = np.ones(spec.n_series)
+    if spec.series_rate_spread > 0:
+        series_factor = rng.lognormal(0.0, spec.series_rate_spread, spec.n_series)
+
+    rate = spec.base_rate * series_factor[:, None] * day_factor[None, :]
+
+    if spec.spike_prob > 0:
+        spikes = rng.random(rate.shape) < spec.spike_prob
+        rate[spikes] *= spec.spike_multiplier
+    if spec.spike_dates:
+        hit = np.isin(days, pd.to_datetime(list(spec.spike_dates)).to_numpy())
+        rate[:, hit] *= spec.spike_multiplier
+    return rate
+
+
+def daily_count_matrix(spec: SyntheticSpec) -> np.ndarray:
+    """
+    Poisson daily event counts (series x day, int32) - the "true" counts before duplicates and missing dates.
+    """
+    rng = np.random.default_rng([spec.seed, 1])
+    return rng.poisson(daily_rate_matrix(spec)).astype(np.int32)
+
+
+def _series_labels(spec: SyntheticSpec) -> tuple[pd.Index, pd.Index]:
+    departments = pd.Index([f"Dept{i + 1:03d}" for i in range(spec.n_departments)])
+    locations = pd.Index([f"Ward{i + 1:04d}" for i in range(spec.n_locations)])
+    return departments, locations
+
+
+def _events_for_block(
+    spec: SyntheticSpec,
+    counts: np.ndarray,
+    days: np.ndarray,
+    first_event_id: int,
+    block_index: int,
+    departments: pd.Index,
+    locations: pd.Index,
+) -> pd.DataFrame:
+    # counts is series x day for this block; rows come out ordered by day, then series
+    per_cell = counts.T.ravel()
+    n_series, n_days = counts.shape
+    cell_series = np.tile(np.arange(n_series, dtype=np.int32), n_days)
+    cell_day = np.repeat(np.arange(n_days, dtype=np.int32), n_series)
+
+    series = np.repeat(cell_series, per_cell)
+    day = np.repeat(cell_day, per_cell)
+    event_id = np.arange(first_event_id, first_event_id + len(series), dtype=np.int64)
+    dates = days[day]
+
+    rng = np.random.default_rng([spec.seed, 2, block_index])
+    if spec.duplicate_rate > 0 and len(series):
+        dup = np.flatnonzero(rng.random(len(series)) < spec.duplicate_rate)
+        take = np.sort(np.r_[np.arange(len(series)), dup])  # each copy sits next to its original
+        series, event_id, dates = series[take], event_id[take], dates[take]
+    if spec.null_date_rate > 0 and len(series):
+        dates = dates.copy()
+        dates[rng.random(len(dates)) < spec.null_date_rate] = np.datetime64("NaT")
+
+    return pd.DataFrame({
+        "EventID": event_id,
+        "CollectionDate": dates,
+        "Department": pd.Categorical.from_codes(series // spec.n_locations, departments),
+        "Location": pd.Categorical.from_codes(series % spec.n_locations, locations),
+    })
+
+
+def iter_synthetic_events(spec: SyntheticSpec, chunk_days: int = 31) -> Iterator[pd.DataFrame]:
+    """
+    The synthetic event table in chunks of `chunk_days` days (EventIDs continue across chunks).
+    Only the series x day count matrix and one chunk of events are held in memory.
+    """
+    if chunk_days < 1:
+        raise ValueError("chunk_days must be at least 1.")
+    days = _days(spec)
+    counts = daily_count_matrix(spec)
+    departments, locations = _series_labels(spec)
+
+    next_id = 1
+    for block_index, start in enumerate(range(0, len(days), chunk_days)):
+        block = counts[:, start:start + chunk_days]
+        yield _events_for_block(spec, block, days[start:start + chunk_days], next_id, block_index, departments, locations)
+        next_id += int(block.sum())
+
+
+def synthetic_events(spec: SyntheticSpec | None = None, chunk_days: int = 31, **overrides) -> pd.DataFrame:
+    """
+    The whole synthetic event table in memory; keyword arguments override fields of `spec`,
+    e.g. synthetic_events(n_departments=20, n_locations=50, base_rate=2, seed=7).
+    """
+    spec = _resolve(spec, overrides)
+    return pd.concat(list(iter_synthetic_events(spec, chunk_days)), ignore_index=True)
+
+
+def write_synthetic_parquet(
+    path: str,
+    spec: SyntheticSpec | None = None,
+    chunk_days: int = 31,
+    compression: str | None = None,
+    **overrides,
+) -> int:
+    """
+    Streams the synthetic table to a single Parquet file chunk by chunk (writes overlap with generation)
+    and returns the number of rows written. Generation waits when two chunks are already queued for writing,
+    so peak memory stays flat as the table grows.
+    """
+    spec = _resolve(spec, overrides)
+    directory, filename = os.path.split(path)
+    name, ext = os.path.splitext(filename)
+    if ext.lower() != ".parquet":
+        raise ValueError("write_synthetic_parquet needs a .parquet path.")
+
+    with OutputWriter(fmt="parquet", compression=compression, background=True) as writer:
+        stream = writer.open_stream(directory or ".", name)
+        for chunk in iter_synthetic_events(spec, chunk_days):
+            stream.append(chunk)
+        stream.close()
+    return stream.rows
+
+
+def _resolve(spec: SyntheticSpec | None, overrides: dict) -> SyntheticSpec:
+    spec = spec or SyntheticSpec()
+    return replace(spec, **overrides) if overrides else spec
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a synthetic infection event table to Parquet.")
+    parser.add_argument("out", help="output .parquet path")
+    parser.add_argument("--start", default=SyntheticSpec.start)
+    parser.add_argument("--end", default=SyntheticSpec.end)
+    parser.add_argument("--departments", type=int, default=1)
+    parser.add_argument("--locations", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1.0, help="mean events per series per day")
+    parser.add_argument("--trend", type=float, default=0.0, help="growth per year, e.g. 0.1")
+    parser.add_argument("--spike-prob", type=float, default=0.0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--null-date-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = SyntheticSpec(
+        start=args.start,
+        end=args.end,
+        n_departments=args.departments,
+        n_locations=args.locations,
+        base_rate=args.rate,
+        trend_per_year=args.trend,
+        spike_prob=args.spike_prob,
+        duplicate_rate=args.duplicate_rate,
+        null_date_rate=args.null_date_rate,
+        seed=args.seed,
+    )
+    rows = write_synthetic_parquet(args.out, spec)
+    print(f"Wrote {rows} events to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,35 +7,67 @@ Run this once for every raw df i.e. df_sql_raw -- use this query --> df_sql_std,
 """
 import pandas as pd
 
-def standardise_infection_events(df: pd.DataFrame) -> pd.DataFrame:
+STANDARD_COLUMNS = ["EventID", "CollectionDate", "Department", "Location", "MetricValue"]
+DATE_ALTERNATIVES = ["collection_date", "Collection_Date", "Date", "CollectionInstant"] # Update based on the different names
+CATEGORY_COLUMNS = ["Department", "Location"]
+
+
+def ensure_datetime(s: pd.Series) -> pd.Series:
+    """
+    Returns the column as datetime64, parsing only if it is not already typed
+    (e.g. compact standardised output), so later stages do not re-parse dates.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, errors="coerce")
+
+
+def standardise_infection_events(df: pd.DataFrame, compact: bool = False) -> pd.DataFrame:
     """
     Standardise column names and types to a predictable schema
     Expected minimum columns:
       - CollectionDate (date/datetime)
       - EventID (optional)
-    """
-    df = df.copy()
 
+    compact=True keeps memory low for large extracts: CollectionDate stays a day-normalised datetime64
+    column (instead of Python date objects), Department/Location become categoricals, and EventID /
+    MetricValue are downcast to the smallest numeric type that holds them.
+    """
     # Common normalisation: strip spaces and unify column names - only date mentioned but update for others if needed
-    df.columns = [c.strip() for c in df.columns]
+    renames = {c: c.strip() for c in df.columns if isinstance(c, str) and c != c.strip()}
+    names = [renames.get(c, c) for c in df.columns]
 
-    if "CollectionDate" not in df.columns:
+    if "CollectionDate" not in names:
         # Try common alternatives
-        for alt in ["collection_date", "Collection_Date", "Date", "CollectionInstant"]: # Update based on the different names
-            if alt in df.columns:
-                df.rename(columns={alt: "CollectionDate"}, inplace=True)
+        for alt in DATE_ALTERNATIVES:
+            if alt in names:
+                names[names.index(alt)] = "CollectionDate"
                 break
 
-    if "CollectionDate" not in df.columns:
+    if "CollectionDate" not in names:
         raise ValueError("No CollectionDate column found after standardisation.")
 
-    df["CollectionDate"] = pd.to_datetime(df["CollectionDate"], errors="coerce").dt.date
+    # Keep only relevant columns (extend as needed) - selecting before the copy means unused columns are never copied
+    keep = [c for c in STANDARD_COLUMNS if c in names]
+    source = [df.columns[names.index(c)] for c in keep]
+    # (the column selection already returns new data, so a shallow copy is enough to detach it from the input)
+    df = df[source].copy(deep=False)
+    df.columns = keep
+
+    if not compact:
+        df["CollectionDate"] = pd.to_datetime(df["CollectionDate"], errors="coerce").dt.date
+        return df
+
+    df["CollectionDate"] = ensure_datetime(df["CollectionDate"]).dt.normalize()
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
 
-    # Keep only relevant columns (extend as needed)
-    keep = [c for c in ["EventID", "CollectionDate", "Department", "Location", "MetricValue"] if c in df.columns]
-    if not keep:
-        keep = ["CollectionDate"]
+    if "EventID" in df.columns and pd.api.types.is_numeric_dtype(df["EventID"]) and df["EventID"].notna().all():
+        df["EventID"] = pd.to_numeric(df["EventID"], downcast="integer")
 
-    df = df[keep]
+    if "MetricValue" in df.columns:
+        df["MetricValue"] = pd.to_numeric(df["MetricValue"], errors="coerce", downcast="float")
 
     return df
@@ -5,68 +5,25 @@ Validation: This code checks the quality of the event data and returns a summary
 2. Are any dates missing?
 3. Are there dupliciate event IDs?
 4. What date range is covered?
+
+The checks are rules in validation_rules.py, evaluated together in one scan. Extra rules (future dates,
+daily volume anomalies, schema checks, ...) can be passed in without editing this function.
 """
 
 import pandas as pd
 
+from .validation_rules import Rule, ValidationEngine, default_rules
+
 # I define a function to perform basic data quality checks on infection event data and return the results as a dictionary
-def validate_infection_events(df: pd.DataFrame) -> dict:
+def validate_infection_events(df: pd.DataFrame, rules: list[Rule] | None = None) -> dict:
     """
     Returns validation results as a dictionary for reporting and logging
+
+    Default keys: row_count, null_collectiondate, duplicate_eventid (None if the column is missing),
+    and min_date / max_date when a CollectionDate column exists.
+    `rules` replaces the default rule list (see validation_rules.default_rules()).
     """
 
-    # I initialise an empty dictionary to store validation outputs
     # Using a dict makes it easy to log, report, or persist the results
-    results = {}
-
-    # I record the total number of rows in the dataset
-    # This is a fundamental check and useful for audit trails
-    results["row_count"] = int(len(df))
-
-    # I count how many records have a missing CollectionDate
-    # If the column does not exist, I return None rather than raising an error
-    results["null_collectiondate"] = (
-        int(df["CollectionDate"].isna().sum())
-        if "CollectionDate" in df.columns
-        else None
-    )
-
-    # --- Duplicate checks ---
-    # If an EventID column exists, I check for duplicated IDs
-    # This helps identify potential double-counting issues
-    if "EventID" in df.columns:
-        results["duplicate_eventid"] = int(
-            df["EventID"].duplicated().sum()
-        )
-    else:
-        results["duplicate_eventid"] = None
-
-    # --- Date range checks ---
-    # If a CollectionDate column exists, I calculate the minimum
-    # and maximum dates present in the data
-    if "CollectionDate" in df.columns:
-
-        # I coerce the column to datetime to ensure invalid values
-        # do not cause the calculation to fail
-        non_null = pd.to_datetime(
-            df["CollectionDate"],
-            errors="coerce"
-        )
-
-        # I record the earliest date in the dataset, if any valid dates exist
-        results["min_date"] = (
-            str(non_null.min().date())
-            if non_null.notna().any()
-            else None
-        )
-
-        # I record the latest date in the dataset, if any valid dates exist
-        results["max_date"] = (
-            str(non_null.max().date())
-            if non_null.notna().any()
-            else None
-        )
-
-    # Finally, I return the validation results dictionary
-    # so it can be logged or included in a data quality report
-    return results
+    engine = ValidationEngine(rules if rules is not None else default_rules())
+    return engine.run(df)
@@ -0,0 +1,427 @@
+"""
+Dr Nneoma O
+Validation rules: a small rule engine behind validate.py.
+1. Each check is a declarative rule object (null counts, duplicate keys, date bounds, future dates, daily volume, schema)
+2. All rules are evaluated together in one scan of each batch; shared work (e.g. parsing dates) is done once per batch
+3. Every rule keeps a small state that can be merged, so batches and parallel workers can be validated separately and combined
+4. Duplicate keys are tracked as 64-bit hashes in NumPy arrays (exact) or a Bloom filter (approximate, fixed memory),
+   never as one Python object per EventID
+"""
+import math
+from abc import ABC, abstractmethod
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .transform import ensure_datetime
+
+
+_MISSING_KEY = pd.util.hash_array(np.array([np.nan]))[0]
+
+
+class BatchContext:
+    """
+    One batch of data plus per-batch derived columns (parsed dates) shared by every rule.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._dates = {}
+
+    def has(self, column: str) -> bool:
+        return column in self.df.columns
+
+    def dates(self, column: str) -> pd.Series:
+        if column not in self._dates:
+            self._dates[column] = ensure_datetime(self.df[column])
+        return self._dates[column]
+
+
+def hash_keys(values: pd.Series) -> np.ndarray:
+    """
+    64-bit keys: integer IDs are used as they are (including whole-number floats, which is how
+    an integer column with gaps arrives), anything else is hashed. Missing values all share one key.
+    """
+    if pd.api.types.is_integer_dtype(values):
+        if values.hasnans:
+            # Nullable integers (Int64) go straight to int64, never through float64, so large IDs stay exact
+            keys = values.to_numpy(dtype=np.int64, na_value=0).astype(np.uint64)
+            keys[values.isna().to_numpy()] = _MISSING_KEY
+            return keys
+        return values.to_numpy().astype(np.uint64)
+    if pd.api.types.is_float_dtype(values):
+        v = values.to_numpy()
+        missing = np.isnan(v)
+        if np.array_equal(v[~missing], np.floor(v[~missing])):
+            keys = np.where(missing, 0, v).astype(np.int64).astype(np.uint64)
+            keys[missing] = _MISSING_KEY
+            return keys
+    return pd.util.hash_array(values.to_numpy())
+
+
+class Rule(ABC):
+    """
+    Base class. A rule's state must be picklable and mergeable:
+    start() -> state, update(state, ctx) -> state, merge(a, b) -> state, finish(state) -> dict of results.
+    A rule missing update, merge or finish fails when it is created, not partway through a run.
+    """
+
+    def start(self):
+        return None
+
+    @abstractmethod
+    def update(self, state, ctx: BatchContext):
+        ...
+
+    @abstractmethod
+    def merge(self, a, b):
+        ...
+
+    @abstractmethod
+    def finish(self, state) -> dict:
+        ...
+
+
+class RowCount(Rule):
+    def start(self):
+        return 0
+
+    def update(self, state, ctx):
+        return state + len(ctx.df)
+
+    def merge(self, a, b):
+        return a + b
+
+    def finish(self, state):
+        return {"row_count": int(state)}
+
+
+class NullCount(Rule):
+    """
+    Missing values in `column` (None if the column is absent). With max_rate, also reports whether the null rate is acceptable.
+    """
+
+    def __init__(self, column: str, max_rate: float | None = None):
+        self.column = column
+        self.max_rate = max_rate
+        self.key = f"null_{column.lower()}"
+
+    def start(self):
+        return None  # (nulls, rows) once the column has been seen
+
+    def update(self, state, ctx):
+        if not ctx.has(self.column):
+            return state
+        nulls, rows = state or (0, 0)
+        return nulls + int(ctx.df[self.column].isna().sum()), rows + len(ctx.df)
+
+    def merge(self, a, b):
+        if a is None or b is None:
+            return a if b is None else b
+        return a[0] + b[0], a[1] + b[1]
+
+    def finish(self, state):
+        out = {self.key: None if state is None else int(state[0])}
+        if self.max_rate is not None and state is not None:
+            rate = state[0] / state[1] if state[1] else 0.0
+            out[f"{self.key}_rate_ok"] = rate <= self.max_rate
+        return out
+
+
+class DuplicateKeys(Rule):
+    """
+    Counts rows whose key repeats an earlier row (same as Series.duplicated().sum()).
+
+    method="exact": distinct key hashes are kept as sorted uint64 arrays, merged in
+      size-tiered runs (8 bytes per distinct key, amortised O(n log n)).
+    method="bloom": a fixed-size Bloom filter sized for `expected_keys` at `error_rate`;
+      duplicates may be slightly over-counted by false positives, and counts merged across
+      workers use the filter's cardinality estimate.
+    """
+
+    def __init__(self, column: str = "EventID", method: str = "exact", expected_keys: int = 10_000_000, error_rate: float = 0.001):
+        if method not in ("exact", "bloom"):
+            raise ValueError("method must be 'exact' or 'bloom'.")
+        self.column = column
+        self.method = method
+        self.key = f"duplicate_{column.lower()}"
+        # Standard Bloom filter sizing: m = -n ln(p) / ln(2)^2 bits, k = m/n ln(2) hash functions
+        self.n_bits = max(64, int(-expected_keys * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / expected_keys * math.log(2)))
+
+    def start(self):
+        return None
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        # Double hashing: position_i = h1 + i * h2, from two halves of a second 64-bit mix of the key
+        h = pd.util.hash_array(keys)
+        h1 = h & np.uint64(0xFFFFFFFF)
+        h2 = (h >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.n_bits)
+
+    def update(self, state, ctx):
+        if not ctx.has(self.column):
+            return state
+
+        keys = hash_keys(ctx.df[self.column])
+        distinct = np.unique(keys)
+        within = len(keys) - len(distinct)
+
+        if self.method == "exact":
+            runs, count = state or ([], 0)
+            runs = _add_run(list(runs), distinct)
+            return runs, count + len(keys)
+
+        bits, count, dups = state or (np.zeros((self.n_bits + 7) // 8, dtype=np.uint8), 0, 0)
+        pos = self._positions(distinct)
+        seen = (bits[pos // 8] >> (pos % 8).astype(np.uint8)) & 1
+        dups += within + int(seen.all(axis=1).sum())
+        flat = pos.ravel()
+        np.bitwise_or.at(bits, flat // 8, (np.uint8(1) << (flat % 8).astype(np.uint8)))
+        return bits, count + len(keys), dups
+
+    def _estimate_distinct(self, bits: np.ndarray) -> float:
+        # Swamidass & Baldi estimate of the number of distinct items in a Bloom filter
+        set_bits = int(np.unpackbits(bits).sum())
+        if set_bits >= self.n_bits:
+            return float("inf")
+        return -self.n_bits / self.n_hashes * math.log(1 - set_bits / self.n_bits)
+
+    def merge(self, a, b):
+        if a is None or b is None:
+            return a if b is None else b
+        if self.method == "exact":
+            runs = list(a[0])
+            for run in b[0]:
+                runs = _add_run(runs, run)
+            return runs, a[1] + b[1]
+
+        bits = a[0] | b[0]
+        distinct_a, distinct_b = a[1] - a[2], b[1] - b[2]
+        overlap = max(0, round(distinct_a + distinct_b - self._estimate_distinct(bits)))
+        return bits, a[1] + b[1], a[2] + b[2] + overlap
+
+    def finish(self, state):
+        if state is None:
+            return {self.key: None}
+        if self.method == "exact":
+            runs, count = state
+            distinct = len(_merge_runs(runs)) if runs else 0
+            return {self.key: int(count - distinct)}
+        return {self.key: int(state[2])}
+
+
+def _merge_runs(runs: list) -> np.ndarray:
+    return np.unique(np.concatenate(runs)) if len(runs) > 1 else runs[0]
+
+
+def _add_run(runs: list, run: np.ndarray) -> list:
+    # Size-tiered merging: a new run is merged with the previous one while it is at least as large,
+    # so there are only O(log n) runs and each key is re-sorted O(log n) times
+    runs.append(run)
+    while len(runs) > 1 and len(runs[-1]) >= len(runs[-2]):
+        last = runs.pop()
+        runs[-1] = np.union1d(runs[-1], last)
+    return runs
+
+
+class DateRange(Rule):
+    """
+    Earliest and latest valid date; with bounds, also counts dates outside [min_allowed, max_allowed].
+    """
+
+    def __init__(self, column: str = "CollectionDate", min_allowed=None, max_allowed=None):
+        self.column = column
+        self.min_allowed = pd.Timestamp(min_allowed) if min_allowed is not None else None
+        self.max_allowed = pd.Timestamp(max_allowed) if max_allowed is not None else None
+        self.bounded = min_allowed is not None or max_allowed is not None
+
+    def start(self):
+        return None  # (min, max, out_of_bounds) once the column has been seen
+
+    def update(self, state, ctx):
+        if not ctx.has(self.column):
+            return state
+        d = ctx.dates(self.column)
+        lo, hi = d.min(), d.max()
+        out = 0
+        if self.min_allowed is not None:
+            out += int((d < self.min_allowed).sum())
+        if self.max_allowed is not None:
+            out += int((d > self.max_allowed).sum())
+        return self.merge(state, (None if pd.isna(lo) else lo, None if pd.isna(hi) else hi, out))
+
+    def merge(self, a, b):
+        if a is None or b is None:
+            return a if b is None else b
+        lo = min((x for x in (a[0], b[0]) if x is not None), default=None)
+        hi = max((x for x in (a[1], b[1]) if x is not None), default=None)
+        return lo, hi, a[2] + b[2]
+
+    def finish(self, state):
+        if state is None:
+            return {}
+        out = {
+            "min_date": str(state[0].date()) if state[0] is not None else None,
+            "max_date": str(state[1].date()) if state[1] is not None else None,
+        }
+        if self.bounded:
+            out[f"out_of_bounds_{self.column.lower()}"] = int(state[2])
+        return out
+
+
+class FutureDates(Rule):
+    """
+    Rows dated after `as_of` (default: today), which usually means a data entry or timezone problem.
+    """
+
+    def __init__(self, column: str = "CollectionDate", as_of=None):
+        self.column = column
+        self.as_of = pd.Timestamp(as_of if as_of is not None else date.today())
+
+    def start(self):
+        return None
+
+    def update(self, state, ctx):
+        if not ctx.has(self.column):
+            return state
+        return (state or 0) + int((ctx.dates(self.column) > self.as_of).sum())
+
+    def merge(self, a, b):
+        if a is None or b is None:
+            return a if b is None else b
+        return a + b
+
+    def finish(self, state):
+        return {f"future_{self.column.lower()}": state}
+
+
+class DailyVolume(Rule):
+    """
+    Flags days whose row count is far from typical: |count - median| > threshold * MAD-based SD,
+    including days with no rows between the first and last date. The state is one count per day, so it stays small however many rows are scanned.
+    """
+
+    def __init__(self, column: str = "CollectionDate", threshold: float = 4.0):
+        self.column = column
+        self.threshold = threshold
+
+    def start(self):
+        return None
+
+    def update(self, state, ctx):
+        if not ctx.has(self.column):
+            return state
+        counts = ctx.dates(self.column).dropna().dt.normalize().value_counts()
+        return self.merge(state, counts)
+
+    def merge(self, a, b):
+        if a is None or b is None:
+            return a if b is None else b
+        return a.add(b, fill_value=0)
+
+    def finish(self, state):
+        if state is None or state.empty:
+            return {"volume_anomaly_days": None}
+        # Days with no rows at all are included as zeros, so a missing feed day is flagged too
+        state = state.reindex(pd.date_range(state.index.min(), state.index.max(), freq="D"), fill_value=0)
+        x = state.to_numpy(dtype=float)
+        median = np.median(x)
+        sd = 1.4826 * np.median(np.abs(x - median))  # MAD scaled to a normal SD
+        if sd == 0:
+            flagged = state[x != median]
+        else:
+            flagged = state[np.abs(x - median) > self.threshold * sd]
+        return {"volume_anomaly_days": [str(d.date()) for d in sorted(flagged.index)]}
+
+
+class Schema(Rule):
+    """
+    Checks columns exist and have the expected kind of dtype:
+    "datetime", "integer", "float", "numeric", "string", "category" or "bool".
+    """
+
+    _CHECKS = {
+        "datetime": pd.api.types.is_datetime64_any_dtype,
+        "integer": pd.api.types.is_integer_dtype,
+        "float": pd.api.types.is_float_dtype,
+        "numeric": pd.api.types.is_numeric_dtype,
+        "string": lambda dt: pd.api.types.is_object_dtype(dt) or pd.api.types.is_string_dtype(dt),
+        "category": lambda dt: isinstance(dt, pd.CategoricalDtype),
+        "bool": pd.api.types.is_bool_dtype,
+    }
+
+    def __init__(self, expected: dict[str, str]):
+        unknown = set(expected.values()) - set(self._CHECKS)
+        if unknown:
+            raise ValueError(f"Unknown dtype kinds in schema: {sorted(unknown)}")
+        self.expected = expected
+
+    def start(self):
+        return frozenset()
+
+    def update(self, state, ctx):
+        errors = set(state)
+        for col, kind in self.expected.items():
+            if col not in ctx.df.columns:
+                errors.add(f"{col}: missing")
+            elif not self._CHECKS[kind](ctx.df[col].dtype):
+                errors.add(f"{col}: expected {kind}, got {ctx.df[col].dtype}")
+        return frozenset(errors)
+
+    def merge(self, a, b):
+        return a | b
+
+    def finish(self, state):
+        return {"schema_errors": sorted(state)}
+
+
+class ValidationEngine:
+    """
+    Runs a list of rules over a DataFrame or a stream of batches in a single scan per batch.
+    States from start()/update() can be merged across batches or workers with merge().
+    """
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = rules
+
+    def start(self) -> list:
+        return [r.start() for r in self.rules]
+
+    def update(self, states: list, df: pd.DataFrame) -> list:
+        ctx = BatchContext(df)
+        return [r.update(s, ctx) for r, s in zip(self.rules, states)]
+
+    def merge(self, a: list, b: list) -> list:
+        return [r.merge(x, y) for r, x, y in zip(self.rules, a, b)]
+
+    def finish(self, states: list) -> dict:
+        results = {}
+        for r, s in zip(self.rules, states):
+            results.update(r.finish(s))
+        return results
+
+    def run(self, data) -> dict:
+        """
+        Validates a DataFrame, or an iterable of DataFrame batches.
+        """
+        batches = [data] if isinstance(data, pd.DataFrame) else data
+        states = self.start()
+        for batch in batches:
+            states = self.update(states, batch)
+        return self.finish(states)
+
+
+def default_rules(duplicate_method: str = "exact", expected_keys: int = 10_000_000) -> list[Rule]:
+    """
+    The checks reported by validate_infection_events.
+    `duplicate_method` and `expected_keys` configure the EventID duplicate check (see DuplicateKeys).
+    """
+    return [
+        RowCount(),
+        NullCount("CollectionDate"),
+        DuplicateKeys("EventID", method=duplicate_method, expected_keys=expected_keys),
+        DateRange("CollectionDate"),
+    ]